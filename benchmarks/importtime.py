@@ -0,0 +1,91 @@
+"""
+Benchmark de inicialização: quanto custa importar o ponto de entrada até o primeiro prompt.
+
+Executa `python -X importtime` em processos novos, mede o tempo total (interpretador +
+imports) e o tempo acumulado do módulo, e falha se o limite for ultrapassado ou se
+alguma dependência pesada (pandas, chardet, openpyxl...) for carregada antes de o
+usuário escolher a origem "Arquivo".
+
+Uso:
+    python benchmarks/importtime.py [--modulo scripts.features.imprimir_etiqueta_v6]
+                                    [--repeticoes 5] [--limite-ms 150]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+raiz_projeto = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MODULO_PADRAO = "scripts.features.imprimir_etiqueta_v6"
+LIMITE_MS = 150.0
+REPETICOES = 5
+
+# Módulos que não podem ser importados na inicialização
+PROIBIDOS = ("pandas", "numpy", "chardet", "openpyxl", "xlrd", "pyarrow")
+
+
+def medir(modulo):
+    """
+    Importa o módulo em um processo novo.
+
+    :return: Tupla (tempo total em ms, dicionário {módulo: (próprio µs, acumulado µs)}).
+    """
+    ambiente = dict(os.environ, PYTHONPATH=raiz_projeto)
+    inicio = time.perf_counter()
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=raiz_projeto, env=ambiente, capture_output=True, text=True,
+    )
+    total_ms = (time.perf_counter() - inicio) * 1000
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {modulo}:\n{resultado.stderr}")
+
+    modulos = {}
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        modulos[nome.strip()] = (int(proprio), int(acumulado))
+    return total_ms, modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de inicialização do ponto de entrada.")
+    parser.add_argument("--modulo", default=MODULO_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--limite-ms", type=float, default=LIMITE_MS,
+                        help="Tempo máximo (mediana) até o primeiro prompt, incluindo o interpretador.")
+    args = parser.parse_args()
+
+    totais, acumulados = [], []
+    modulos = {}
+    for _ in range(args.repeticoes):
+        total_ms, modulos = medir(args.modulo)
+        totais.append(total_ms)
+        acumulados.append(modulos.get(args.modulo, (0, 0))[1] / 1000)
+
+    mediana_total = statistics.median(totais)
+    print(f"Módulo: {args.modulo}")
+    print(f"Tempo até o primeiro prompt (mediana de {args.repeticoes}): {mediana_total:.1f} ms "
+          f"(limite {args.limite_ms:.0f} ms)")
+    print(f"Imports do módulo (mediana): {statistics.median(acumulados):.1f} ms, {len(modulos)} módulos carregados")
+    print("Maiores custos próprios:")
+    for nome, (proprio, _) in sorted(modulos.items(), key=lambda item: item[1][0], reverse=True)[:10]:
+        print(f"  {proprio / 1000:7.2f} ms  {nome}")
+
+    carregados = sorted({nome.split(".")[0] for nome in modulos} & set(PROIBIDOS))
+    falhou = False
+    if carregados:
+        print(f"[ERRO] Dependências pesadas carregadas na inicialização: {', '.join(carregados)}")
+        falhou = True
+    if mediana_total > args.limite_ms:
+        print(f"[ERRO] Inicialização acima do limite: {mediana_total:.1f} ms > {args.limite_ms:.0f} ms")
+        falhou = True
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
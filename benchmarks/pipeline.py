@@ -0,0 +1,283 @@
+"""
+Benchmarks do fluxo gerar -> carregar -> imprimir.
+
+Mede:
+    geracao     - gerar_zpl em cada modelo do etiquetas_config.json, de 1 mil a 1 milhão de etiquetas
+    carregamento - loader.carregar_arquivo em CSV e XLSX sintéticos de tamanho crescente
+    envio       - envio de ponta a ponta para o emulador de impressora (mock_impressora)
+                  e para o emulador de CUPS por IPP (mock_ipp)
+
+Os resultados podem ser gravados como linha de base (JSON) e comparados depois;
+a comparação aponta como regressão qualquer queda de vazão acima da tolerância.
+
+Uso:
+    python benchmarks/pipeline.py                                   # tamanhos reduzidos
+    python benchmarks/pipeline.py --completo --salvar benchmarks/linha_base.json
+    python benchmarks/pipeline.py --comparar benchmarks/linha_base.json --tolerancia 0.10
+    python benchmarks/pipeline.py --apenas geracao envio
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+raiz_projeto = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if raiz_projeto not in sys.path:
+    sys.path.insert(0, raiz_projeto)
+
+from scripts.core.config import obter_configuracao  # noqa: E402
+from scripts.core.zpl_generator import gerar_zpl, iter_zpl  # noqa: E402
+
+TAMANHOS_GERACAO = (1_000, 10_000, 100_000)
+TAMANHOS_GERACAO_COMPLETO = (1_000, 10_000, 100_000, 1_000_000)
+LINHAS_CSV = (10_000, 100_000)
+LINHAS_CSV_COMPLETO = (10_000, 100_000, 1_000_000)
+LINHAS_XLSX = (1_000, 10_000)
+LINHAS_XLSX_COMPLETO = (1_000, 10_000, 100_000)
+ETIQUETAS_ENVIO = (10_000, 100_000)
+REPETICOES = 3
+# Tempo máximo para o emulador receber e imprimir o que foi enviado
+TIMEOUT_RECEPCAO = 60.0
+TOLERANCIA = 0.10
+
+SUITES = ("geracao", "carregamento", "envio")
+
+
+def _etiquetas(quantidade):
+    return [f"SKU-{numero:07d} | Produto {numero % 997} | Lote {numero % 53}" for numero in range(quantidade)]
+
+
+def _melhor_tempo(funcao, repeticoes):
+    """Executa a função algumas vezes e retorna (menor tempo em segundos, último resultado)."""
+    melhor, resultado = None, None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultado
+
+
+def _vazao(segundos, etiquetas, total_bytes=None):
+    medida = {"segundos": round(segundos, 6), "etiquetas": etiquetas,
+              "etiquetas_por_s": round(etiquetas / segundos, 1) if segundos else 0.0}
+    if total_bytes is not None:
+        medida["bytes"] = total_bytes
+        medida["mb_por_s"] = round(total_bytes / segundos / 1024 / 1024, 2) if segundos else 0.0
+    return medida
+
+
+def medir_geracao(tamanhos, repeticoes):
+    modelos = obter_configuracao().modelos()
+    resultados = {}
+    for tamanho in tamanhos:
+        etiquetas = _etiquetas(tamanho)
+        # Um milhão de etiquetas já leva segundos; uma repetição basta
+        vezes = 1 if tamanho >= 1_000_000 else repeticoes
+        for nome, modelo in modelos.items():
+            segundos, zpl = _melhor_tempo(lambda: gerar_zpl(etiquetas, modelo, 1), vezes)
+            medida = _vazao(segundos, tamanho, len(zpl.encode("utf-8")))
+            resultados[f"geracao/{nome}/{tamanho}"] = medida
+            print(f"  geração {nome:<18} {tamanho:>9} etiquetas: {medida['etiquetas_por_s']:>12,.0f} etiquetas/s "
+                  f"{medida['mb_por_s']:>8.2f} MB/s")
+    return resultados
+
+
+def _gravar_csv(caminho, linhas):
+    with open(caminho, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["SKU", "Produto", "Lote", "Preco", "Descricao"])
+        for numero in range(linhas):
+            escritor.writerow([f"SKU-{numero:07d}", f"Produto {numero % 997}", numero % 53,
+                               f"{numero % 1000}.99", f"Descrição do item {numero}"])
+
+
+def _gravar_xlsx(caminho, linhas):
+    from openpyxl import Workbook
+
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet()
+    planilha.append(["SKU", "Produto", "Lote", "Preco", "Descricao"])
+    for numero in range(linhas):
+        planilha.append([f"SKU-{numero:07d}", f"Produto {numero % 997}", numero % 53,
+                         f"{numero % 1000}.99", f"Descrição do item {numero}"])
+    livro.save(caminho)
+
+
+def medir_carregamento(linhas_csv, linhas_xlsx, repeticoes):
+    try:
+        from scripts.core import cache_planilhas, loader
+    except ImportError as e:
+        print(f"  [LOG] Carregamento ignorado: {e}")
+        return {}
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        # Cache de planilhas isolado, para medir a leitura fria e a leitura pelo cache
+        cache_planilhas.diretorio_cache = os.path.join(diretorio, "cache")
+        arquivos = [("csv", linhas, _gravar_csv) for linhas in linhas_csv]
+        arquivos += [("xlsx", linhas, _gravar_xlsx) for linhas in linhas_xlsx]
+        for extensao, linhas, gravar in arquivos:
+            caminho = os.path.join(diretorio, f"dados_{linhas}.{extensao}")
+            try:
+                gravar(caminho, linhas)
+            except ImportError as e:
+                print(f"  [LOG] {extensao.upper()} ignorado: {e}")
+                continue
+            tamanho = os.path.getsize(caminho)
+            vezes = 1 if linhas >= 1_000_000 else repeticoes
+            casos = [("frio", 1), ("repetido", vezes)] if extensao == "xlsx" else [("frio", vezes)]
+            for caso, repeticoes_caso in casos:
+                segundos, _ = _melhor_tempo(lambda: loader.carregar_arquivo(caminho, colunas=[0, 1]),
+                                            repeticoes_caso)
+                medida = _vazao(segundos, linhas, tamanho)
+                resultados[f"carregamento/{extensao}/{caso}/{linhas}"] = medida
+                print(f"  carregamento {extensao} {caso:<8} {linhas:>9} linhas: "
+                      f"{medida['etiquetas_por_s']:>12,.0f} linhas/s {medida['mb_por_s']:>8.2f} MB/s")
+    return resultados
+
+
+def medir_envio(quantidades, repeticoes):
+    from scripts.utils.mock_impressora import ImpressoraMock
+    from scripts.utils.transporte import PoolConexoes, enviar
+
+    modelo = next(iter(obter_configuracao().modelos().values()))
+
+    resultados = {}
+    for quantidade in quantidades:
+        etiquetas = _etiquetas(quantidade)
+        melhor = None
+        for _ in range(repeticoes):
+            with ImpressoraMock() as impressora:
+                host, porta = impressora.host, impressora.porta
+                pool = PoolConexoes({"mock": {"backend": "raw", "host": host, "porta": porta}})
+                try:
+                    inicio = time.perf_counter()
+                    total_bytes = enviar("mock", iter_zpl(etiquetas, modelo), pool=pool)
+                    # O envio termina quando os bytes saem do socket; espera o emulador receber e imprimir tudo
+                    limite = time.monotonic() + TIMEOUT_RECEPCAO
+                    while impressora.estatisticas.bytes_recebidos < total_bytes:
+                        if time.monotonic() > limite:
+                            raise RuntimeError(
+                                f"O emulador recebeu {impressora.estatisticas.bytes_recebidos} de {total_bytes} bytes "
+                                f"em {TIMEOUT_RECEPCAO:.0f} s.")
+                        time.sleep(0.001)
+                    if not impressora.aguardar_ociosa(timeout=max(limite - time.monotonic(), 0)):
+                        raise RuntimeError(f"O emulador não terminou de imprimir em {TIMEOUT_RECEPCAO:.0f} s.")
+                    duracao = time.perf_counter() - inicio
+                finally:
+                    pool.fechar()
+                if impressora.estatisticas.etiquetas != quantidade:
+                    raise RuntimeError(f"O emulador recebeu {impressora.estatisticas.etiquetas} de {quantidade} etiquetas.")
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        medida = _vazao(melhor, quantidade, total_bytes)
+        resultados[f"envio/mock/{quantidade}"] = medida
+        print(f"  envio mock {quantidade:>9} etiquetas: {medida['etiquetas_por_s']:>12,.0f} etiquetas/s "
+              f"{medida['mb_por_s']:>8.2f} MB/s")
+    return resultados
+
+
+def medir_envio_ipp(quantidades, repeticoes):
+    from scripts.utils.mock_ipp import ServidorIPPMock
+    from scripts.utils.transporte import PoolConexoes, enviar
+
+    modelo = next(iter(obter_configuracao().modelos().values()))
+
+    resultados = {}
+    with ServidorIPPMock() as servidor:
+        # A mesma conexão HTTP é reaproveitada entre os trabalhos, como com o CUPS
+        pool = PoolConexoes({"mock": {"backend": "ipp", "fila_cups": "mock", "servidor": servidor.servidor}})
+        for quantidade in quantidades:
+            etiquetas = _etiquetas(quantidade)
+            segundos, total_bytes = _melhor_tempo(lambda: enviar("mock", iter_zpl(etiquetas, modelo), pool=pool),
+                                                  repeticoes)
+            if servidor.estatisticas.trabalhos[-1]["etiquetas"] != quantidade:
+                raise RuntimeError(f"O emulador IPP recebeu {servidor.estatisticas.trabalhos[-1]['etiquetas']} "
+                                   f"de {quantidade} etiquetas.")
+            medida = _vazao(segundos, quantidade, total_bytes)
+            resultados[f"envio/ipp/{quantidade}"] = medida
+            print(f"  envio ipp  {quantidade:>9} etiquetas: {medida['etiquetas_por_s']:>12,.0f} etiquetas/s "
+                  f"{medida['mb_por_s']:>8.2f} MB/s")
+    return resultados
+
+
+def comparar(atual, linha_base, tolerancia):
+    """
+    Compara a vazão (etiquetas/s) de cada medida com a linha de base.
+
+    :return: Lista de tuplas (medida, vazão da linha de base, vazão atual, variação) das regressões.
+    """
+    regressoes = []
+    print(f"\nComparação com a linha de base (tolerância {tolerancia:.0%}):")
+    for chave, medida in sorted(atual.items()):
+        base = linha_base.get(chave)
+        if base is None or not base.get("etiquetas_por_s"):
+            print(f"  {chave:<45} sem linha de base")
+            continue
+        variacao = medida["etiquetas_por_s"] / base["etiquetas_por_s"] - 1
+        marca = "REGRESSÃO" if variacao < -tolerancia else "ok"
+        print(f"  {chave:<45} {variacao:+7.1%}  {marca}")
+        if variacao < -tolerancia:
+            regressoes.append((chave, base["etiquetas_por_s"], medida["etiquetas_por_s"], variacao))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de geração, carregamento e envio de etiquetas.")
+    parser.add_argument("--apenas", nargs="+", choices=SUITES, default=list(SUITES), help="Suítes a executar.")
+    parser.add_argument("--completo", action="store_true", help="Inclui os tamanhos grandes (até 1 milhão).")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--salvar", help="Grava os resultados como linha de base neste arquivo JSON.")
+    parser.add_argument("--comparar", help="Compara com uma linha de base gravada anteriormente.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="Queda de vazão aceita antes de acusar regressão (padrão: 0.10).")
+    args = parser.parse_args()
+
+    resultados = {}
+    if "geracao" in args.apenas:
+        print("[LOG] Geração de ZPL:")
+        resultados.update(medir_geracao(
+            TAMANHOS_GERACAO_COMPLETO if args.completo else TAMANHOS_GERACAO, args.repeticoes))
+    if "carregamento" in args.apenas:
+        print("[LOG] Carregamento de arquivos:")
+        resultados.update(medir_carregamento(
+            LINHAS_CSV_COMPLETO if args.completo else LINHAS_CSV,
+            LINHAS_XLSX_COMPLETO if args.completo else LINHAS_XLSX, args.repeticoes))
+    if "envio" in args.apenas:
+        print("[LOG] Envio para o emulador de impressora:")
+        try:
+            resultados.update(medir_envio(ETIQUETAS_ENVIO, args.repeticoes))
+            resultados.update(medir_envio_ipp(ETIQUETAS_ENVIO, args.repeticoes))
+        except RuntimeError as e:
+            print(f"[ERRO] Envio: {e}")
+            sys.exit(1)
+
+    relatorio = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "processador": platform.processor() or platform.machine(),
+            "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "resultados": resultados,
+    }
+    if args.salvar:
+        with open(args.salvar, "w") as f:
+            json.dump(relatorio, f, indent=4, ensure_ascii=False)
+        print(f"\n[LOG] Linha de base gravada em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar, "r") as f:
+            linha_base = json.load(f)["resultados"]
+        regressoes = comparar(resultados, linha_base, args.tolerancia)
+        if regressoes:
+            print(f"\n[ERRO] {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
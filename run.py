@@ -1,13 +1,17 @@
 import sys
 import os
 
-# Adiciona o diretório correto ao caminho de busca do Python
+# Adiciona a raiz do projeto ao caminho de busca do Python (permite executar de outro diretório)
 current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(os.path.join(current_dir, 'scripts', 'core'))  # Garante que 'scripts/core' seja incluído
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
 
-# Agora podemos importar a função corretamente
-from zpl_generator import gerar_zpl  # Verifique se a função 'gerar_zpl' está no arquivo zpl_generator.py
+# O módulo principal só carrega pandas e as bibliotecas de planilha quando a origem "Arquivo" é escolhida
 import scripts.features.imprimir_etiqueta_v6 as main_script  # Deve chamar a versão v6
 
 if __name__ == "__main__":
-    main_script.main()  # Executa a função main da versão v6
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Com argumentos, roda sem prompts (ver scripts/features/cli_etiquetas.py)
+        from scripts.features.cli_etiquetas import main as main_cli
+        sys.exit(main_cli())
+    main_script.main()  # Executa a função main da versão v6
@@ -3,8 +3,8 @@ import json
 import pandas as pd
 from fractions import Fraction
 
-# Caminho para o arquivo JSON com os modelos de etiquetas
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/etiquetas_config.json"
+# Modelos de etiquetas: config/etiquetas_config.json, pelo serviço de configuração
+from scripts.core.config import caminho_modelos as caminho_json, carregar_modelos
 
 # Funções de conversão e manipulação de dados
 def detectar_codificacao(arquivo):
@@ -29,14 +29,6 @@ def mm_para_pontos(valor):
     """Converte valores em milímetros para pontos ZPL."""
     return float(valor) * 2.83465
 
-def carregar_modelos():
-    """Carrega os modelos de etiquetas do arquivo JSON."""
-    if not os.path.exists(caminho_json):
-        with open(caminho_json, "w") as f:
-            json.dump({}, f)
-    with open(caminho_json, "r") as f:
-        return json.load(f)
-
 def salvar_modelos(modelos):
     """Salva os modelos de etiquetas no arquivo JSON."""
     with open(caminho_json, "w") as f:
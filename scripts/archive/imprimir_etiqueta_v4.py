@@ -1,11 +1,10 @@
 import os
-import json
 import pandas as pd
 from fractions import Fraction
 import subprocess
 
-# Caminho para o arquivo JSON com os modelos de etiquetas
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/etiquetas_config.json"
+# Modelos de etiquetas: config/etiquetas_config.json, pelo serviço de configuração
+from scripts.core.config import carregar_modelos
 
 # Funções auxiliares
 def detectar_codificacao(arquivo):
@@ -60,14 +59,6 @@ def selecionar_impressora():
         print("Nenhuma impressora foi encontrada. Digite o nome manualmente.")
         return input("Nome da impressora: ").strip()
 
-def carregar_modelos():
-    """Carrega os modelos de etiquetas do arquivo JSON."""
-    if not os.path.exists(caminho_json):
-        with open(caminho_json, "w") as f:
-            json.dump({}, f)
-    with open(caminho_json, "r") as f:
-        return json.load(f)
-
 def carregar_dados(caminho):
     """Carrega os dados de um arquivo CSV ou Excel."""
     try:
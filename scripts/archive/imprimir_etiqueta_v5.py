@@ -1,17 +1,8 @@
 import os
-import json
 import subprocess
 
-# Caminho para o arquivo JSON com os modelos de etiquetas
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/etiquetas_config.json"
-
-def carregar_modelos():
-    """Carrega os modelos de etiquetas do arquivo JSON."""
-    if not os.path.exists(caminho_json):
-        print(f"Erro: Arquivo JSON de modelos não encontrado em {caminho_json}.")
-        return None
-    with open(caminho_json, "r") as f:
-        return json.load(f)
+# Modelos de etiquetas: config/etiquetas_config.json, pelo serviço de configuração
+from scripts.core.config import carregar_modelos
 
 def listar_impressoras():
     """Lista impressoras disponíveis no macOS."""
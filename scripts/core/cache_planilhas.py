@@ -0,0 +1,392 @@
+"""
+Cache em disco das planilhas já lidas, em formato colunar (Parquet).
+
+Cada aba lida com pd.read_excel é gravada com as colunas que foram lidas; nas
+execuções seguintes a leitura vem do Parquet, apenas com as colunas pedidas. Pedir
+uma coluna que ainda não está no cache faz a planilha ser lida de novo com ela e
+com as que já estavam, e a entrada passa a guardar todas. As entradas são
+identificadas por caminho, tamanho, mtime e hash do conteúdo, e o cache respeita
+um limite de tamanho removendo as entradas usadas há mais tempo (LRU).
+
+Requer o pyarrow; sem ele o cache fica desativado e as planilhas são lidas normalmente.
+
+Uso:
+    python -m scripts.core.cache_planilhas listar
+    python -m scripts.core.cache_planilhas limpar [--arquivo caminho.xlsx]
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Diretório e limite do cache (podem ser ajustados por variáveis de ambiente)
+diretorio_cache = os.environ.get(
+    "ETIQUETAS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "zebra-datamax", "planilhas")
+)
+LIMITE_BYTES = int(os.environ.get("ETIQUETAS_CACHE_LIMITE", 512 * 1024 * 1024))
+
+# A trava de thread protege o índice dentro do processo; o flock, entre processos
+# (ex.: várias execuções em paralelo pelo xargs -P) que usam o mesmo diretório
+_trava = threading.Lock()
+_hashes = {}
+
+
+def disponivel():
+    """Indica se o formato colunar (pyarrow) está instalado."""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def normalizar_cabecalho(valores):
+    """
+    Nomes das colunas como o pandas os monta ao ler a planilha.
+
+    Usado pelo cache e pela leitura direta com o openpyxl, para que um nome de coluna
+    salvo ou informado encontre a mesma coluna nos dois caminhos: células vazias viram
+    "Unnamed: N" (N é a posição) e nomes repetidos ganham ".1", ".2"...
+
+    :param valores: Valores da primeira linha (ou as colunas de um DataFrame).
+    :return: Lista de nomes em texto, sem repetições.
+    """
+    nomes = []
+    usados = {}
+    for posicao, valor in enumerate(valores):
+        nome = f"Unnamed: {posicao}" if valor is None or valor == "" else str(valor)
+        repeticoes = usados.get(nome, 0)
+        if repeticoes:
+            novo = f"{nome}.{repeticoes}"
+            while novo in usados:
+                repeticoes += 1
+                novo = f"{nome}.{repeticoes}"
+            usados[nome] = repeticoes + 1
+            nome = novo
+        usados[nome] = usados.get(nome, 0) + 1
+        nomes.append(nome)
+    return nomes
+
+
+def _caminho_indice():
+    return os.path.join(diretorio_cache, "indice.json")
+
+
+@contextmanager
+def _travar_indice():
+    """Trava exclusiva do índice, no processo e entre processos, durante ler-alterar-gravar."""
+    with _trava:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(diretorio_cache, exist_ok=True)
+        with open(os.path.join(diretorio_cache, "indice.lock"), "a") as trava:
+            fcntl.flock(trava.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(trava.fileno(), fcntl.LOCK_UN)
+
+
+def _temporario(sufixo):
+    """Arquivo temporário exclusivo no diretório do cache (o os.replace não cruza sistemas de arquivos)."""
+    os.makedirs(diretorio_cache, exist_ok=True)
+    descritor, caminho = tempfile.mkstemp(dir=diretorio_cache, prefix=".", suffix=sufixo)
+    os.close(descritor)
+    return caminho
+
+
+def _substituir(temporario, destino):
+    try:
+        os.replace(temporario, destino)
+    except OSError:
+        os.remove(temporario)
+        raise
+
+
+def _carregar_indice():
+    try:
+        with open(_caminho_indice(), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _salvar_indice(indice):
+    temporario = _temporario(".json.tmp")
+    try:
+        with open(temporario, "w") as f:
+            json.dump(indice, f, indent=2, ensure_ascii=False)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    _substituir(temporario, _caminho_indice())
+
+
+def _hash_arquivo(caminho, info=None):
+    """Hash do conteúdo, memorizado no processo por (caminho, tamanho, mtime)."""
+    info = info or os.stat(caminho)
+    memo = (os.path.abspath(caminho), info.st_size, info.st_mtime_ns)
+    if memo not in _hashes:
+        resumo = hashlib.blake2b(digest_size=16)
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                resumo.update(bloco)
+        _hashes[memo] = resumo.hexdigest()
+    return _hashes[memo]
+
+
+def _localizar(indice, caminho, aba):
+    """
+    Procura a entrada do arquivo no índice.
+
+    Primeiro compara caminho, tamanho e mtime (sem ler o arquivo); se não bater,
+    compara o hash do conteúdo, o que reaproveita o cache de arquivos copiados ou
+    apenas "tocados".
+
+    :return: Tupla (chave, entrada) ou (None, None).
+    """
+    info = os.stat(caminho)
+    caminho = os.path.abspath(caminho)
+    for chave, entrada in indice.items():
+        if (entrada["caminho"], entrada["tamanho"], entrada["mtime_ns"], entrada["aba"]) == \
+                (caminho, info.st_size, info.st_mtime_ns, aba):
+            return chave, entrada
+
+    conteudo = _hash_arquivo(caminho, info)
+    chave = f"{conteudo}-{aba}"
+    entrada = indice.get(chave)
+    if entrada is None:
+        return None, None
+    entrada.update(caminho=caminho, tamanho=info.st_size, mtime_ns=info.st_mtime_ns)
+    return chave, entrada
+
+
+def _indices_gravados(entrada):
+    """Posições das colunas guardadas na entrada (entradas antigas guardam todas)."""
+    return entrada.get("indices", list(range(len(entrada["colunas"]))))
+
+
+def _contem(entrada, indices):
+    gravados = _indices_gravados(entrada)
+    if indices is None:
+        return len(gravados) == len(entrada["colunas"])
+    return set(indices) <= set(gravados)
+
+
+def indices_em_cache(caminho, aba=0):
+    """
+    Posições das colunas da planilha já guardadas no cache.
+
+    :return: Lista de índices (a partir de 0), vazia se a planilha não estiver no cache.
+    """
+    if not disponivel() or not os.path.exists(_caminho_indice()):
+        return []
+    with _travar_indice():
+        _, entrada = _localizar(_carregar_indice(), caminho, aba)
+    return list(_indices_gravados(entrada)) if entrada else []
+
+
+def colunas(caminho, aba=0):
+    """
+    Retorna o cabeçalho da planilha guardado no cache, sem abrir o arquivo Excel.
+
+    :return: Lista com os nomes das colunas ou None se a planilha não estiver no cache.
+    """
+    if not disponivel() or not os.path.exists(_caminho_indice()):
+        return None
+    with _travar_indice():
+        _, entrada = _localizar(_carregar_indice(), caminho, aba)
+    return list(entrada["colunas"]) if entrada else None
+
+
+def _abrir(caminho, aba, indices):
+    """
+    Localiza a entrada com as colunas pedidas e marca o acesso.
+
+    :return: Tupla (arquivo Parquet, entrada) ou (None, None).
+    """
+    with _travar_indice():
+        indice = _carregar_indice()
+        chave, entrada = _localizar(indice, caminho, aba)
+        if entrada is None or not _contem(entrada, indices):
+            return None, None
+        arquivo = os.path.join(diretorio_cache, entrada["arquivo"])
+        if not os.path.exists(arquivo):
+            del indice[chave]
+            _salvar_indice(indice)
+            return None, None
+        entrada["ultimo_acesso"] = time.time()
+        _salvar_indice(indice)
+    return arquivo, entrada
+
+
+def ler(caminho, indices=None, aba=0):
+    """
+    Lê a planilha do cache.
+
+    :param caminho: Caminho do arquivo Excel original.
+    :param indices: Índices (a partir de 0) das colunas a ler, na ordem desejada, ou None para todas.
+    :param aba: Aba da planilha (como em pd.read_excel).
+    :return: DataFrame com as colunas pedidas ou None se não houver cache válido com todas elas.
+    """
+    if not disponivel():
+        return None
+    try:
+        arquivo, entrada = _abrir(caminho, aba, indices)
+        if arquivo is None:
+            return None
+        import pandas as pd
+
+        nomes = entrada["colunas"] if indices is None else [entrada["colunas"][idx] for idx in indices]
+        return pd.read_parquet(arquivo, columns=nomes)
+    except Exception as e:
+        print(f"[LOG] Cache da planilha ignorado: {e}\n")
+        return None
+
+
+def iter_lotes(caminho, indices, tamanho_lote, aba=0):
+    """
+    Lê a planilha do cache em lotes, apenas com as colunas pedidas.
+
+    :return: Iterador de DataFrames ou None se não houver cache válido com todas as colunas pedidas.
+    """
+    if not disponivel():
+        return None
+    arquivo, entrada = _abrir(caminho, aba, indices)
+    if arquivo is None:
+        return None
+    import pyarrow.parquet as pq
+
+    nomes = [entrada["colunas"][idx] for idx in indices]
+    lotes = pq.ParquetFile(arquivo).iter_batches(batch_size=tamanho_lote, columns=nomes)
+    return (lote.to_pandas() for lote in lotes)
+
+
+def gravar(caminho, df, aba=0, cabecalho=None, indices=None):
+    """
+    Grava a planilha lida no cache e aplica o limite de tamanho.
+
+    :param caminho: Caminho do arquivo Excel original.
+    :param df: DataFrame com as colunas lidas da aba (como texto), na ordem do arquivo.
+    :param aba: Aba da planilha (como em pd.read_excel).
+    :param cabecalho: Cabeçalho completo da aba (padrão: as colunas de `df`, que então tem todas).
+    :param indices: Posições das colunas de `df` no cabeçalho (padrão: todas).
+    """
+    if not disponivel():
+        return
+    try:
+        info = os.stat(caminho)
+        conteudo = _hash_arquivo(caminho, info)
+        chave = f"{conteudo}-{aba}"
+        nome_arquivo = f"{chave}.parquet"
+        cabecalho = normalizar_cabecalho(df.columns if cabecalho is None else cabecalho)
+        indices = list(range(len(cabecalho))) if indices is None else sorted(indices)
+        df = df.copy()
+        df.columns = [cabecalho[idx] for idx in indices]
+        destino = os.path.join(diretorio_cache, nome_arquivo)
+        temporario = _temporario(".parquet.tmp")
+        try:
+            df.to_parquet(temporario, index=False)
+        except BaseException:
+            os.remove(temporario)
+            raise
+        _substituir(temporario, destino)
+
+        with _travar_indice():
+            indice = _carregar_indice()
+            indice[chave] = {
+                "caminho": os.path.abspath(caminho),
+                "tamanho": info.st_size,
+                "mtime_ns": info.st_mtime_ns,
+                "hash": conteudo,
+                "aba": aba,
+                "colunas": cabecalho,
+                "indices": indices,
+                "arquivo": nome_arquivo,
+                "bytes": os.path.getsize(destino),
+                "ultimo_acesso": time.time(),
+            }
+            _despejar(indice)
+            _salvar_indice(indice)
+    except Exception as e:
+        print(f"[LOG] Não foi possível gravar a planilha no cache: {e}\n")
+
+
+def _despejar(indice):
+    """Remove as entradas usadas há mais tempo até o cache caber no limite."""
+    total = sum(entrada["bytes"] for entrada in indice.values())
+    for chave, entrada in sorted(indice.items(), key=lambda item: item[1]["ultimo_acesso"]):
+        if total <= LIMITE_BYTES:
+            break
+        _remover_arquivo(entrada)
+        del indice[chave]
+        total -= entrada["bytes"]
+
+
+def _remover_arquivo(entrada):
+    try:
+        os.remove(os.path.join(diretorio_cache, entrada["arquivo"]))
+    except OSError:
+        pass
+
+
+def listar():
+    """Retorna as entradas do cache, das usadas mais recentemente para as mais antigas."""
+    with _travar_indice():
+        indice = _carregar_indice()
+    return sorted(indice.values(), key=lambda entrada: entrada["ultimo_acesso"], reverse=True)
+
+
+def limpar(caminho=None):
+    """
+    Remove entradas do cache.
+
+    :param caminho: Remove apenas as entradas deste arquivo; None remove tudo.
+    :return: Quantidade de entradas removidas.
+    """
+    with _travar_indice():
+        indice = _carregar_indice()
+        alvo = os.path.abspath(caminho) if caminho else None
+        removidas = [chave for chave, entrada in indice.items() if alvo is None or entrada["caminho"] == alvo]
+        for chave in removidas:
+            _remover_arquivo(indice.pop(chave))
+        _salvar_indice(indice)
+    return len(removidas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspeciona ou limpa o cache de planilhas.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    subcomandos.add_parser("listar", help="Lista as planilhas em cache.")
+    limpar_parser = subcomandos.add_parser("limpar", help="Remove planilhas do cache.")
+    limpar_parser.add_argument("--arquivo", help="Remove apenas as entradas deste arquivo.")
+    args = parser.parse_args()
+
+    if args.comando == "listar":
+        entradas = listar()
+        total = sum(entrada["bytes"] for entrada in entradas)
+        print(f"Cache em {diretorio_cache}: {len(entradas)} entrada(s), {total / 1024 / 1024:.1f} MB "
+              f"de {LIMITE_BYTES / 1024 / 1024:.0f} MB.")
+        for entrada in entradas:
+            acesso = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entrada["ultimo_acesso"]))
+            print(f"- {entrada['caminho']} (aba {entrada['aba']}): {len(_indices_gravados(entrada))} de "
+                  f"{len(entrada['colunas'])} colunas, "
+                  f"{entrada['bytes'] / 1024:.0f} KB, último acesso {acesso}")
+    else:
+        removidas = limpar(args.arquivo)
+        print(f"{removidas} entrada(s) removida(s) do cache.")
+
+
+if __name__ == "__main__":
+    main()
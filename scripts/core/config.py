@@ -0,0 +1,433 @@
+"""
+Serviço de configuração dos modelos de etiqueta (config/etiquetas_config.json).
+
+O arquivo é lido uma vez por processo. A cada consulta, só o os.stat é refeito: o
+JSON volta a ser lido e validado apenas se o mtime ou o tamanho mudarem.
+
+Depois da validação, os modelos e os índices são gravados em um instantâneo binário
+(marshal) no diretório de cache. Na próxima inicialização, se o mtime e o tamanho
+do JSON ainda forem os mesmos, o instantâneo é carregado direto, sem parse nem
+validação.
+
+Os modelos podem ser buscados pelo nome ou pelo tamanho físico. O tamanho vem das
+chaves opcionais "largura_mm"/"altura_mm" do modelo ou, na falta delas, do nome
+(Etiqueta_33x22mm, Etiqueta_4x6_in).
+
+Serviços de longa duração usam o ObservadorModelos, que verifica o arquivo em uma
+thread e troca o registro inteiro (RegistroModelos, imutável) quando uma nova versão
+válida aparece; trabalhos em andamento continuam com a versão que pegaram. O tempo
+de cada recarga e os erros de validação vão para as métricas (scripts.utils.metricas).
+
+Exemplo:
+    configuracao = obter_configuracao()
+    modelo = configuracao.modelo("Etiqueta_33x22mm")
+    nome, modelo = configuracao.por_tamanho(4, 6, unidade="in")
+"""
+import hashlib
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from types import MappingProxyType
+
+from scripts.utils import metricas
+
+caminho_modelos = os.environ.get(
+    "ETIQUETAS_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config", "etiquetas_config.json"),
+)
+diretorio_instantaneos = os.environ.get(
+    "ETIQUETAS_CONFIG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "zebra-datamax", "config")
+)
+
+# Muda quando o conteúdo do instantâneo muda; instantâneos de outra versão são ignorados
+VERSAO_INSTANTANEO = 1
+
+CAMPOS_OBRIGATORIOS = ("largura", "altura", "colunas", "largura_total", "posicoes_horizontais")
+# Medidas em pontos que precisam ser números maiores que zero
+CAMPOS_POSITIVOS = ("largura", "altura", "largura_total")
+# Campos opcionais: medidas que podem ser zero e tamanhos físicos em milímetros
+CAMPOS_NAO_NEGATIVOS = ("espaco",)
+CAMPOS_TAMANHO_MM = ("largura_mm", "altura_mm")
+MM_POR_POLEGADA = 25.4
+TOLERANCIA_MM = 0.5
+INTERVALO_OBSERVACAO = 1.0
+
+_padrao_tamanho = re.compile(r"(\d+(?:[.,]\d+)?)\s*x\s*(\d+(?:[.,]\d+)?)\s*_?(mm|in)\b", re.IGNORECASE)
+
+
+class ErroConfiguracao(ValueError):
+    """Arquivo de modelos ausente, ilegível ou com modelos inválidos."""
+
+
+def tamanho_do_nome(texto):
+    """
+    Extrai o tamanho físico de um nome como "Etiqueta_33x22mm" ou "4x6_in".
+
+    :return: Tupla (largura, altura) em milímetros ou None se o nome não tiver tamanho.
+    """
+    encontrado = _padrao_tamanho.search(texto)
+    if encontrado is None:
+        return None
+    largura, altura, unidade = encontrado.groups()
+    fator = MM_POR_POLEGADA if unidade.lower() == "in" else 1.0
+    return float(largura.replace(",", ".")) * fator, float(altura.replace(",", ".")) * fator
+
+
+def _numero(valor):
+    # bool é subclasse de int, mas true/false no JSON é erro de digitação, não medida
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _validar(modelos):
+    """Confere a estrutura, os tipos e os limites dos modelos e devolve os erros encontrados."""
+    if not isinstance(modelos, dict):
+        return ["o arquivo deve conter um objeto com os modelos pelo nome"]
+    erros = []
+    for nome, modelo in modelos.items():
+        if not isinstance(modelo, dict):
+            erros.append(f"{nome}: o modelo deve ser um objeto")
+            continue
+        faltando = [campo for campo in CAMPOS_OBRIGATORIOS if campo not in modelo]
+        if faltando:
+            erros.append(f"{nome}: campos ausentes: {', '.join(faltando)}")
+            continue
+        for campo in CAMPOS_POSITIVOS + CAMPOS_TAMANHO_MM:
+            if campo in modelo and not (_numero(modelo[campo]) and modelo[campo] > 0):
+                erros.append(f"{nome}: '{campo}' deve ser um número maior que zero")
+        for campo in CAMPOS_NAO_NEGATIVOS:
+            if campo in modelo and not (_numero(modelo[campo]) and modelo[campo] >= 0):
+                erros.append(f"{nome}: '{campo}' deve ser um número maior ou igual a zero")
+        posicoes = modelo["posicoes_horizontais"]
+        if not isinstance(posicoes, list) or not all(_numero(posicao) and posicao >= 0 for posicao in posicoes):
+            erros.append(f"{nome}: 'posicoes_horizontais' deve ser uma lista de números maiores ou iguais a zero")
+        elif not (_numero(modelo["colunas"]) and isinstance(modelo["colunas"], int) and modelo["colunas"] >= 1):
+            erros.append(f"{nome}: 'colunas' deve ser um inteiro positivo")
+        elif len(posicoes) < modelo["colunas"]:
+            erros.append(f"{nome}: 'posicoes_horizontais' tem menos posições que colunas")
+    return erros
+
+
+def _indexar_tamanhos(modelos):
+    """Lista de (largura_mm, altura_mm, nome) dos modelos com tamanho físico conhecido."""
+    indice = []
+    for nome, modelo in modelos.items():
+        if "largura_mm" in modelo and "altura_mm" in modelo:
+            tamanho = float(modelo["largura_mm"]), float(modelo["altura_mm"])
+        else:
+            tamanho = tamanho_do_nome(nome)
+        if tamanho is not None:
+            indice.append((round(tamanho[0], 2), round(tamanho[1], 2), nome))
+    return indice
+
+
+class RegistroModelos:
+    """
+    Uma versão validada dos modelos, com os índices de busca. Imutável: cada recarga
+    do arquivo cria um registro novo, e quem já tem uma referência (por exemplo, um
+    trabalho em andamento) continua usando a versão que pegou.
+
+    :param modelos: Dicionário {nome: modelo} já validado.
+    :param por_tamanho: Índice de tamanhos, como devolvido por _indexar_tamanhos.
+    :param versao: Número da versão no processo (1 na primeira carga).
+    """
+
+    __slots__ = ("modelos", "por_tamanho_mm", "versao", "assinatura")
+
+    def __init__(self, modelos, por_tamanho=None, versao=1, assinatura=None):
+        atribuir = object.__setattr__
+        atribuir(self, "modelos", MappingProxyType(dict(modelos)))
+        atribuir(self, "por_tamanho_mm", tuple(
+            tuple(item) for item in (_indexar_tamanhos(modelos) if por_tamanho is None else por_tamanho)
+        ))
+        atribuir(self, "versao", versao)
+        atribuir(self, "assinatura", assinatura)
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError("RegistroModelos é imutável.")
+
+    def __delattr__(self, nome):
+        raise AttributeError("RegistroModelos é imutável.")
+
+    def __repr__(self):
+        return f"RegistroModelos(versao={self.versao}, {len(self.modelos)} modelo(s))"
+
+    def nomes(self):
+        return list(self.modelos)
+
+    def modelo(self, nome):
+        """Modelo pelo nome, ou None se não existir."""
+        return self.modelos.get(nome)
+
+    def por_tamanho(self, largura, altura, unidade="mm", tolerancia_mm=TOLERANCIA_MM):
+        """
+        Busca o modelo pelo tamanho físico da etiqueta.
+
+        :param largura: Largura da etiqueta.
+        :param altura: Altura da etiqueta.
+        :param unidade: "mm" ou "in".
+        :param tolerancia_mm: Diferença máxima aceita em cada dimensão, em milímetros.
+        :return: Tupla (nome, modelo) do modelo mais próximo ou None se nenhum estiver dentro da tolerância.
+        """
+        fator = MM_POR_POLEGADA if unidade == "in" else 1.0
+        largura_mm, altura_mm = largura * fator, altura * fator
+        melhor, menor_diferenca = None, None
+        for largura_modelo, altura_modelo, nome in self.por_tamanho_mm:
+            diferenca = max(abs(largura_modelo - largura_mm), abs(altura_modelo - altura_mm))
+            if diferenca <= tolerancia_mm and (menor_diferenca is None or diferenca < menor_diferenca):
+                melhor, menor_diferenca = nome, diferenca
+        return None if melhor is None else (melhor, self.modelos[melhor])
+
+    def buscar(self, texto):
+        """
+        Busca o modelo pelo nome ou, se não houver modelo com esse nome, pelo tamanho
+        escrito no texto (ex.: "33x22mm", "4x6in").
+
+        :return: Tupla (nome, modelo) ou None.
+        """
+        modelo = self.modelo(texto)
+        if modelo is not None:
+            return texto, modelo
+        tamanho = tamanho_do_nome(texto)
+        return None if tamanho is None else self.por_tamanho(*tamanho)
+
+
+class ConfiguracaoModelos:
+    """
+    Modelos de um arquivo de configuração, revalidados só quando o arquivo muda.
+
+    A versão atual fica em um RegistroModelos, trocado por inteiro a cada recarga.
+    Não altere os dicionários dos modelos devolvidos.
+
+    :param caminho: Arquivo JSON de modelos (padrão: config/etiquetas_config.json).
+    :param instantaneos: Diretório dos instantâneos binários, ou None para não usá-los.
+    """
+
+    def __init__(self, caminho=None, instantaneos=diretorio_instantaneos):
+        self.caminho = os.path.abspath(caminho or caminho_modelos)
+        self.instantaneos = instantaneos
+        self._trava = threading.Lock()
+        self._registro = None
+        self._erro_informado = None
+
+    def _caminho_instantaneo(self):
+        chave = hashlib.sha1(self.caminho.encode("utf-8")).hexdigest()[:16]
+        versao = f"{sys.version_info[0]}{sys.version_info[1]}"
+        return os.path.join(self.instantaneos, f"modelos-{chave}-py{versao}.bin")
+
+    def _ler_instantaneo(self, assinatura):
+        """
+        Modelos e índice do instantâneo, se ele corresponder à assinatura do arquivo.
+
+        :param assinatura: (mtime_ns, tamanho) do JSON, ou None para aceitar o último
+            instantâneo válido gravado, seja de qual versão do arquivo for.
+        """
+        if not self.instantaneos:
+            return None
+        try:
+            with open(self._caminho_instantaneo(), "rb") as f:
+                dados = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (not isinstance(dados, dict) or dados.get("versao") != VERSAO_INSTANTANEO
+                or dados.get("caminho") != self.caminho
+                or (assinatura is not None and tuple(dados.get("assinatura", ())) != assinatura)):
+            return None
+        return dados["modelos"], dados["por_tamanho"]
+
+    def _gravar_instantaneo(self, assinatura, modelos, por_tamanho):
+        if not self.instantaneos:
+            return
+        destino = self._caminho_instantaneo()
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.instantaneos, exist_ok=True)
+            with open(temporario, "wb") as f:
+                f.write(marshal.dumps({
+                    "versao": VERSAO_INSTANTANEO, "caminho": self.caminho, "assinatura": assinatura,
+                    "modelos": modelos, "por_tamanho": por_tamanho,
+                }))
+            os.replace(temporario, destino)
+        except (OSError, ValueError):
+            # O instantâneo só acelera a próxima inicialização; sem ele, o JSON é lido normalmente
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+
+    def _ler_json(self, assinatura):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                modelos = json.load(f)
+        except OSError as e:
+            raise ErroConfiguracao(f"Não foi possível ler {self.caminho}: {e}")
+        except ValueError as e:
+            raise ErroConfiguracao(f"JSON inválido em {self.caminho}: {e}")
+        erros = _validar(modelos)
+        if erros:
+            raise ErroConfiguracao(f"Modelos inválidos em {self.caminho}: " + "; ".join(erros))
+        por_tamanho = _indexar_tamanhos(modelos)
+        self._gravar_instantaneo(assinatura, modelos, por_tamanho)
+        return modelos, por_tamanho
+
+    def revalidar(self):
+        """
+        Relê o arquivo se o mtime ou o tamanho mudaram e troca o registro atual.
+
+        Se a nova versão for inválida, a anterior é mantida (a que está carregada ou,
+        na inicialização, o último instantâneo válido) e o erro é informado uma vez.
+
+        :return: True se uma nova versão foi carregada.
+        :raises ErroConfiguracao: Se não houver nenhuma versão válida para usar.
+        """
+        atual = self._registro
+        try:
+            estado = os.stat(self.caminho)
+        except OSError as e:
+            if atual is not None:
+                return False
+            raise ErroConfiguracao(f"Arquivo de modelos não encontrado: {self.caminho} ({e.strerror})")
+        assinatura = (estado.st_mtime_ns, estado.st_size)
+        if atual is not None and assinatura in (atual.assinatura, self._erro_informado):
+            return False
+
+        with self._trava:
+            atual = self._registro
+            if atual is not None and assinatura == atual.assinatura:
+                return False
+            inicio = time.perf_counter_ns()
+            origem = "instantaneo"
+            carregado = self._ler_instantaneo(assinatura) if atual is None else None
+            if carregado is None:
+                origem = "json"
+                try:
+                    carregado = self._ler_json(assinatura)
+                except ErroConfiguracao as e:
+                    metricas.incrementar("erros_validacao_modelos")
+                    if atual is None:
+                        # O instantâneo só é gravado depois de uma validação bem-sucedida:
+                        # é a última versão válida do arquivo
+                        anterior = self._ler_instantaneo(None)
+                        if anterior is None:
+                            raise
+                        print(f"[ERRO] {e}. Usando a última versão válida dos modelos.", file=sys.stderr)
+                        self._erro_informado = assinatura
+                        self._registro = RegistroModelos(*anterior, versao=1, assinatura=None)
+                        return True
+                    if self._erro_informado != assinatura:
+                        print(f"[ERRO] {e}. Mantendo a versão {atual.versao} dos modelos.", file=sys.stderr)
+                        self._erro_informado = assinatura
+                    return False
+            modelos, por_tamanho = carregado
+            self._registro = RegistroModelos(
+                modelos, por_tamanho, versao=1 if atual is None else atual.versao + 1, assinatura=assinatura,
+            )
+            metricas.registrar_tempo("recarga_modelos", time.perf_counter_ns() - inicio, origem=origem)
+            metricas.incrementar("recargas_modelos")
+            return True
+
+    def registro(self):
+        """RegistroModelos da versão atual do arquivo."""
+        self.revalidar()
+        return self._registro
+
+    def modelos(self):
+        """Dicionário {nome: modelo} da versão atual do arquivo."""
+        return self.registro().modelos
+
+    def nomes(self):
+        return self.registro().nomes()
+
+    def modelo(self, nome):
+        """Modelo pelo nome, ou None se não existir."""
+        return self.registro().modelo(nome)
+
+    def por_tamanho(self, largura, altura, unidade="mm", tolerancia_mm=TOLERANCIA_MM):
+        """Busca o modelo pelo tamanho físico (ver RegistroModelos.por_tamanho)."""
+        return self.registro().por_tamanho(largura, altura, unidade, tolerancia_mm)
+
+    def buscar(self, texto):
+        """Busca o modelo pelo nome ou pelo tamanho escrito no texto (ver RegistroModelos.buscar)."""
+        return self.registro().buscar(texto)
+
+
+class ObservadorModelos:
+    """
+    Acompanha o arquivo de modelos em uma thread e troca o registro assim que uma
+    versão válida é gravada, sem reiniciar o processo.
+
+    Quem usa o observador lê `registro` (um atributo, sem acesso ao disco) e guarda a
+    referência enquanto precisar de uma versão estável.
+
+    :param configuracao: ConfiguracaoModelos observada (padrão: a do processo).
+    :param intervalo: Segundos entre as verificações do mtime e do tamanho.
+    """
+
+    def __init__(self, configuracao=None, intervalo=INTERVALO_OBSERVACAO):
+        self.configuracao = configuracao or obter_configuracao()
+        self.intervalo = intervalo
+        self.registro = self.configuracao.registro()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def verificar(self):
+        """Revalida o arquivo agora. Retorna True se uma nova versão foi carregada."""
+        try:
+            recarregado = self.configuracao.revalidar()
+        except ErroConfiguracao as e:
+            print(f"[ERRO] {e}", file=sys.stderr)
+            return False
+        if recarregado:
+            self.registro = self.configuracao.registro()
+            print(f"[LOG] Modelos recarregados (versão {self.registro.versao}): {', '.join(self.registro.nomes())}",
+                  file=sys.stderr)
+        return recarregado
+
+    def _observar(self):
+        while not self._parar.wait(self.intervalo):
+            self.verificar()
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._observar, name="observador-modelos", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_configuracoes = {}
+_trava_configuracoes = threading.Lock()
+
+
+def obter_configuracao(caminho=None):
+    """Configuração compartilhada do processo para o arquivo informado (padrão: config/etiquetas_config.json)."""
+    chave = os.path.abspath(caminho or caminho_modelos)
+    configuracao = _configuracoes.get(chave)
+    if configuracao is None:
+        with _trava_configuracoes:
+            configuracao = _configuracoes.get(chave)
+            if configuracao is None:
+                configuracao = _configuracoes[chave] = ConfiguracaoModelos(chave)
+    return configuracao
+
+
+def carregar_modelos(caminho=None):
+    """
+    Carrega os modelos de etiquetas.
+
+    :param caminho: Arquivo JSON de modelos (padrão: config/etiquetas_config.json).
+    :return: Dicionário {nome: modelo} ou None em caso de erro.
+    """
+    try:
+        return obter_configuracao(caminho).modelos()
+    except ErroConfiguracao as e:
+        print(f"[ERRO] {e}")
+        return None
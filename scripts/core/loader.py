@@ -1,53 +1,423 @@
 import os
 import json
+import codecs
+import itertools
 import pandas as pd
 from fractions import Fraction
-import chardet
+from scripts.core import cache_planilhas
+from scripts.utils import metricas
 
-# Caminho para o arquivo JSON com os modelos de etiquetas
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/etiquetas_config.json"
+# Colunas escolhidas anteriormente para cada arquivo de dados (pelo nome do arquivo)
+caminho_mapeamentos = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "config", "mapeamentos_colunas.json"
+)
 
-def carregar_modelos():
-    """Carrega os modelos de etiquetas do arquivo JSON."""
-    if not os.path.exists(caminho_json):
-        print(f"Erro: Arquivo JSON de modelos não encontrado em {caminho_json}.")
-        return None
-    with open(caminho_json, "r") as f:
-        return json.load(f)
+# Limites da detecção de codificação: lê no máximo LIMITE_AMOSTRA bytes, em blocos
+LIMITE_AMOSTRA = 1024 * 1024
+TAMANHO_BLOCO = 64 * 1024
+
+# Cache de codificações detectadas por (caminho, tamanho, mtime)
+_cache_codificacao = {}
+
+def _ler_amostra(arquivo, limite_bytes, inicio=0):
+    """Lê o arquivo em blocos a partir de `inicio`, até o limite de bytes."""
+    with open(arquivo, "rb") as f:
+        f.seek(inicio)
+        lidos = inicio
+        while lidos < limite_bytes:
+            bloco = f.read(min(TAMANHO_BLOCO, limite_bytes - lidos))
+            if not bloco:
+                break
+            lidos += len(bloco)
+            yield bloco
+
+def _detectar_amostra(arquivo, limite_bytes):
+    """Tenta UTF-8 bloco a bloco e, se falhar, usa o detector incremental do chardet."""
+    blocos = []
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    for bloco in _ler_amostra(arquivo, limite_bytes):
+        blocos.append(bloco)
+        try:
+            decodificador.decode(bloco)
+        except UnicodeDecodeError:
+            break
+    else:
+        if blocos and blocos[0].startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        return "utf-8"
 
-def detectar_codificacao(arquivo):
-    """Detecta a codificação do arquivo CSV."""
+    # Não é UTF-8: o chardet para sozinho ao atingir a confiança mínima (detector.done)
+    from chardet.universaldetector import UniversalDetector
+
+    detector = UniversalDetector()
+    restante = _ler_amostra(arquivo, limite_bytes, inicio=sum(map(len, blocos)))
+    for bloco in itertools.chain(blocos, restante):
+        detector.feed(bloco)
+        if detector.done:
+            break
+    detector.close()
+    return detector.result["encoding"] or "cp1252"
+
+def detectar_codificacao(arquivo, limite_bytes=LIMITE_AMOSTRA):
+    """
+    Detecta a codificação do arquivo CSV a partir de uma amostra do início do arquivo.
+
+    Tenta UTF-8 primeiro e só recorre ao chardet se a amostra não for UTF-8 válido.
+    O resultado fica em cache enquanto o arquivo não mudar (caminho, tamanho e mtime).
+
+    :param arquivo: Caminho do arquivo.
+    :param limite_bytes: Quantidade máxima de bytes lidos para a detecção.
+    :return: Nome da codificação ou None em caso de erro.
+    """
     try:
-        with open(arquivo, "rb") as f:
-            resultado = chardet.detect(f.read())
-        return resultado["encoding"]
+        info = os.stat(arquivo)
+        chave = (os.path.abspath(arquivo), info.st_size, info.st_mtime_ns)
+        if chave not in _cache_codificacao:
+            _cache_codificacao[chave] = _detectar_amostra(arquivo, limite_bytes)
+        return _cache_codificacao[chave]
     except Exception as e:
         print(f"Erro ao detectar codificação do arquivo: {e}")
         return None
 
-def carregar_arquivo(caminho):
+def resolver_colunas(cabecalho, colunas):
+    """
+    Converte colunas informadas por índice (a partir de 0) ou por nome em índices.
+
+    :param cabecalho: Lista com os nomes das colunas do arquivo.
+    :param colunas: Lista de índices e/ou nomes de colunas.
+    :return: Lista de índices na ordem informada.
+    :raises ValueError: Se alguma coluna não existir no arquivo.
+    """
+    indices = []
+    for coluna in colunas:
+        if isinstance(coluna, int):
+            if not 0 <= coluna < len(cabecalho):
+                raise ValueError(f"Coluna {coluna + 1} fora do intervalo (1 a {len(cabecalho)}).")
+            indices.append(coluna)
+        elif coluna in cabecalho:
+            indices.append(cabecalho.index(coluna))
+        else:
+            raise ValueError(f"Coluna '{coluna}' não encontrada no arquivo.")
+    return indices
+
+@metricas.cronometrar("carregamento")
+def carregar_arquivo(caminho, colunas=None):
     """
     Carrega os dados de um arquivo CSV ou Excel.
 
+    Todas as colunas são lidas como texto (sem inferência de tipos). Se `colunas`
+    for informado, apenas essas colunas são lidas do arquivo. Nas planilhas Excel,
+    linhas com todas as colunas lidas vazias são ignoradas (como em iter_lotes).
+
     :param caminho: Caminho do arquivo.
-    :return: DataFrame com os dados ou None em caso de erro.
+    :param colunas: Lista de índices (a partir de 0) e/ou nomes das colunas, ou None para todas.
+    :return: DataFrame com os dados (colunas na ordem pedida) ou None em caso de erro.
     """
     try:
+        indices = None
+        if colunas is not None:
+            cabecalho = ler_colunas(caminho)
+            if cabecalho is None:
+                return None
+            indices = resolver_colunas(cabecalho, colunas)
+        usecols = sorted(set(indices)) if indices is not None else None
+
         if caminho.endswith(".csv"):
             codificacao = detectar_codificacao(caminho)
             if not codificacao:
                 print("Não foi possível detectar a codificação do arquivo CSV.")
                 return None
-            return pd.read_csv(caminho, encoding=codificacao)
+            try:
+                df = pd.read_csv(caminho, encoding=codificacao, usecols=usecols, dtype=str)
+            except UnicodeDecodeError:
+                # A amostra parecia UTF-8, mas o restante do arquivo não é
+                print(f"Codificação {codificacao} inválida após a amostra; usando cp1252.")
+                df = pd.read_csv(caminho, encoding="cp1252", encoding_errors="replace", usecols=usecols, dtype=str)
         elif caminho.endswith((".xls", ".xlsx")):
-            return pd.read_excel(caminho)
+            df = cache_planilhas.ler(caminho, indices)
+            if df is not None:
+                return _sem_linhas_vazias(df)
+            if cache_planilhas.disponivel() and indices is not None:
+                # Lê só as colunas pedidas e as que o cache já tinha; a entrada passa a ter todas
+                usecols = sorted(set(indices) | set(cache_planilhas.indices_em_cache(caminho)))
+                df = pd.read_excel(caminho, usecols=usecols, dtype=str)
+                cache_planilhas.gravar(caminho, df, cabecalho=cabecalho, indices=usecols)
+                return _sem_linhas_vazias(_reordenar_colunas(df, indices, usecols))
+            df = pd.read_excel(caminho, usecols=usecols, dtype=str)
+            if cache_planilhas.disponivel():
+                cache_planilhas.gravar(caminho, df)
+            df = _sem_linhas_vazias(df)
         else:
             print("Erro: O arquivo deve ser CSV ou Excel.")
             return None
+        return _reordenar_colunas(df, indices) if indices is not None else df
     except Exception as e:
         print(f"Erro ao carregar o arquivo: {e}")
         return None
 
+def carregar_mapeamento(caminho):
+    """
+    Retorna as colunas salvas para o arquivo (pelo nome do arquivo), se houver.
+
+    :param caminho: Caminho do arquivo de dados.
+    :return: Lista com os nomes das colunas ou None.
+    """
+    if not os.path.exists(caminho_mapeamentos):
+        return None
+    try:
+        with open(caminho_mapeamentos, "r") as f:
+            return json.load(f).get(os.path.basename(caminho))
+    except Exception as e:
+        print(f"Erro ao carregar mapeamento de colunas: {e}")
+        return None
+
+def salvar_mapeamento(caminho, colunas):
+    """
+    Salva os nomes das colunas escolhidas para o arquivo, para reaproveitar nas próximas execuções.
+
+    :param caminho: Caminho do arquivo de dados.
+    :param colunas: Lista com os nomes das colunas.
+    """
+    try:
+        mapeamentos = {}
+        if os.path.exists(caminho_mapeamentos):
+            with open(caminho_mapeamentos, "r") as f:
+                mapeamentos = json.load(f)
+        mapeamentos[os.path.basename(caminho)] = list(colunas)
+        with open(caminho_mapeamentos, "w") as f:
+            json.dump(mapeamentos, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print(f"Erro ao salvar mapeamento de colunas: {e}")
+
+def escolher_colunas(caminho, cabecalho):
+    """
+    Pergunta quais colunas usar, oferecendo o mapeamento salvo para o arquivo quando existir.
+
+    :param caminho: Caminho do arquivo de dados.
+    :param cabecalho: Lista com os nomes das colunas do arquivo (ver ler_colunas).
+    :return: Lista de índices (a partir de 0) ou None se a seleção for inválida.
+    """
+    salvas = carregar_mapeamento(caminho)
+    if salvas and all(coluna in cabecalho for coluna in salvas):
+        usar = input(f"Usar as colunas salvas para este arquivo {salvas}? (s/n): ").strip().lower()
+        if usar != "n":
+            return resolver_colunas(cabecalho, salvas)
+
+    print("\nColunas disponíveis no arquivo:")
+    for idx, coluna in enumerate(cabecalho, start=1):
+        print(f"{idx}. {coluna}")
+
+    escolha = input("Digite os números das colunas para as etiquetas, separados por vírgulas: ").strip()
+    try:
+        indices = resolver_colunas(cabecalho, [int(num.strip()) - 1 for num in escolha.split(",")])
+    except ValueError as e:
+        print(f"Um ou mais números selecionados são inválidos: {e}")
+        return None
+
+    if input("Salvar esta seleção para os próximos usos deste arquivo? (s/n): ").strip().lower() == "s":
+        salvar_mapeamento(caminho, [cabecalho[idx] for idx in indices])
+    return indices
+
+@metricas.cronometrar("montagem_etiquetas")
+def montar_etiquetas(df, separador=" - ", nulo=""):
+    """
+    Monta o texto das etiquetas concatenando as colunas do DataFrame.
+
+    A concatenação é feita coluna a coluna sobre a coluna inteira (Series.str.cat),
+    sem laço Python por linha.
+
+    :param df: DataFrame apenas com as colunas da etiqueta, na ordem desejada.
+    :param separador: Texto colocado entre os valores das colunas.
+    :param nulo: Texto usado no lugar de valores vazios; None omite o valor e o seu separador.
+    :return: Series com o texto de cada etiqueta (mesmo índice do DataFrame).
+    """
+    if df.shape[1] == 0:
+        return pd.Series("", index=df.index, dtype=object)
+
+    if nulo is None:
+        # Cada valor presente recebe o separador na frente; o primeiro separador é removido no fim
+        partes = [
+            (separador + df.iloc[:, pos].astype(str)).where(df.iloc[:, pos].notna(), "")
+            for pos in range(df.shape[1])
+        ]
+        etiquetas = partes[0].str.cat(partes[1:]) if len(partes) > 1 else partes[0]
+        return etiquetas.str.slice(len(separador))
+
+    colunas = [df.iloc[:, pos].fillna(nulo).astype(str) for pos in range(df.shape[1])]
+    return colunas[0].str.cat(colunas[1:], sep=separador) if len(colunas) > 1 else colunas[0]
+
+# Quantidade de linhas lidas por vez no modo de leitura em fluxo
+TAMANHO_LOTE = 50_000
+
+@metricas.cronometrar("leitura_cabecalho")
+def ler_colunas(caminho):
+    """
+    Lê apenas o cabeçalho do arquivo, sem carregar os dados.
+
+    :param caminho: Caminho do arquivo CSV ou Excel.
+    :return: Lista com os nomes das colunas ou None em caso de erro.
+    """
+    try:
+        if caminho.endswith(".csv"):
+            colunas = pd.read_csv(caminho, encoding=detectar_codificacao(caminho), nrows=0).columns
+            return cache_planilhas.normalizar_cabecalho(colunas)
+        elif caminho.endswith(".xlsx"):
+            em_cache = cache_planilhas.colunas(caminho)
+            if em_cache is not None:
+                return em_cache
+            from openpyxl import load_workbook
+
+            livro = load_workbook(caminho, read_only=True, data_only=True)
+            try:
+                # A primeira aba, como no pd.read_excel (a aba "ativa" é a que estava aberta ao salvar)
+                cabecalho = next(livro.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+                return cache_planilhas.normalizar_cabecalho(cabecalho)
+            finally:
+                livro.close()
+        elif caminho.endswith(".xls"):
+            return cache_planilhas.normalizar_cabecalho(pd.read_excel(caminho, nrows=0).columns)
+        else:
+            print("Erro: O arquivo deve ser CSV ou Excel.")
+            return None
+    except Exception as e:
+        print(f"Erro ao ler o cabeçalho do arquivo: {e}")
+        return None
+
+def _iter_lotes_xlsx(caminho, indices, tamanho_lote):
+    """
+    Percorre a primeira aba da planilha com o iterador somente leitura do openpyxl, em lotes de linhas.
+
+    Linhas com todas as colunas escolhidas vazias (comuns no fim de planilhas editadas)
+    são ignoradas, como em _sem_linhas_vazias.
+    """
+    from openpyxl import load_workbook
+
+    livro = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        lote = []
+        for linha in livro.worksheets[0].iter_rows(min_row=2, values_only=True):
+            valores = tuple(linha[idx] if idx < len(linha) else None for idx in indices)
+            if all(valor is None or valor == "" for valor in valores):
+                continue
+            lote.append(valores)
+            if len(lote) >= tamanho_lote:
+                yield pd.DataFrame(lote, dtype=object)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, dtype=object)
+    finally:
+        livro.close()
+
+def _reordenar_colunas(df, indices, lidas=None):
+    """
+    `usecols` devolve as colunas na ordem do arquivo; reordena conforme a escolha do usuário.
+
+    :param lidas: Colunas passadas ao `usecols` (padrão: as de `indices`).
+    """
+    lidas = sorted(set(indices if lidas is None else lidas))
+    posicoes = {idx: pos for pos, idx in enumerate(lidas)}
+    return df.iloc[:, [posicoes[idx] for idx in indices]]
+
+def _sem_linhas_vazias(df):
+    """
+    Remove as linhas de planilha com todas as colunas vazias.
+
+    Usado em todas as leituras de Excel (cache, pandas e openpyxl), para que o mesmo
+    arquivo gere as mesmas etiquetas e a mesma numeração por qualquer caminho.
+    """
+    return df.dropna(how="all").reset_index(drop=True)
+
+def iter_lotes(caminho, indices, tamanho_lote=TAMANHO_LOTE):
+    """
+    Lê o arquivo em lotes contendo apenas as colunas escolhidas.
+
+    CSV é lido com `chunksize` e XLSX com o iterador somente leitura do openpyxl,
+    então a memória usada depende do tamanho do lote e não do arquivo.
+
+    :param caminho: Caminho do arquivo CSV ou Excel.
+    :param indices: Índices (a partir de 0) das colunas, na ordem desejada.
+    :param tamanho_lote: Quantidade de linhas por lote.
+    :return: Iterador de DataFrames com as colunas na ordem de `indices`.
+    """
+    if caminho.endswith(".csv"):
+        codificacao = detectar_codificacao(caminho)
+        # Erros de codificação viram "?" para não interromper um trabalho já em impressão
+        leitor = pd.read_csv(caminho, encoding=codificacao, encoding_errors="replace",
+                             usecols=sorted(set(indices)), dtype=str, chunksize=tamanho_lote)
+        with leitor:
+            for lote in leitor:
+                yield _reordenar_colunas(lote, indices)
+    elif caminho.endswith(".xlsx"):
+        lotes = cache_planilhas.iter_lotes(caminho, indices, tamanho_lote)
+        if lotes is None:
+            yield from _iter_lotes_xlsx(caminho, indices, tamanho_lote)
+        else:
+            for lote in lotes:
+                lote = _sem_linhas_vazias(lote)
+                if len(lote):
+                    yield lote
+    elif caminho.endswith(".xls"):
+        # O formato .xls antigo não tem leitura incremental; carrega só as colunas escolhidas
+        df = _reordenar_colunas(pd.read_excel(caminho, usecols=sorted(set(indices)), dtype=str), indices)
+        df = _sem_linhas_vazias(df)
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote]
+    else:
+        raise ValueError("O arquivo deve ser CSV ou Excel.")
+
+def iter_etiquetas(caminho, indices, separador=" - ", tamanho_lote=TAMANHO_LOTE):
+    """
+    Gera os textos das etiquetas sob demanda, lote a lote.
+
+    :param caminho: Caminho do arquivo CSV ou Excel.
+    :param indices: Índices (a partir de 0) das colunas que compõem a etiqueta.
+    :param separador: Texto colocado entre os valores das colunas.
+    :return: Iterador de textos de etiquetas.
+    """
+    for lote in metricas.medir_iteracao("leitura_lotes", iter_lotes(caminho, indices, tamanho_lote)):
+        metricas.incrementar("linhas_lidas", len(lote))
+        yield from montar_etiquetas(lote, separador).tolist()
+
+class FonteEtiquetas:
+    """
+    Etiquetas lidas de um arquivo sob demanda.
+
+    Pode ser percorrida várias vezes (cada iteração relê o arquivo), o que permite
+    imprimir cópias intercaladas sem guardar todas as etiquetas na memória.
+
+    :param caminho: Caminho do arquivo CSV ou Excel.
+    :param indices: Índices (a partir de 0) das colunas que compõem a etiqueta.
+    :param separador: Texto colocado entre os valores das colunas.
+    :param inicio: Primeira etiqueta (a partir de 0) a ser usada.
+    :param fim: Posição final (exclusiva) ou None para ir até o fim do arquivo.
+    """
+
+    def __init__(self, caminho, indices, separador=" - ", inicio=0, fim=None, tamanho_lote=TAMANHO_LOTE):
+        self.caminho = caminho
+        self.indices = list(indices)
+        self.separador = separador
+        self.inicio = inicio
+        self.fim = fim
+        self.tamanho_lote = tamanho_lote
+
+    def __iter__(self):
+        etiquetas = iter_etiquetas(self.caminho, self.indices, self.separador, self.tamanho_lote)
+        return itertools.islice(etiquetas, self.inicio, self.fim)
+
+    def recortar(self, inicio, fim=None):
+        """
+        Fonte com parte das etiquetas desta, relendo o mesmo arquivo.
+
+        :param inicio: Primeira etiqueta (a partir de 0, relativa a esta fonte).
+        :param fim: Posição final (exclusiva) ou None para ir até o fim desta fonte.
+        :return: Nova FonteEtiquetas.
+        """
+        novo_fim = self.fim if fim is None else self.inicio + fim
+        if self.fim is not None and novo_fim is not None:
+            novo_fim = min(novo_fim, self.fim)
+        return FonteEtiquetas(self.caminho, self.indices, self.separador, self.inicio + inicio, novo_fim,
+                              self.tamanho_lote)
+
 def selecionar_colunas(df):
     """
     Permite a seleção de colunas de um DataFrame.
@@ -71,8 +441,7 @@ def selecionar_colunas(df):
             return None
 
         # Criar lista de etiquetas combinando as colunas selecionadas
-        colunas_selecionadas = df.iloc[:, indices].fillna("").astype(str)
-        etiquetas = colunas_selecionadas.apply(" - ".join, axis=1).tolist()
+        etiquetas = montar_etiquetas(df.iloc[:, indices]).tolist()
         print(f"Colunas selecionadas: {[df.columns[idx] for idx in indices]}")
         return etiquetas
     except Exception as e:
@@ -83,24 +452,26 @@ def carregar_dados(caminho):
     """
     Carrega os dados de um arquivo e permite a seleção de colunas para gerar etiquetas.
 
+    Apenas o cabeçalho é lido antes da escolha; depois só as colunas escolhidas são carregadas.
+
     :param caminho: Caminho do arquivo.
-    :return: Lista de etiquetas e o DataFrame carregado.
+    :return: Lista de etiquetas e o DataFrame carregado (apenas com as colunas escolhidas).
     """
-    df = carregar_arquivo(caminho)
-    if df is None:
+    cabecalho = ler_colunas(caminho)
+    if cabecalho is None:
         print("Erro ao carregar o arquivo. Verifique o caminho e o formato.")
         return None, None
 
-    etiquetas = selecionar_colunas(df)
-    if etiquetas is None:
+    indices = escolher_colunas(caminho, cabecalho)
+    if indices is None:
         print("Erro ao selecionar colunas. Tente novamente.")
         return None, None
 
-    return etiquetas, df
-
-    etiquetas = selecionar_colunas(df)
-    if etiquetas is None:
-        print("Erro ao selecionar colunas. Tente novamente.")
+    df = carregar_arquivo(caminho, colunas=indices)
+    if df is None:
+        print("Erro ao carregar o arquivo. Verifique o caminho e o formato.")
         return None, None
 
-    return etiquetas, df
\ No newline at end of file
+    etiquetas = montar_etiquetas(df).tolist()
+    print(f"Colunas selecionadas: {[cabecalho[idx] for idx in indices]}")
+    return etiquetas, df
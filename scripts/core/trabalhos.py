@@ -0,0 +1,510 @@
+"""
+Trabalhos de impressão persistidos em disco, com retomada a partir de qualquer etiqueta.
+
+Cada trabalho fica em um diretório próprio:
+    trabalho.json  - identificação, impressora, totais e estado
+    dados.zpl      - o ZPL gerado, gravado uma única vez
+    indice.bin     - para cada bloco ^XA...^XZ: posição no arquivo, primeira etiqueta e quantidade
+    checkpoint     - última etiqueta confirmada como enviada (uma linha por bloco)
+
+O ZPL não é gerado inteiro antes do envio: cada bloco é gravado em dados.zpl e no
+índice no momento em que segue para a impressora, e o checkpoint só é sincronizado
+depois dos blocos que ele cobre. Se o envio falhar, o restante do trabalho é gerado
+e gravado sem ser enviado, para que a retomada tenha todo o ZPL. No CUPS e no IPP,
+que só criam o trabalho quando o envio termina, o checkpoint só avança no fim.
+
+A retomada lê o ZPL já gravado a partir do bloco que contém a etiqueta pedida,
+sem gerar de novo a parte anterior. Dentro de um bloco com ^PQ, a quantidade é
+ajustada para não repetir linhas já enviadas.
+
+Uso:
+    python -m scripts.core.trabalhos listar
+    python -m scripts.core.trabalhos retomar <id> [--a-partir-de N] [--impressora NOME]
+"""
+import bisect
+import json
+import os
+import re
+import time
+from array import array
+
+from scripts.core.zpl_generator import contar_etiquetas
+
+diretorio_trabalhos = os.environ.get(
+    "ETIQUETAS_TRABALHOS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "output", "trabalhos"),
+)
+
+# O checkpoint é sincronizado em disco (fsync) a cada N etiquetas ou T segundos, o que vier antes
+CHECKPOINT_ETIQUETAS = 500
+CHECKPOINT_SEGUNDOS = 2.0
+
+ESTADO_PENDENTE = "pendente"
+ESTADO_IMPRIMINDO = "imprimindo"
+ESTADO_INTERROMPIDO = "interrompido"
+ESTADO_CONCLUIDO = "concluido"
+
+# Situação da gravação do ZPL em dados.zpl
+GRAVACAO_EM_ANDAMENTO = "em_andamento"
+GRAVACAO_INCOMPLETA = "incompleta"
+GRAVACAO_COMPLETA = "completa"
+
+_RE_PQ = re.compile(rb"\^PQ(\d+)")
+# Cada entrada do índice: posição no arquivo, primeira etiqueta e quantidade (3 x uint64)
+_TAMANHO_ENTRADA = array("Q").itemsize * 3
+
+
+class Checkpoint:
+    """
+    Registro da última etiqueta enviada.
+
+    As gravações vão para o buffer do arquivo a cada bloco e só são forçadas para
+    o disco em lotes, então o custo por etiqueta é desprezível. Em uma queda, perde-se
+    no máximo o último lote, e a retomada reenvia essas etiquetas.
+
+    No modo adiado (envios em que o trabalho só passa a existir no fim, como CUPS e IPP),
+    as etiquetas registradas ficam pendentes e só são gravadas por confirmar().
+
+    :param antes_de_sincronizar: Função chamada antes de cada sincronização (ex.: gravar
+        em disco os blocos que o checkpoint vai cobrir).
+    :param adiado: Começa no modo adiado.
+    """
+
+    def __init__(self, caminho, intervalo_etiquetas=CHECKPOINT_ETIQUETAS, intervalo_segundos=CHECKPOINT_SEGUNDOS,
+                 antes_de_sincronizar=None, adiado=False):
+        self.caminho = caminho
+        self.intervalo_etiquetas = intervalo_etiquetas
+        self.intervalo_segundos = intervalo_segundos
+        self.antes_de_sincronizar = antes_de_sincronizar
+        self.adiado = adiado
+        self.pendente = None
+        self.ultima = Checkpoint.ler(caminho)
+        self._sincronizada = self.ultima
+        self._instante = time.monotonic()
+        self._arquivo = open(caminho, "a")
+
+    @staticmethod
+    def ler(caminho):
+        """Última etiqueta registrada no arquivo (0 se não houver)."""
+        try:
+            with open(caminho, "r") as f:
+                linhas = [linha for linha in f.read().splitlines() if linha.strip().isdigit()]
+        except FileNotFoundError:
+            return 0
+        return int(linhas[-1]) if linhas else 0
+
+    def registrar(self, etiqueta):
+        if self.adiado:
+            self.pendente = etiqueta
+            return
+        self.ultima = etiqueta
+        self._arquivo.write(f"{etiqueta}\n")
+        if etiqueta - self._sincronizada >= self.intervalo_etiquetas or \
+                time.monotonic() - self._instante >= self.intervalo_segundos:
+            self.sincronizar()
+
+    def adiar(self):
+        """Passa para o modo adiado (antes de qualquer etiqueta ser registrada no envio)."""
+        self.adiado = True
+
+    def confirmar(self):
+        """Grava as etiquetas pendentes do modo adiado, depois que o envio terminou com sucesso."""
+        if self.adiado and self.pendente is not None:
+            self.adiado = False
+            self.registrar(self.pendente)
+        self.pendente = None
+
+    def sincronizar(self):
+        if self.antes_de_sincronizar:
+            self.antes_de_sincronizar()
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._sincronizada = self.ultima
+        self._instante = time.monotonic()
+
+    def fechar(self):
+        if not self._arquivo.closed:
+            self.sincronizar()
+            self._arquivo.close()
+
+
+class _Gravacao:
+    """
+    Grava os blocos de um trabalho em dados.zpl e no índice à medida que são gerados.
+
+    :param trabalho: Trabalho cujos arquivos recebem os blocos.
+    :param blocos: Iterável de blocos ZPL em bytes.
+    :param pular: Etiquetas já gravadas (retomada da gravação com o ZPL gerado de novo).
+        Os blocos com essas etiquetas são pulados; blocos de formato (^DF) nunca são,
+        pois a nova geração pode incluir um formato que a primeira não precisou enviar.
+    """
+
+    def __init__(self, trabalho, blocos, pular=0):
+        self.trabalho = trabalho
+        self.blocos = iter(blocos)
+        self.pular = pular
+        self.falhou = False
+        self._dados = open(trabalho._caminho("dados.zpl"), "ab")
+        self._indice = open(trabalho._caminho("indice.bin"), "ab")
+
+    def __iter__(self):
+        """Grava cada bloco antes de entregá-lo, com a primeira etiqueta e a quantidade que ele contém."""
+        dados = self.trabalho.dados
+        while not self.falhou:
+            try:
+                bloco = next(self.blocos)
+            except StopIteration:
+                return
+            except BaseException:
+                # O gerador não continua depois de um erro: o trabalho fica com a gravação incompleta
+                self.falhou = True
+                raise
+            etiquetas = contar_etiquetas(bloco)
+            if self.pular > 0 and (etiquetas or b"^DF" not in bloco):
+                self.pular -= etiquetas
+                continue
+            inicial = dados["total_etiquetas"] + 1
+            self._dados.write(bloco)
+            array("Q", (dados["bytes"], inicial, etiquetas)).tofile(self._indice)
+            dados["bytes"] += len(bloco)
+            dados["total_etiquetas"] += etiquetas
+            dados["total_blocos"] += 1
+            yield bloco, inicial, etiquetas
+
+    def sincronizar(self):
+        """Força para o disco o ZPL e depois o índice (o índice nunca aponta para dados perdidos)."""
+        for arquivo in (self._dados, self._indice):
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+
+    def concluir(self):
+        """Grava o que faltar do gerador e fecha os arquivos."""
+        try:
+            for _ in self:
+                pass
+        finally:
+            self.sincronizar()
+            self._dados.close()
+            self._indice.close()
+            self.trabalho.dados["gravacao"] = GRAVACAO_INCOMPLETA if self.falhou else GRAVACAO_COMPLETA
+            self.trabalho._gravacao = None
+            self.trabalho.salvar()
+
+
+class Trabalho:
+    """Trabalho de impressão gravado em disco."""
+
+    def __init__(self, diretorio, dados):
+        self.diretorio = diretorio
+        self.dados = dados
+        self._gravacao = None
+
+    @property
+    def id(self):
+        return self.dados["id"]
+
+    @property
+    def gravando(self):
+        """Ainda há blocos do gerador a gravar."""
+        return self._gravacao is not None
+
+    @property
+    def gravacao_completa(self):
+        return self.dados.get("gravacao", GRAVACAO_COMPLETA) == GRAVACAO_COMPLETA
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def salvar(self):
+        temporario = self._caminho("trabalho.json.tmp")
+        with open(temporario, "w") as f:
+            json.dump(self.dados, f, indent=4, ensure_ascii=False)
+        os.replace(temporario, self._caminho("trabalho.json"))
+
+    def atualizar_estado(self, estado):
+        self.dados["estado"] = estado
+        self.dados["atualizado_em"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.salvar()
+
+    @classmethod
+    def criar(cls, blocos, impressora, descricao="", diretorio_base=None):
+        """
+        Cria o trabalho em disco. Os blocos são consumidos e gravados por
+        imprimir_trabalho, à medida que são enviados (ou por gravar(), sem enviar).
+
+        :param blocos: Iterável de blocos ZPL em bytes (ex.: iter_zpl).
+        :param impressora: Impressora de destino.
+        :param descricao: Texto livre para identificar o trabalho (modelo, arquivo de origem...).
+        :return: Trabalho criado.
+        """
+        id_trabalho = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}"
+        diretorio = os.path.join(diretorio_base or diretorio_trabalhos, id_trabalho)
+        os.makedirs(diretorio)
+        for nome in ("dados.zpl", "indice.bin"):
+            open(os.path.join(diretorio, nome), "wb").close()
+
+        trabalho = cls(diretorio, {
+            "id": id_trabalho,
+            "impressora": impressora,
+            "descricao": descricao,
+            "total_etiquetas": 0,
+            "total_blocos": 0,
+            "bytes": 0,
+            "gravacao": GRAVACAO_EM_ANDAMENTO,
+            "estado": ESTADO_PENDENTE,
+            "criado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        trabalho.salvar()
+        trabalho._gravacao = _Gravacao(trabalho, blocos)
+        return trabalho
+
+    @classmethod
+    def abrir(cls, id_trabalho, diretorio_base=None):
+        diretorio = os.path.join(diretorio_base or diretorio_trabalhos, id_trabalho)
+        with open(os.path.join(diretorio, "trabalho.json"), "r") as f:
+            return cls(diretorio, json.load(f))
+
+    def _recuperar_gravacao(self):
+        """
+        Ajusta os arquivos de uma gravação que parou no meio (queda do processo) à parte que está íntegra.
+
+        O último bloco indexado é descartado (o fim dele não é conhecido) e o índice é
+        cortado no primeiro bloco que aponta para além do que chegou a dados.zpl.
+        """
+        with open(self._caminho("indice.bin"), "rb") as f:
+            conteudo = f.read()
+        indice = array("Q")
+        indice.frombytes(conteudo[:len(conteudo) - len(conteudo) % _TAMANHO_ENTRADA])
+        tamanho = os.path.getsize(self._caminho("dados.zpl"))
+        blocos = max(len(indice) // 3 - 1, 0)
+        while blocos and indice[blocos * 3] > tamanho:
+            blocos -= 1
+        fim = indice[blocos * 3] if indice else 0
+        with open(self._caminho("dados.zpl"), "r+b") as f:
+            f.truncate(fim)
+        with open(self._caminho("indice.bin"), "r+b") as f:
+            f.truncate(blocos * _TAMANHO_ENTRADA)
+        self.dados["bytes"] = fim
+        self.dados["total_blocos"] = blocos
+        self.dados["total_etiquetas"] = indice[blocos * 3 + 1] - 1 if indice else 0
+
+    def retomar_gravacao(self, blocos):
+        """
+        Continua uma gravação interrompida com o ZPL gerado de novo desde o início.
+
+        :param blocos: Os mesmos blocos que o trabalho recebeu em criar(); os já gravados são pulados.
+        """
+        if self.dados.get("gravacao") == GRAVACAO_EM_ANDAMENTO:
+            self._recuperar_gravacao()
+        self.dados["gravacao"] = GRAVACAO_EM_ANDAMENTO
+        self.salvar()
+        self._gravacao = _Gravacao(self, blocos, pular=self.dados["total_etiquetas"])
+
+    def gravar(self):
+        """Grava em disco os blocos que ainda não foram gravados, sem enviá-los."""
+        if self._gravacao is not None:
+            self._gravacao.concluir()
+
+    @property
+    def ultima_enviada(self):
+        return Checkpoint.ler(self._caminho("checkpoint"))
+
+    def _indice(self):
+        indice = array("Q")
+        with open(self._caminho("indice.bin"), "rb") as f:
+            indice.frombytes(f.read())
+        return indice[0::3], indice[1::3], indice[2::3]
+
+    def iter_blocos(self, a_partir_de=1):
+        """
+        Lê os blocos do trabalho a partir da etiqueta `a_partir_de` (a partir de 1).
+
+        Blocos de gravação de formato (^DF) anteriores ao ponto de retomada são
+        reenviados, pois a impressora pode ter sido reiniciada.
+
+        :return: Iterador de tuplas (bloco, última etiqueta do bloco).
+        """
+        posicoes, iniciais, quantidades = self._indice()
+        total_blocos = len(posicoes)
+        inicio = max(bisect.bisect_right(iniciais, a_partir_de) - 1, 0)
+
+        with open(self._caminho("dados.zpl"), "rb") as f:
+            for numero in range(inicio):
+                if quantidades[numero] == 0:
+                    f.seek(posicoes[numero])
+                    fim = posicoes[numero + 1] if numero + 1 < total_blocos else self.dados["bytes"]
+                    bloco = f.read(fim - posicoes[numero])
+                    if b"^DF" in bloco:
+                        yield bloco, iniciais[numero] - 1
+
+            for numero in range(inicio, total_blocos):
+                f.seek(posicoes[numero])
+                fim = posicoes[numero + 1] if numero + 1 < total_blocos else self.dados["bytes"]
+                bloco = f.read(fim - posicoes[numero])
+                ultima = iniciais[numero] + quantidades[numero] - 1
+                if numero == inicio and quantidades[numero] and a_partir_de > iniciais[numero]:
+                    bloco = _ajustar_quantidade(bloco, a_partir_de - iniciais[numero])
+                yield bloco, ultima
+
+
+def _ajustar_quantidade(bloco, ja_enviadas):
+    """
+    Reduz o ^PQ de um bloco para pular as linhas já impressas.
+
+    A retomada dentro de um bloco acontece no início da linha que contém a etiqueta,
+    pois uma linha de várias colunas é impressa de uma vez.
+    """
+    encontrado = _RE_PQ.search(bloco)
+    if not encontrado:
+        return bloco
+    por_linha = bloco.count(b"^FD")
+    quantidade = int(encontrado.group(1))
+    restantes = quantidade - ja_enviadas // por_linha
+    return bloco[:encontrado.start()] + b"^PQ%d" % restantes + bloco[encontrado.end():]
+
+
+def _recortar(bloco, inicial, quantidade, a_partir_de):
+    """Parte de um bloco recém-gerado a enviar numa retomada a partir de `a_partir_de` (None se nada)."""
+    if quantidade == 0:
+        return bloco if inicial >= a_partir_de or b"^DF" in bloco else None
+    if inicial + quantidade - 1 < a_partir_de:
+        return None
+    if inicial < a_partir_de:
+        return _ajustar_quantidade(bloco, a_partir_de - inicial)
+    return bloco
+
+
+def _blocos_com_checkpoint(trabalho, a_partir_de, checkpoint):
+    """
+    Entrega os blocos para o envio e registra cada um assim que o seguinte é pedido (ou seja, já foi enviado).
+
+    Primeiro vêm os blocos já gravados; depois, se o trabalho ainda está sendo gerado,
+    os novos, gravados em disco um a um antes de seguir para o envio.
+    """
+    for bloco, ultima in trabalho.iter_blocos(a_partir_de):
+        yield bloco
+        if ultima > checkpoint.ultima:
+            checkpoint.registrar(ultima)
+    if trabalho.gravando:
+        for bloco, inicial, quantidade in trabalho._gravacao:
+            bloco = _recortar(bloco, inicial, quantidade, a_partir_de)
+            if bloco is None:
+                continue
+            yield bloco
+            ultima = inicial + quantidade - 1
+            if ultima > checkpoint.ultima:
+                checkpoint.registrar(ultima)
+
+
+def imprimir_trabalho(trabalho, impressora=None, a_partir_de=None, enviar=None, por_bloco=True):
+    """
+    Envia um trabalho, registrando o progresso no checkpoint.
+
+    :param trabalho: Trabalho a enviar.
+    :param impressora: Impressora de destino (padrão: a do trabalho).
+    :param a_partir_de: Primeira etiqueta a enviar (padrão: a seguinte ao checkpoint).
+    :param enviar: Função de envio (padrão: transporte.enviar).
+    :param por_bloco: A função de envio entrega cada bloco à impressora ao pedir o seguinte.
+        Se não, o checkpoint só avança quando o envio termina com sucesso. Com o envio
+        padrão, vale o backend da impressora (ver transporte.entrega_por_bloco).
+    :return: True se o trabalho foi enviado até o fim.
+    """
+    impressora = impressora or trabalho.dados["impressora"]
+    antes_do_cups = None
+    if enviar is None:
+        from scripts.utils import transporte
+
+        por_bloco = transporte.entrega_por_bloco(impressora)
+
+        def enviar(impressora, blocos):
+            return transporte.enviar(impressora, blocos, antes_do_cups=antes_do_cups)
+
+    if a_partir_de is None:
+        a_partir_de = trabalho.ultima_enviada + 1
+    if not trabalho.gravando:
+        if not trabalho.gravacao_completa:
+            if trabalho.dados["gravacao"] == GRAVACAO_INCOMPLETA:
+                print(f"[ERRO] A geração do trabalho {trabalho.id} falhou após a etiqueta "
+                      f"{trabalho.dados['total_etiquetas']}; gere o trabalho de novo para retomá-lo.\n")
+            else:
+                print(f"[ERRO] A gravação do trabalho {trabalho.id} não terminou (o processo foi interrompido); "
+                      f"gere o trabalho de novo para retomá-lo.\n")
+            trabalho.atualizar_estado(ESTADO_INTERROMPIDO)
+            return False
+        if a_partir_de > trabalho.dados["total_etiquetas"]:
+            print(f"[LOG] Trabalho {trabalho.id} já foi enviado por completo.\n")
+            trabalho.atualizar_estado(ESTADO_CONCLUIDO)
+            return True
+        total = f" de {trabalho.dados['total_etiquetas']}"
+    else:
+        total = ""
+
+    print(f"[LOG] Enviando trabalho {trabalho.id} para '{impressora}' a partir da etiqueta {a_partir_de}{total}.\n")
+    trabalho.atualizar_estado(ESTADO_IMPRIMINDO)
+    gravacao = trabalho._gravacao
+    checkpoint = Checkpoint(trabalho._caminho("checkpoint"),
+                            antes_de_sincronizar=gravacao.sincronizar if gravacao else None, adiado=not por_bloco)
+    # Se a conexão crua falhar e o envio seguir pelo CUPS, o progresso só vale no fim
+    antes_do_cups = checkpoint.adiar
+    try:
+        enviar(impressora, _blocos_com_checkpoint(trabalho, a_partir_de, checkpoint))
+    except Exception as e:
+        checkpoint.fechar()
+        _gravar_restante(trabalho)
+        trabalho.atualizar_estado(ESTADO_INTERROMPIDO)
+        print(f"[ERRO] Trabalho {trabalho.id} interrompido após a etiqueta {checkpoint.ultima}: {e}")
+        print(f"[LOG] Para retomar: python -m scripts.core.trabalhos retomar {trabalho.id}\n")
+        return False
+    checkpoint.confirmar()
+    checkpoint.fechar()
+    trabalho.gravar()
+    trabalho.atualizar_estado(ESTADO_CONCLUIDO)
+    print(f"[LOG] Trabalho {trabalho.id} enviado com sucesso.\n")
+    return True
+
+
+def _gravar_restante(trabalho):
+    """Depois de uma falha no envio, grava o ZPL que faltou para a retomada ter o trabalho inteiro."""
+    try:
+        trabalho.gravar()
+    except Exception as e:
+        print(f"[ERRO] Não foi possível gerar o restante do trabalho {trabalho.id}: {e}")
+
+
+def listar_trabalhos(diretorio_base=None):
+    """Lista os trabalhos gravados, dos mais recentes para os mais antigos."""
+    diretorio_base = diretorio_base or diretorio_trabalhos
+    if not os.path.isdir(diretorio_base):
+        return []
+    trabalhos = []
+    for nome in sorted(os.listdir(diretorio_base), reverse=True):
+        try:
+            trabalhos.append(Trabalho.abrir(nome, diretorio_base))
+        except (OSError, ValueError):
+            continue
+    return trabalhos
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lista e retoma trabalhos de impressão.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    subcomandos.add_parser("listar", help="Lista os trabalhos gravados.")
+    retomar = subcomandos.add_parser("retomar", help="Retoma um trabalho interrompido.")
+    retomar.add_argument("id", help="Identificador do trabalho.")
+    retomar.add_argument("--a-partir-de", type=int, default=None, help="Etiqueta inicial (padrão: após o checkpoint).")
+    retomar.add_argument("--impressora", default=None, help="Envia para outra impressora.")
+    args = parser.parse_args()
+
+    if args.comando == "listar":
+        for trabalho in listar_trabalhos():
+            dados = trabalho.dados
+            print(f"{trabalho.id}  {dados['estado']:<12}  {trabalho.ultima_enviada}/{dados['total_etiquetas']} "
+                  f"etiquetas  {dados['impressora']}  {dados.get('descricao', '')}")
+    else:
+        imprimir_trabalho(Trabalho.abrir(args.id), args.impressora, args.a_partir_de)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,355 @@
-import subprocess
+import io
 import os
+import itertools
+import json
 import logging
+import re
+import zlib
+
+from scripts.utils import metricas
 
 # Configuração de logging
 logging.basicConfig(filename="impressao.log", level=logging.INFO)
 
-def gerar_zpl(etiquetas, modelo, copias):
-    largura = modelo["largura"]
-    altura = modelo["altura"]
-    espaco = modelo["espaco"]
-    colunas = modelo["colunas"]
-    largura_total = modelo["largura_total"]
-    posicoes_horizontais = modelo["posicoes_horizontais"]
+# Estratégias de cópias aceitas por iter_zpl/gerar_zpl
+COPIAS_INTERCALADAS = "intercalado"  # 1, 2, 3, 1, 2, 3 (lote completo repetido)
+COPIAS_AGRUPADAS = "agrupado"  # 1, 1, 2, 2, 3, 3 (cópias de cada etiqueta juntas)
+
+
+def _sequencia_impressao(etiquetas, copias, modo_copias):
+    """
+    Percorre as etiquetas na ordem de impressão sem materializar `etiquetas * copias`.
+
+    :param etiquetas: Lista (ou iterável) de textos das etiquetas.
+    :param copias: Número de cópias de cada etiqueta.
+    :param modo_copias: COPIAS_INTERCALADAS ou COPIAS_AGRUPADAS.
+    :return: Iterador com as etiquetas na ordem de impressão.
+    """
+    if modo_copias == COPIAS_AGRUPADAS:
+        return itertools.chain.from_iterable(
+            itertools.repeat(etiqueta, copias) for etiqueta in etiquetas
+        )
+    if modo_copias != COPIAS_INTERCALADAS:
+        raise ValueError(f"Modo de cópias inválido: {modo_copias}")
+    if copias > 1 and iter(etiquetas) is etiquetas:
+        # Iteradores só podem ser percorridos uma vez; guardamos para as cópias seguintes.
+        # Fontes que podem ser relidas (ex.: loader.FonteEtiquetas) não são materializadas.
+        etiquetas = list(etiquetas)
+    return itertools.chain.from_iterable(itertools.repeat(etiquetas, copias))
+
+
+def _linhas_com_quantidade(sequencia, colunas):
+    """
+    Agrupa a sequência em linhas de `colunas` etiquetas e junta linhas idênticas consecutivas.
+
+    Linhas repetidas viram um único formato com ^PQ, em vez de um formato por linha.
+
+    :return: Iterador de tuplas (linha, quantidade).
+    """
+    anterior = None
+    quantidade = 0
+    sequencia = iter(sequencia)
+    while True:
+        linha = tuple(itertools.islice(sequencia, colunas))
+        if not linha:
+            break
+        if linha == anterior:
+            quantidade += 1
+            continue
+        if anterior is not None:
+            yield anterior, quantidade
+        anterior, quantidade = linha, 1
+    if anterior is not None:
+        yield anterior, quantidade
+
+
+def iter_zpl(etiquetas, modelo, copias=1, modo_copias=COPIAS_INTERCALADAS):
+    """
+    Gera o código ZPL bloco a bloco, um ^XA...^XZ por linha de etiquetas.
+
+    Cada bloco é entregue assim que fica completo, de modo que o envio para o
+    arquivo ou para a impressora pode começar enquanto a geração continua.
+    Linhas idênticas consecutivas (por exemplo, as cópias de uma mesma etiqueta
+    no modo agrupado) são enviadas uma única vez com ^PQ.
+
+    :param etiquetas: Lista (ou iterável) de textos das etiquetas.
+    :param modelo: Modelo de etiqueta do etiquetas_config.json (dicionário ou ModeloCompilado).
+    :param copias: Número de cópias de cada etiqueta.
+    :param modo_copias: COPIAS_INTERCALADAS (lote completo repetido, padrão) ou
+        COPIAS_AGRUPADAS (cópias de cada etiqueta lado a lado nas colunas e em sequência).
+    :return: Iterador de blocos ZPL em bytes (UTF-8, conforme ^CI28).
+    """
+    return metricas.medir_iteracao(
+        "geracao_zpl", _blocos_zpl(etiquetas, modelo, copias, modo_copias), contar_etiquetas
+    )
+
+
+# Fragmentos fixos de cada bloco, já codificados
+_FIM_CAMPO = b"^FS\n"
+_FIM_BLOCO = b"^XZ\n"
+_QUANTIDADE = b"^PQ%d\n"
+
+Y_CAMPO = 30
+
+
+class ModeloCompilado:
+    """
+    Modelo de etiqueta pronto para a geração: geometria e trechos fixos do ZPL já em bytes.
+
+    Imutável; criado por compilar_modelo e compartilhado por todas as gerações que
+    usam a mesma configuração.
+    """
+
+    __slots__ = (
+        "assinatura", "largura", "altura", "colunas", "largura_total", "posicoes",
+        "cabecalho", "posicionamentos", "prefixos", "nome_formato", "prefixos_formato",
+    )
+
+    def __init__(self, modelo, assinatura):
+        definir = super().__setattr__
+        largura = int(modelo["largura"])
+        colunas = int(modelo["colunas"])
+        posicoes = tuple(modelo["posicoes_horizontais"])
+        posicionamentos = tuple(
+            f"^FO{x_atual},{Y_CAMPO}^FB{largura},5,L,10,0^A0N,30,20".encode("ascii") for x_atual in posicoes
+        )
+        definir("assinatura", assinatura)
+        definir("largura", largura)
+        definir("altura", int(modelo["altura"]))
+        definir("colunas", colunas)
+        definir("largura_total", int(modelo["largura_total"]))
+        definir("posicoes", posicoes)
+        definir("cabecalho", f"^XA\n^PW{self.largura_total}\n^LL{self.altura}\n^CI28\n".encode("ascii"))
+        definir("posicionamentos", posicionamentos)
+        definir("prefixos", tuple(posicionamento + b"^FD" for posicionamento in posicionamentos))
+        # Nomes de objetos ZPL têm no máximo 8 caracteres (mais a extensão)
+        definir("nome_formato", f"{zlib.crc32(assinatura):08X}.ZPL")
+        definir("prefixos_formato", tuple(b"^FN%d^FD" % coluna for coluna in range(1, colunas + 1)))
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError("ModeloCompilado é imutável.")
+
+    def __delattr__(self, nome):
+        raise AttributeError("ModeloCompilado é imutável.")
+
+    def __repr__(self):
+        return (f"ModeloCompilado({self.nome_formato}, {self.largura_total}x{self.altura} dots, "
+                f"{self.colunas} coluna(s))")
+
+
+# Modelos compilados, pela assinatura (JSON canônico) da configuração
+_cache_compilados = {}
+
+
+def compilar_modelo(modelo):
+    """
+    Compila um modelo do etiquetas_config.json, reaproveitando a compilação de configurações idênticas.
+
+    :param modelo: Dicionário do modelo ou ModeloCompilado (devolvido como está).
+    :return: ModeloCompilado.
+    """
+    if isinstance(modelo, ModeloCompilado):
+        return modelo
+    assinatura = json.dumps(modelo, sort_keys=True).encode("utf-8")
+    compilado = _cache_compilados.get(assinatura)
+    if compilado is None:
+        compilado = _cache_compilados[assinatura] = ModeloCompilado(modelo, assinatura)
+    return compilado
+
+
+def _codificar(etiqueta):
+    return etiqueta.encode("utf-8") if isinstance(etiqueta, str) else str(etiqueta).encode("utf-8")
+
+
+def _preencher(buffer, linhas, cabecalho, prefixos, fim_campo=_FIM_CAMPO, quantidade_fmt=_QUANTIDADE):
+    """
+    Acrescenta ao buffer um bloco ^XA...^XZ por linha e cede o controle após cada bloco.
+
+    O chamador decide o que fazer com o buffer entre um bloco e outro (entregar o
+    bloco, esvaziar para o destino ou continuar acumulando).
+    """
+    for linha, quantidade in linhas:
+        buffer += cabecalho
+        for prefixo, etiqueta in zip(prefixos, linha):
+            buffer += prefixo
+            buffer += _codificar(etiqueta)
+            buffer += fim_campo
+        if quantidade > 1:
+            buffer += quantidade_fmt % quantidade
+        buffer += _FIM_BLOCO
+        yield
+
+
+def _blocos_zpl(etiquetas, modelo, copias, modo_copias):
+    modelo = compilar_modelo(modelo)
+    linhas = _linhas_com_quantidade(_sequencia_impressao(etiquetas, copias, modo_copias), modelo.colunas)
+    buffer = bytearray()
+    for _ in _preencher(buffer, linhas, modelo.cabecalho, modelo.prefixos):
+        yield bytes(buffer)
+        del buffer[:]
+
+
+def escrever_zpl(etiquetas, modelo, destino, copias=1, modo_copias=COPIAS_INTERCALADAS, limite_buffer=64 * 1024,
+                 descarregar=False):
+    """
+    Gera o ZPL direto em um buffer reutilizável e o descarrega no destino a cada `limite_buffer` bytes.
+
+    Não cria um objeto bytes por bloco: o buffer vai para o destino como memoryview,
+    sem cópias intermediárias.
+
+    :param destino: Arquivo aberto em modo binário (ou qualquer objeto com write) ou socket conectado.
+    :param limite_buffer: Bytes acumulados antes de cada escrita (0 escreve a cada bloco).
+    :param descarregar: Chama destino.flush() após cada escrita, para o ZPL sair assim que
+        é gerado (ex.: etiquetas lidas de um pipe).
+    :return: Número de bytes escritos.
+    """
+    escrever = destino.sendall if hasattr(destino, "sendall") else destino.write
+    if descarregar and hasattr(destino, "flush"):
+        escrever_direto = escrever
+
+        def escrever(dados):
+            escrever_direto(dados)
+            destino.flush()
+
+    modelo = compilar_modelo(modelo)
+    linhas = _linhas_com_quantidade(_sequencia_impressao(etiquetas, copias, modo_copias), modelo.colunas)
+    buffer = bytearray()
+    total = 0
+    with metricas.etapa("escrita_zpl"):
+        for _ in _preencher(buffer, linhas, modelo.cabecalho, modelo.prefixos):
+            if len(buffer) >= limite_buffer:
+                with memoryview(buffer) as visao:
+                    escrever(visao)
+                total += len(buffer)
+                del buffer[:]
+        if buffer:
+            with memoryview(buffer) as visao:
+                escrever(visao)
+            total += len(buffer)
+    metricas.incrementar("escrita_zpl_bytes", total)
+    return total
+
+
+def gerar_zpl(etiquetas, modelo, copias, modo_copias=COPIAS_INTERCALADAS):
+    """
+    Gera o código ZPL completo como string (atalho sobre escrever_zpl).
+
+    :return: Código ZPL das etiquetas.
+    """
+    destino = io.BytesIO()
+    escrever_zpl(etiquetas, modelo, destino, copias, modo_copias)
+    return destino.getvalue().decode("utf-8")
+
+_RE_QUANTIDADE = re.compile(rb"\^PQ(\d+)")
+
+
+def contar_etiquetas(bloco):
+    """
+    Conta quantas etiquetas um bloco ^XA...^XZ imprime (campos ^FD vezes a quantidade do ^PQ).
+
+    Blocos que só gravam formatos (^DF) não imprimem nada e contam zero.
+    """
+    campos = bloco.count(b"^FD")
+    if not campos:
+        return 0
+    quantidade = _RE_QUANTIDADE.search(bloco)
+    return campos * (int(quantidade.group(1)) if quantidade else 1)
+
+
+class SessaoFormatos:
+    """
+    Controla quais formatos armazenados (^DF) já foram enviados para uma impressora.
+
+    Mantenha uma sessão por impressora enquanto a conexão estiver ativa; se a
+    impressora for reiniciada a memória R: é apagada e a sessão deve ser limpa.
+    """
+
+    def __init__(self, dispositivo="R:"):
+        self.dispositivo = dispositivo
+        self.formatos = set()
+
+    def contem(self, nome_formato):
+        return nome_formato in self.formatos
+
+    def registrar(self, nome_formato):
+        self.formatos.add(nome_formato)
+
+    def limpar(self):
+        self.formatos.clear()
 
-    zpl_code = ""
-    linha_atual = 0
 
-    for idx, etiqueta in enumerate(etiquetas * copias):
-        coluna_atual = idx % colunas
-        linha_atual = idx // colunas
+def nome_formato(modelo):
+    """
+    Gera o nome do formato armazenado de um modelo.
+
+    O nome deriva da geometria do modelo, então alterar o etiquetas_config.json
+    gera um novo formato em vez de reaproveitar um desatualizado na impressora.
+    São os 8 dígitos hexadecimais do CRC-32 da configuração, o limite de um nome de
+    objeto no ZPL, com a extensão .ZPL.
+    """
+    return compilar_modelo(modelo).nome_formato
+
+
+def gerar_formato_armazenado(modelo, nome, dispositivo="R:"):
+    """
+    Gera o bloco ^DF que grava o layout do modelo na memória da impressora.
+
+    Cada coluna do modelo vira um campo ^FN (^FN1 para a primeira coluna, ^FN2 para a segunda...).
 
-        if coluna_atual == 0:
-            if idx > 0:
-                zpl_code += "^XZ\n"
-            zpl_code += f"^XA\n^PW{int(largura_total)}\n^LL{int(altura)}\n^CI28\n"
+    :return: Bloco ZPL em bytes.
+    """
+    modelo = compilar_modelo(modelo)
+    bloco = bytearray(f"^XA\n^CI28\n^DF{dispositivo}{nome}^FS\n".encode("utf-8"))
+    bloco += modelo.cabecalho[len(b"^XA\n"):]
+    for coluna in range(modelo.colunas):
+        bloco += modelo.posicionamentos[coluna] + b"^FN%d^FS\n" % (coluna + 1)
+    bloco += _FIM_BLOCO
+    return bytes(bloco)
+
+
+def iter_zpl_formato(etiquetas, modelo, copias=1, modo_copias=COPIAS_INTERCALADAS, sessao=None):
+    """
+    Gera o ZPL usando formato armazenado: o layout vai uma vez (^DF) e cada linha só leva os dados (^XF/^FN).
+
+    :param etiquetas: Lista (ou iterável) de textos das etiquetas.
+    :param modelo: Modelo de etiqueta do etiquetas_config.json (dicionário ou ModeloCompilado).
+    :param copias: Número de cópias de cada etiqueta.
+    :param modo_copias: COPIAS_INTERCALADAS ou COPIAS_AGRUPADAS (ver iter_zpl).
+    :param sessao: SessaoFormatos da impressora de destino. O formato só é enviado
+        se ainda não estiver registrado nela. Se None, o formato é sempre enviado.
+    :return: Iterador de blocos ZPL em bytes.
+    """
+    return metricas.medir_iteracao(
+        "geracao_zpl", _blocos_zpl_formato(etiquetas, modelo, copias, modo_copias, sessao), contar_etiquetas
+    )
 
-        x_atual = posicoes_horizontais[coluna_atual]
-        y_atual = 30
 
-        zpl_code += f"^FO{x_atual},{y_atual}^FB{int(largura)},5,L,10,0^A0N,30,20^FD{etiqueta}^FS\n"
+def _blocos_zpl_formato(etiquetas, modelo, copias, modo_copias, sessao):
+    if sessao is None:
+        sessao = SessaoFormatos()
+    modelo = compilar_modelo(modelo)
+    nome = modelo.nome_formato
+    recuperar = f"^XA^XF{sessao.dispositivo}{nome}^FS".encode("utf-8")
+
+    if not sessao.contem(nome):
+        yield gerar_formato_armazenado(modelo, nome, sessao.dispositivo)
+        sessao.registrar(nome)
+
+    linhas = _linhas_com_quantidade(_sequencia_impressao(etiquetas, copias, modo_copias), modelo.colunas)
+    buffer = bytearray()
+    for _ in _preencher(buffer, linhas, recuperar, modelo.prefixos_formato, b"^FS", b"^PQ%d"):
+        yield bytes(buffer)
+        del buffer[:]
 
-    zpl_code += "^XZ\n"
-    return zpl_code
 
 def listar_impressoras():
     """
-    Lista impressoras disponíveis no macOS.
+    Lista impressoras disponíveis (filas do CUPS e impressoras configuradas).
     :return: Lista de impressoras disponíveis ou None se não houver impressoras.
     """
-    try:
-        print("Executando comando lpstat para listar impressoras...")
-        resultado = subprocess.check_output("lpstat -p", shell=True, text=True)
-        impressoras = []
-        for linha in resultado.split("\n"):
-            print(f"Depuração linha: {linha}")  # Linha de depuração
-            if "impressora" in linha:
-                nome = linha.split()[1]
-                impressoras.append(nome)
-        return impressoras if impressoras else None
-    except subprocess.CalledProcessError as e:
-        print(f"Erro ao listar impressoras: {e}")
-        return None
+    from scripts.utils.printer import listar_impressoras as listar
+
+    return listar()
 
 
 def selecionar_impressora():
@@ -75,11 +374,12 @@ def selecionar_impressora():
         return impressora_manual if impressora_manual else None
 
 
+@metricas.cronometrar("gravacao_temporario")
 def salvar_zpl_temp(zpl_code, arquivo_temp=None):
     """
     Salva o ZPL em um arquivo temporário ou no caminho especificado, sobrescrevendo o arquivo anterior.
     
-    :param zpl_code: O código ZPL gerado.
+    :param zpl_code: O código ZPL gerado (string) ou um iterável de blocos em bytes (ver iter_zpl).
     :param arquivo_temp: Caminho do arquivo temporário. Se None, cria um arquivo temporário.
     :return: Caminho do arquivo salvo.
     """
@@ -88,9 +388,13 @@ def salvar_zpl_temp(zpl_code, arquivo_temp=None):
             # Define o caminho para o arquivo temporário que será sobrescrito a cada nova geração
             arquivo_temp = "/Applications/MAMP/htdocs/ZPL_estudos/etiqueta_temp.zpl"
 
-        # Sobrescreve o arquivo temporário com o novo código ZPL
-        with open(arquivo_temp, "w") as f:
-            f.write(zpl_code)
+        if isinstance(zpl_code, str):
+            zpl_code = [zpl_code.encode("utf-8")]
+
+        # Sobrescreve o arquivo temporário gravando cada bloco assim que é gerado
+        with open(arquivo_temp, "wb") as f:
+            for bloco in zpl_code:
+                f.write(bloco)
         
         print(f"Arquivo ZPL salvo em: {arquivo_temp}")
         return arquivo_temp
@@ -99,28 +403,38 @@ def salvar_zpl_temp(zpl_code, arquivo_temp=None):
         return None
 
 
+def _ler_blocos(arquivo_zpl, tamanho=64 * 1024):
+    with open(arquivo_zpl, "rb") as f:
+        while True:
+            bloco = f.read(tamanho)
+            if not bloco:
+                break
+            yield bloco
+
+
 def imprimir_zpl(arquivo_zpl, impressora):
     """
     Envia o código ZPL diretamente para a impressora selecionada.
+
+    Usa o transporte configurado para a impressora (socket 9100 com conexões
+    persistentes ou a fila do CUPS como alternativa).
+
     :param arquivo_zpl: Caminho para o arquivo ZPL.
     :param impressora: Nome da impressora selecionada.
     """
+    from scripts.utils.transporte import ErroTransporte, enviar
+
     if not os.path.exists(arquivo_zpl) or os.path.getsize(arquivo_zpl) == 0:
         print(f"Erro: Arquivo ZPL '{arquivo_zpl}' não encontrado ou está vazio.")
         return False
 
-    comando = f"lp -d {impressora} -o raw {arquivo_zpl}"
     try:
-        print(f"Executando comando: {comando}")
-        resultado = subprocess.run(comando, shell=True, check=True)
-        if resultado.returncode == 0:
-            print(f"Impressão enviada com sucesso para a impressora '{impressora}'.")
-            return True
-        else:
-            print(f"Erro ao enviar para a impressora '{impressora}'. Código de retorno: {resultado.returncode}")
-            return False
-    except subprocess.CalledProcessError as e:
-        print(f"Erro ao executar o comando lp: {e}")
+        print(f"Enviando '{arquivo_zpl}' para a impressora '{impressora}'...")
+        enviar(impressora, _ler_blocos(arquivo_zpl))
+        print(f"Impressão enviada com sucesso para a impressora '{impressora}'.")
+        return True
+    except ErroTransporte as e:
+        print(f"Erro ao enviar para a impressora '{impressora}': {e}")
         return False
 
 
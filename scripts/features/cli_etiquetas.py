@@ -0,0 +1,227 @@
+"""
+Linha de comando não interativa para gerar e imprimir etiquetas.
+
+Todas as escolhas do fluxo interativo (modelo, arquivo, colunas, intervalo, cópias
+e impressora) viram argumentos, o que permite rodar pelo cron ou em paralelo com
+`xargs -P`. Sem --impressora, o ZPL vai para a saída padrão (ou para --saida);
+as mensagens de log vão sempre para stderr.
+
+Exemplos:
+    python run.py --modelo Etiqueta_33x22mm --arquivo dados.csv --colunas SKU,1 --intervalo 1-500 \\
+        --copias 2 --impressora Datamax_M4206_MarkII
+    python run.py --modelo Etiqueta_33x22mm --etiqueta "Caixa 1" --etiqueta "Caixa 2" > caixas.zpl
+    cat registros.jsonl | python run.py --modelo Etiqueta_33x22mm --stdin jsonl --colunas sku,nome | nc impressora 9100
+
+Na entrada padrão, JSONL aceita uma etiqueta por linha como texto ou objeto (as
+colunas são as chaves); CSV deve ter cabeçalho. Em ambos, --colunas escolhe e
+ordena os campos (nomes ou índices a partir de 0). O ZPL de cada linha de etiquetas
+é escrito assim que a linha seguinte chega (linhas iguais viram um ^PQ), sem esperar
+o fim da entrada.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+
+from scripts.core.config import ErroConfiguracao, obter_configuracao
+from scripts.core.zpl_generator import (
+    COPIAS_AGRUPADAS, COPIAS_INTERCALADAS, escrever_zpl, iter_zpl, iter_zpl_formato,
+)
+
+
+def _log(mensagem):
+    print(mensagem, file=sys.stderr)
+
+
+def _colunas(texto):
+    """Converte "SKU,1,Nome" em ["SKU", 1, "Nome"] (números são índices a partir de 0)."""
+    if not texto:
+        return None
+    return [int(coluna) if coluna.strip().isdigit() else coluna.strip() for coluna in texto.split(",")]
+
+
+def _intervalo(texto):
+    """Converte "1-500" (a partir de 1, inclusivo) em (inicio, fim) no formato de FonteEtiquetas."""
+    try:
+        inicio, fim = (int(parte) for parte in texto.split("-"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Intervalo inválido: {texto} (use, por exemplo, 1-500)")
+    if inicio < 1 or fim < inicio:
+        raise argparse.ArgumentTypeError(f"Intervalo inválido: {texto}")
+    return inicio - 1, fim
+
+
+def _campos(registro, colunas, separador):
+    """Monta uma etiqueta a partir de um registro (lista ou dicionário) lido da entrada padrão."""
+    if isinstance(registro, dict):
+        valores = list(registro.values()) if colunas is None else [
+            list(registro.values())[coluna] if isinstance(coluna, int) else registro.get(coluna, "")
+            for coluna in colunas
+        ]
+    else:
+        valores = registro if colunas is None else [registro[coluna] for coluna in colunas]
+    return separador.join("" if valor is None else str(valor) for valor in valores)
+
+
+def etiquetas_stdin(entrada, formato, colunas=None, separador=" | "):
+    """
+    Lê etiquetas da entrada à medida que chegam.
+
+    :param entrada: Arquivo de texto (normalmente sys.stdin).
+    :param formato: "jsonl" ou "csv".
+    :param colunas: Colunas (nomes ou índices a partir de 0) que compõem a etiqueta, ou None para todas.
+    :return: Iterador de etiquetas.
+    """
+    if formato == "jsonl":
+        for numero, linha in enumerate(entrada, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError as e:
+                raise ValueError(f"Linha {numero} não é JSON válido: {e}")
+            yield registro if isinstance(registro, str) else _campos(registro, colunas, separador)
+        return
+
+    leitor = csv.reader(entrada)
+    cabecalho = next(leitor, None)
+    if cabecalho is None:
+        return
+    indices = None
+    if colunas is not None:
+        indices = []
+        for coluna in colunas:
+            if isinstance(coluna, int) and 0 <= coluna < len(cabecalho):
+                indices.append(coluna)
+            elif coluna in cabecalho:
+                indices.append(cabecalho.index(coluna))
+            else:
+                raise ValueError(f"Coluna '{coluna}' não encontrada no cabeçalho.")
+    for linha in leitor:
+        if linha:
+            yield _campos(linha, indices, separador)
+
+
+def _etiquetas(args):
+    if args.stdin:
+        entrada = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+        etiquetas = etiquetas_stdin(entrada, args.stdin, _colunas(args.colunas), args.separador)
+        return itertools.islice(etiquetas, *args.intervalo) if args.intervalo else etiquetas
+    if args.arquivo:
+        # Só este caminho precisa do pandas
+        from scripts.core.loader import FonteEtiquetas, ler_colunas, resolver_colunas
+
+        cabecalho = ler_colunas(args.arquivo)
+        if cabecalho is None:
+            raise ValueError(f"Não foi possível ler o arquivo: {args.arquivo}")
+        colunas = _colunas(args.colunas) or list(range(len(cabecalho)))
+        inicio, fim = args.intervalo or (0, None)
+        return FonteEtiquetas(args.arquivo, resolver_colunas(cabecalho, colunas), args.separador, inicio, fim)
+    return args.etiqueta[slice(*args.intervalo)] if args.intervalo else args.etiqueta
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="run.py", description="Gera e imprime etiquetas ZPL sem prompts.",
+        formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__,
+    )
+    parser.add_argument("--modelo", required=True,
+                        help="Nome do modelo no etiquetas_config.json ou tamanho da etiqueta (ex.: 33x22mm, 4x6in).")
+    parser.add_argument("--config", help="Arquivo de modelos (padrão: config/etiquetas_config.json).")
+
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument("--arquivo", help="Arquivo CSV ou Excel com os dados.")
+    origem.add_argument("--etiqueta", action="append", help="Texto de uma etiqueta (pode repetir).")
+    origem.add_argument("--stdin", choices=("jsonl", "csv"), help="Lê os registros da entrada padrão.")
+
+    parser.add_argument("--colunas", help="Colunas que compõem a etiqueta, por nome ou índice (ex.: SKU,2).")
+    parser.add_argument("--separador", default=" | ", help="Texto entre os valores das colunas (padrão: ' | ').")
+    parser.add_argument("--intervalo", type=_intervalo,
+                        help="Etiquetas a imprimir, a partir de 1 (ex.: 1-500): linhas do arquivo ou da entrada "
+                             "padrão, ou a ordem das --etiqueta.")
+    parser.add_argument("--copias", type=int, default=1, help="Cópias de cada etiqueta.")
+    parser.add_argument("--modo-copias", choices=(COPIAS_INTERCALADAS, COPIAS_AGRUPADAS), default=COPIAS_INTERCALADAS)
+    parser.add_argument("--formato-armazenado", action="store_true",
+                        help="Grava o layout na impressora (^DF) e envia só os dados (^XF).")
+
+    destino = parser.add_mutually_exclusive_group()
+    destino.add_argument("--impressora", help="Envia direto para a impressora.")
+    destino.add_argument("--saida", default="-", help="Arquivo de saída do ZPL ('-' para a saída padrão).")
+    parser.add_argument("--retomavel", action="store_true",
+                        help="Com --impressora, grava o trabalho em disco para permitir retomar o envio.")
+    return parser
+
+
+def main(argv=None):
+    """
+    Executa a linha de comando.
+
+    :return: Código de saída (0 em caso de sucesso).
+    """
+    args = criar_parser().parse_args(argv)
+    if args.copias < 1:
+        _log("[ERRO] O número de cópias deve ser pelo menos 1.")
+        return 2
+
+    configuracao = obter_configuracao(args.config)
+    try:
+        encontrado = configuracao.buscar(args.modelo)
+    except ErroConfiguracao as e:
+        _log(f"[ERRO] {e}")
+        return 1
+    if encontrado is None:
+        _log(f"[ERRO] Modelo desconhecido: {args.modelo}. Disponíveis: {', '.join(configuracao.nomes())}")
+        return 2
+    nome_modelo, modelo = encontrado
+
+    try:
+        etiquetas = _etiquetas(args)
+        gerar = iter_zpl_formato if args.formato_armazenado else iter_zpl
+        blocos = gerar(etiquetas, modelo, args.copias, args.modo_copias)
+
+        if args.impressora:
+            if args.retomavel:
+                from scripts.core.trabalhos import Trabalho, imprimir_trabalho
+
+                trabalho = Trabalho.criar(blocos, args.impressora, descricao=nome_modelo)
+                return 0 if imprimir_trabalho(trabalho) else 1
+            from scripts.utils.transporte import enviar
+
+            total = enviar(args.impressora, blocos)
+            _log(f"[LOG] {total} bytes enviados para '{args.impressora}'.")
+            return 0
+
+        saida = sys.stdout.buffer if args.saida == "-" else open(args.saida, "wb")
+        # Lendo de um pipe, cada etiqueta sai assim que chega, em vez de esperar o fim da entrada
+        imediato = bool(args.stdin)
+        try:
+            if args.formato_armazenado:
+                for bloco in blocos:
+                    saida.write(bloco)
+                    if imediato:
+                        saida.flush()
+            elif imediato:
+                escrever_zpl(etiquetas, modelo, saida, args.copias, args.modo_copias, limite_buffer=0, descarregar=True)
+            else:
+                # Gera direto no buffer de saída, sem criar um objeto por bloco
+                escrever_zpl(etiquetas, modelo, saida, args.copias, args.modo_copias)
+            saida.flush()
+        finally:
+            if saida is not sys.stdout.buffer:
+                saida.close()
+        return 0
+    except BrokenPipeError:
+        # O consumidor do pipe encerrou antes (ex.: `| head`). O que sobrou no buffer da
+        # saída vai para o /dev/null, senão o Python reclama de novo ao encerrar
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except Exception as e:
+        _log(f"[ERRO] {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
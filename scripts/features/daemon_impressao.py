@@ -0,0 +1,444 @@
+"""
+Serviço de impressão em segundo plano, com fila persistente em SQLite (modo WAL).
+
+Os pedidos chegam por um socket Unix (uma linha JSON por requisição) e são
+gravados na fila; a resposta volta assim que o pedido está no banco. Um grupo
+de trabalhadores gera o ZPL (como trabalho retomável, ver scripts.core.trabalhos)
+e envia para a impressora pelo pool de conexões do transporte, que fica aquecido
+entre um pedido e outro. Se o serviço cair no meio de um envio, o pedido é
+retomado do checkpoint na próxima inicialização.
+
+Alterações no config/etiquetas_config.json valem sem reiniciar: o arquivo é
+observado e, quando uma versão válida é gravada, os próximos pedidos passam a
+usá-la; os que já estão em geração continuam com a versão anterior.
+
+Com "formato_armazenado", o serviço lembra, por impressora, quais layouts (^DF) já
+enviou, e os pedidos seguintes mandam só os dados (^XF). Essa memória recomeça quando
+os modelos mudam e quando um envio falha (a impressora pode ter sido reiniciada).
+
+Pedido (campo "trabalho" de "submeter"):
+    {"modelo": "Etiqueta_33x22mm", "impressora": "Datamax_M4206_MarkII",
+     "etiquetas": ["A", "B"]                           # ou, a partir de um arquivo:
+     "arquivo": "dados.csv", "colunas": [0, "SKU"], "inicio": 0, "fim": 1000, "separador": " | ",
+     "copias": 1, "modo_copias": "intercalado", "formato_armazenado": false}
+
+Uso:
+    python -m scripts.features.daemon_impressao iniciar [--trabalhadores 2] [--socket caminho]
+    python -m scripts.features.daemon_impressao submeter pedido.json
+    python -m scripts.features.daemon_impressao status <id>
+    python -m scripts.features.daemon_impressao listar
+    python -m scripts.features.daemon_impressao metricas [--prometheus]
+
+As métricas do serviço (ver scripts.utils.metricas) são coletadas com ETIQUETAS_METRICAS=1.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+from scripts.core import config, trabalhos
+from scripts.utils import metricas
+
+caminho_banco = os.environ.get("ETIQUETAS_FILA_DB", os.path.join(trabalhos.diretorio_trabalhos, "fila.db"))
+caminho_socket = os.environ.get("ETIQUETAS_DAEMON_SOCKET", os.path.join(trabalhos.diretorio_trabalhos, "daemon.sock"))
+
+TRABALHADORES = 2
+INTERVALO_VERIFICACAO = 1.0
+
+ESTADO_PENDENTE = "pendente"
+ESTADO_GERANDO = "gerando"
+ESTADO_IMPRIMINDO = "imprimindo"
+ESTADO_CONCLUIDO = "concluido"
+ESTADO_ERRO = "erro"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS fila (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    estado TEXT NOT NULL,
+    impressora TEXT NOT NULL,
+    pedido TEXT NOT NULL,
+    trabalho TEXT,
+    erro TEXT,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fila_estado ON fila (estado, id);
+"""
+
+
+def _conectar(caminho):
+    conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None, check_same_thread=False)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    # Em WAL, NORMAL só sincroniza nos checkpoints e ainda é seguro contra queda do processo
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    return conexao
+
+
+class FilaImpressao:
+    """
+    Fila de pedidos gravada em SQLite.
+
+    Cada thread usa a sua própria conexão; a reserva de um pedido acontece em uma
+    transação IMMEDIATE, então dois trabalhadores nunca pegam o mesmo pedido.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_banco
+        os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+        self._local = threading.local()
+        self._conexao().executescript(_ESQUEMA)
+
+    def _conexao(self):
+        if not hasattr(self._local, "conexao"):
+            self._local.conexao = _conectar(self.caminho)
+        return self._local.conexao
+
+    def inserir(self, pedido):
+        agora = time.time()
+        cursor = self._conexao().execute(
+            "INSERT INTO fila (estado, impressora, pedido, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?)",
+            (ESTADO_PENDENTE, pedido["impressora"], json.dumps(pedido, ensure_ascii=False), agora, agora),
+        )
+        return cursor.lastrowid
+
+    def reservar(self):
+        """Marca o pedido pendente mais antigo como em geração e o retorna (ou None)."""
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conexao.execute(
+                "SELECT id, pedido, trabalho FROM fila WHERE estado = ? ORDER BY id LIMIT 1", (ESTADO_PENDENTE,)
+            ).fetchone()
+            if linha is not None:
+                conexao.execute(
+                    "UPDATE fila SET estado = ?, atualizado_em = ? WHERE id = ?",
+                    (ESTADO_GERANDO, time.time(), linha[0]),
+                )
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+        if linha is None:
+            return None
+        return {"id": linha[0], "pedido": json.loads(linha[1]), "trabalho": linha[2]}
+
+    def atualizar(self, id_pedido, estado, trabalho=None, erro=None):
+        self._conexao().execute(
+            "UPDATE fila SET estado = ?, trabalho = COALESCE(?, trabalho), erro = ?, atualizado_em = ? WHERE id = ?",
+            (estado, trabalho, erro, time.time(), id_pedido),
+        )
+
+    def recuperar(self):
+        """Devolve para a fila os pedidos que estavam em andamento quando o serviço parou."""
+        cursor = self._conexao().execute(
+            "UPDATE fila SET estado = ? WHERE estado IN (?, ?)", (ESTADO_PENDENTE, ESTADO_GERANDO, ESTADO_IMPRIMINDO)
+        )
+        return cursor.rowcount
+
+    def consultar(self, id_pedido):
+        linha = self._conexao().execute(
+            "SELECT id, estado, impressora, trabalho, erro, criado_em, atualizado_em FROM fila WHERE id = ?",
+            (id_pedido,),
+        ).fetchone()
+        return _como_dicionario(linha) if linha else None
+
+    def listar(self, limite=50):
+        linhas = self._conexao().execute(
+            "SELECT id, estado, impressora, trabalho, erro, criado_em, atualizado_em FROM fila "
+            "ORDER BY id DESC LIMIT ?", (limite,),
+        ).fetchall()
+        return [_como_dicionario(linha) for linha in linhas]
+
+
+def _como_dicionario(linha):
+    chaves = ("id", "estado", "impressora", "trabalho", "erro", "criado_em", "atualizado_em")
+    return dict(zip(chaves, linha))
+
+
+def _validar_pedido(pedido, modelos):
+    if not isinstance(pedido, dict):
+        raise ValueError("O pedido deve ser um objeto JSON.")
+    for chave in ("modelo", "impressora"):
+        if not pedido.get(chave):
+            raise ValueError(f"Campo obrigatório ausente: {chave}")
+    if pedido["modelo"] not in modelos:
+        raise ValueError(f"Modelo desconhecido: {pedido['modelo']}")
+    if "etiquetas" not in pedido and "arquivo" not in pedido:
+        raise ValueError("Informe 'etiquetas' ou 'arquivo'.")
+    if int(pedido.get("copias", 1)) < 1:
+        raise ValueError("O número de cópias deve ser pelo menos 1.")
+
+
+def _gerar_blocos(pedido, modelo, sessao=None):
+    """
+    Monta o gerador de blocos ZPL de um pedido.
+
+    :param sessao: SessaoFormatos da impressora, para não reenviar formatos já armazenados.
+    """
+    from scripts.core.zpl_generator import COPIAS_INTERCALADAS, iter_zpl, iter_zpl_formato
+
+    if "arquivo" in pedido:
+        from scripts.core.loader import FonteEtiquetas, ler_colunas, resolver_colunas
+
+        cabecalho = ler_colunas(pedido["arquivo"])
+        if cabecalho is None:
+            raise ValueError(f"Não foi possível ler o arquivo: {pedido['arquivo']}")
+        indices = resolver_colunas(cabecalho, pedido.get("colunas") or list(range(len(cabecalho))))
+        etiquetas = FonteEtiquetas(
+            pedido["arquivo"], indices, separador=pedido.get("separador", " | "),
+            inicio=pedido.get("inicio", 0), fim=pedido.get("fim"),
+        )
+    else:
+        etiquetas = [str(etiqueta) for etiqueta in pedido["etiquetas"]]
+
+    copias = int(pedido.get("copias", 1))
+    modo_copias = pedido.get("modo_copias", COPIAS_INTERCALADAS)
+    if pedido.get("formato_armazenado"):
+        return iter_zpl_formato(etiquetas, modelo, copias, modo_copias, sessao=sessao)
+    return iter_zpl(etiquetas, modelo, copias, modo_copias)
+
+
+class DaemonImpressao:
+    """
+    Serviço de impressão: fila SQLite, trabalhadores e servidor de submissão.
+
+    :param trabalhadores: Quantidade de threads que geram e enviam os pedidos.
+    :param banco: Caminho do banco SQLite da fila.
+    :param socket_unix: Caminho do socket de submissão.
+    :param modelos: Modelos fixos; sem eles, o config/etiquetas_config.json é observado e
+        recarregado quando muda, sem reiniciar o serviço.
+    """
+
+    def __init__(self, trabalhadores=TRABALHADORES, banco=None, socket_unix=None, modelos=None):
+        self.fila = FilaImpressao(banco)
+        self.socket_unix = socket_unix or caminho_socket
+        if modelos is not None:
+            self.observador = None
+            self._registro_fixo = config.RegistroModelos(modelos)
+        else:
+            self.observador = config.ObservadorModelos()
+            self._registro_fixo = None
+        self.quantidade_trabalhadores = trabalhadores
+        # impressora -> (versão dos modelos, SessaoFormatos)
+        self._sessoes = {}
+        self._trava_sessoes = threading.Lock()
+        self._novo_pedido = threading.Condition()
+        self._parar = threading.Event()
+        self._threads = []
+        self._servidor = None
+
+    @property
+    def registro(self):
+        """Versão atual dos modelos (config.RegistroModelos)."""
+        if self.observador is None:
+            return self._registro_fixo
+        return self.observador.registro
+
+    def _sessao(self, impressora, registro):
+        """SessaoFormatos da impressora; recomeça vazia quando a versão dos modelos muda."""
+        from scripts.core.zpl_generator import SessaoFormatos
+
+        with self._trava_sessoes:
+            versao, sessao = self._sessoes.get(impressora, (None, None))
+            if sessao is None or versao != registro.versao:
+                sessao = SessaoFormatos()
+                self._sessoes[impressora] = (registro.versao, sessao)
+            return sessao
+
+    def _descartar_sessao(self, impressora):
+        """Esquece os formatos da impressora: o próximo pedido envia o ^DF de novo."""
+        with self._trava_sessoes:
+            self._sessoes.pop(impressora, None)
+
+    def submeter(self, pedido):
+        """Valida e grava o pedido na fila. Retorna o id do pedido."""
+        _validar_pedido(pedido, self.registro.modelos)
+        id_pedido = self.fila.inserir(pedido)
+        metricas.incrementar("pedidos_recebidos")
+        with self._novo_pedido:
+            self._novo_pedido.notify()
+        return id_pedido
+
+    def _processar(self, reserva):
+        id_pedido, pedido = reserva["id"], reserva["pedido"]
+        try:
+            trabalho = trabalhos.Trabalho.abrir(reserva["trabalho"]) if reserva["trabalho"] else None
+            if trabalho is None or not trabalho.gravacao_completa:
+                # O pedido usa a versão dos modelos vigente agora, mesmo que o arquivo mude durante a geração
+                registro = self.registro
+                modelo = registro.modelo(pedido["modelo"])
+                if modelo is None:
+                    raise ValueError(f"Modelo '{pedido['modelo']}' não existe na versão {registro.versao} da configuração.")
+                blocos = _gerar_blocos(pedido, modelo, self._sessao(pedido["impressora"], registro))
+                if trabalho is None:
+                    # O ZPL é gerado e gravado em disco durante o envio
+                    trabalho = trabalhos.Trabalho.criar(blocos, pedido["impressora"], descricao=pedido["modelo"])
+                else:
+                    # O serviço caiu no meio da gravação: gera de novo o que não chegou ao disco
+                    trabalho.retomar_gravacao(blocos)
+            self.fila.atualizar(id_pedido, ESTADO_IMPRIMINDO, trabalho=trabalho.id)
+            with metricas.etapa("pedido_envio", impressora=pedido["impressora"]):
+                enviado = trabalhos.imprimir_trabalho(trabalho)
+            if enviado:
+                self.fila.atualizar(id_pedido, ESTADO_CONCLUIDO)
+                metricas.incrementar("pedidos_concluidos")
+            else:
+                self._descartar_sessao(pedido["impressora"])
+                self.fila.atualizar(id_pedido, ESTADO_ERRO, erro=f"Envio interrompido na etiqueta {trabalho.ultima_enviada}")
+                metricas.incrementar("pedidos_com_erro")
+        except Exception as e:
+            self._descartar_sessao(pedido.get("impressora"))
+            print(f"[ERRO] Pedido {id_pedido} falhou: {e}\n")
+            self.fila.atualizar(id_pedido, ESTADO_ERRO, erro=str(e))
+            metricas.incrementar("pedidos_com_erro")
+
+    def _trabalhador(self):
+        while not self._parar.is_set():
+            reserva = self.fila.reservar()
+            if reserva is None:
+                with self._novo_pedido:
+                    self._novo_pedido.wait(INTERVALO_VERIFICACAO)
+                continue
+            self._processar(reserva)
+
+    def _atender(self, requisicao):
+        acao = requisicao.get("acao")
+        if acao == "submeter":
+            return {"ok": True, "id": self.submeter(requisicao.get("trabalho"))}
+        if acao == "status":
+            pedido = self.fila.consultar(int(requisicao.get("id", 0)))
+            return {"ok": pedido is not None, "pedido": pedido}
+        if acao == "listar":
+            return {"ok": True, "pedidos": self.fila.listar(int(requisicao.get("limite", 50)))}
+        if acao == "metricas":
+            if requisicao.get("formato") == "prometheus":
+                return {"ok": True, "metricas": metricas.exportar_prometheus()}
+            return {"ok": True, "metricas": metricas.resumo()}
+        return {"ok": False, "erro": f"Ação desconhecida: {acao}"}
+
+    def iniciar(self):
+        """Recupera pedidos interrompidos, inicia os trabalhadores e abre o socket de submissão."""
+        # Importado aqui para já deixar o pandas carregado antes do primeiro pedido
+        try:
+            import scripts.core.loader  # noqa: F401
+        except ImportError as e:
+            print(f"[LOG] Leitura de planilhas indisponível ({e}); apenas pedidos com 'etiquetas'.\n")
+
+        if self.observador is not None:
+            self.observador.iniciar()
+
+        recuperados = self.fila.recuperar()
+        if recuperados:
+            print(f"[LOG] {recuperados} pedido(s) interrompido(s) voltaram para a fila.\n")
+
+        for numero in range(self.quantidade_trabalhadores):
+            thread = threading.Thread(target=self._trabalhador, name=f"trabalhador-{numero + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        daemon = self
+
+        class Manipulador(socketserver.StreamRequestHandler):
+            def handle(self):
+                for linha in self.rfile:
+                    if not linha.strip():
+                        continue
+                    try:
+                        resposta = daemon._atender(json.loads(linha))
+                    except (ValueError, TypeError) as e:
+                        resposta = {"ok": False, "erro": str(e)}
+                    self.wfile.write(json.dumps(resposta, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        if os.path.exists(self.socket_unix):
+            os.remove(self.socket_unix)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_unix)), exist_ok=True)
+        self._servidor = socketserver.ThreadingUnixStreamServer(self.socket_unix, Manipulador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, name="submissao", daemon=True).start()
+        print(f"[LOG] Serviço de impressão ouvindo em {self.socket_unix} com "
+              f"{self.quantidade_trabalhadores} trabalhador(es).\n")
+
+    def parar(self):
+        self._parar.set()
+        if self.observador is not None:
+            self.observador.parar()
+        with self._novo_pedido:
+            self._novo_pedido.notify_all()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            if os.path.exists(self.socket_unix):
+                os.remove(self.socket_unix)
+        for thread in self._threads:
+            thread.join()
+
+
+def requisitar(requisicao, socket_unix=None, timeout=10.0):
+    """
+    Envia uma requisição ao serviço e retorna a resposta.
+
+    :param requisicao: Dicionário com a "acao" ("submeter", "status", "listar" ou "metricas") e seus campos.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as cliente:
+        cliente.settimeout(timeout)
+        cliente.connect(socket_unix or caminho_socket)
+        cliente.sendall(json.dumps(requisicao, ensure_ascii=False).encode("utf-8") + b"\n")
+        resposta = b""
+        while not resposta.endswith(b"\n"):
+            parte = cliente.recv(65536)
+            if not parte:
+                break
+            resposta += parte
+    return json.loads(resposta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço de impressão com fila persistente.")
+    parser.add_argument("--socket", default=None, help="Caminho do socket Unix do serviço.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    iniciar = subcomandos.add_parser("iniciar", help="Inicia o serviço.")
+    iniciar.add_argument("--trabalhadores", type=int, default=TRABALHADORES)
+    iniciar.add_argument("--banco", default=None, help="Caminho do banco SQLite da fila.")
+    submeter = subcomandos.add_parser("submeter", help="Envia um pedido (arquivo JSON ou '-' para stdin).")
+    submeter.add_argument("pedido")
+    status = subcomandos.add_parser("status", help="Mostra o estado de um pedido.")
+    status.add_argument("id", type=int)
+    subcomandos.add_parser("listar", help="Lista os pedidos mais recentes.")
+    metricas_parser = subcomandos.add_parser("metricas", help="Mostra as métricas do serviço.")
+    metricas_parser.add_argument("--prometheus", action="store_true", help="Texto no formato do Prometheus.")
+    args = parser.parse_args()
+
+    if args.comando == "iniciar":
+        daemon = DaemonImpressao(args.trabalhadores, args.banco, args.socket)
+        daemon.iniciar()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("[LOG] Encerrando o serviço de impressão...\n")
+            daemon.parar()
+        return
+
+    if args.comando == "submeter":
+        origem = sys.stdin if args.pedido == "-" else open(args.pedido, "r")
+        with origem:
+            requisicao = {"acao": "submeter", "trabalho": json.load(origem)}
+    elif args.comando == "status":
+        requisicao = {"acao": "status", "id": args.id}
+    elif args.comando == "metricas":
+        requisicao = {"acao": "metricas", "formato": "prometheus" if args.prometheus else "json"}
+        if args.prometheus:
+            print(requisitar(requisicao, args.socket)["metricas"], end="")
+            return
+    else:
+        requisicao = {"acao": "listar"}
+    print(json.dumps(requisitar(requisicao, args.socket), indent=4, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import os
 import pandas as pd
-import chardet
 from fractions import Fraction
+from scripts.core.loader import detectar_codificacao, montar_etiquetas
 
 
 def polegadas_para_pontos(valor):
@@ -72,11 +72,10 @@ def carregar_arquivo():
             continue
 
         try:
-            with open(caminho, 'rb') as f:
-                codificacao = chardet.detect(f.read())['encoding']
-            print(f"Codificação detectada: {codificacao}")
-
             if caminho.endswith('.csv'):
+                # Detecta a codificação por amostragem; o arquivo só é lido por completo pelo pandas
+                codificacao = detectar_codificacao(caminho)
+                print(f"Codificação detectada: {codificacao}")
                 df = pd.read_csv(caminho, encoding=codificacao)
             else:
                 df = pd.read_excel(caminho)
@@ -146,8 +145,10 @@ def gerar_zpl(df, colunas, largura, altura, espaco, colunas_por_linha, copias=1)
 
     zpl_code = "^XA\n"
 
-    for idx, row in df.iterrows():
-        conteudo_etiqueta = " - ".join(str(row[coluna]) for coluna in colunas)
+    # Monta o texto de todas as etiquetas de uma vez, sem percorrer o DataFrame linha a linha
+    conteudos = montar_etiquetas(df[colunas]).tolist()
+
+    for conteudo_etiqueta in conteudos:
         for _ in range(copias):  # Repetir para o número de cópias
             zpl_code += f"^FO{x_atual},{y_atual}^ADN,36,20^FD{conteudo_etiqueta}^FS\n"
 
@@ -1,33 +1,16 @@
-import json
+import itertools
 import os
-import tempfile
-import pandas as pd
-import subprocess
-from scripts.utils.printer import selecionar_impressora
-
-# Caminho para o arquivo de modelos JSON
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/config/etiquetas_config.json"
-
-
-def carregar_modelos():
-    """Carrega os modelos de etiquetas do arquivo JSON."""
-    print(f"[LOG] Tentando carregar modelos de: {caminho_json}\n")
-    if not os.path.exists(caminho_json):
-        print(f"[ERRO] Arquivo JSON não encontrado: {caminho_json}\n")
-        return None
-    try:
-        with open(caminho_json, "r") as f:
-            modelos = json.load(f)
-        print(f"[LOG] Modelos carregados com sucesso: {list(modelos.keys())}\n")
-        return modelos
-    except Exception as e:
-        print(f"[ERRO] Erro ao carregar modelos: {e}\n")
-        return None
+from scripts.core.config import carregar_modelos
+from scripts.core.trabalhos import Trabalho, imprimir_trabalho
+from scripts.core.zpl_generator import COPIAS_AGRUPADAS, COPIAS_INTERCALADAS, iter_zpl
+from scripts.utils.printer import registro_impressoras, selecionar_impressora
 
 
 def carregar_dados(caminho):
     """Carrega dados de um arquivo CSV ou Excel."""
     print(f"[LOG] Carregando dados do arquivo: {caminho}\n")
+    import pandas as pd
+
     try:
         if caminho.endswith(".csv"):
             df = pd.read_csv(caminho)
@@ -43,38 +26,50 @@ def carregar_dados(caminho):
         return None
 
 
-def gerar_zpl(etiquetas, modelo, copias):
+def gerar_zpl(etiquetas, modelo, copias, modo_copias=COPIAS_INTERCALADAS):
     """Gera código ZPL para as etiquetas selecionadas."""
-    largura = modelo["largura"]
-    altura = modelo["altura"]
-    espaco = modelo["espaco"]
-    colunas = modelo["colunas"]
-    largura_total = modelo["largura_total"]
-    posicoes_horizontais = modelo["posicoes_horizontais"]
+    return b"".join(iter_zpl(etiquetas, modelo, copias, modo_copias)).decode("utf-8")
 
-    zpl_code = ""
-    for idx, etiqueta in enumerate(etiquetas * copias):
-        coluna_atual = idx % colunas
-        if coluna_atual == 0:
-            if idx > 0:
-                zpl_code += "^XZ\n"
-            zpl_code += f"^XA\n^PW{int(largura_total)}\n^LL{int(altura)}\n^CI28\n"
 
-        x_atual = posicoes_horizontais[coluna_atual]
-        y_atual = 30
-        zpl_code += f"^FO{x_atual},{y_atual}^FB{int(largura)},5,L,10,0^A0N,30,20^FD{etiqueta}^FS\n"
+def selecionar_modo_copias(copias):
+    """
+    Pergunta como as cópias devem ser organizadas.
 
-    zpl_code += "^XZ\n"
-    return zpl_code
+    No modo agrupado as cópias de cada etiqueta saem juntas e linhas repetidas
+    são enviadas uma única vez com ^PQ, o que reduz muito o volume enviado.
+    """
+    if copias <= 1:
+        return COPIAS_INTERCALADAS
+    print("\nOrganização das cópias:")
+    print("1. Intercaladas (1, 2, 3, 1, 2, 3)")
+    print("2. Agrupadas por etiqueta (1, 1, 2, 2, 3, 3) - envio mais rápido")
+    escolha = input("Digite 1 ou 2: ").strip()
+    return COPIAS_AGRUPADAS if escolha == "2" else COPIAS_INTERCALADAS
 
 
 def salvar_zpl_temp(zpl_code):
-    """Salva o ZPL em um arquivo temporário."""
+    """
+    Salva o ZPL em um arquivo temporário.
+
+    :param zpl_code: Código ZPL (string) ou iterável de blocos em bytes gerado por iter_zpl.
+    :return: Caminho do arquivo salvo ou None em caso de erro.
+    """
     print("[LOG] Salvando ZPL em arquivo temporário...\n")
+    import tempfile
+
     try:
-        arquivo_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".zpl").name
-        with open(arquivo_temp, "w") as f:
-            f.write(zpl_code)
+        if isinstance(zpl_code, str):
+            zpl_code = [zpl_code.encode("utf-8")]
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".zpl") as f:
+            arquivo_temp = f.name
+            total = 0
+            for bloco in zpl_code:
+                f.write(bloco)
+                total += len(bloco)
+        if total == 0:
+            print("[ERRO] Nenhum código ZPL foi gerado.\n")
+            os.remove(arquivo_temp)
+            return None
         print(f"[LOG] Arquivo ZPL salvo em: {arquivo_temp}\n")
         return arquivo_temp
     except Exception as e:
@@ -107,8 +102,48 @@ def selecionar_etiquetas(etiquetas):
         return selecionar_etiquetas(etiquetas)
 
 
+def selecionar_etiquetas_arquivo(fonte, previa=10):
+    """
+    Seleciona etiquetas de um arquivo sem carregá-lo inteiro na memória.
+
+    :param fonte: FonteEtiquetas com as colunas escolhidas.
+    :param previa: Quantidade de etiquetas exibidas como prévia.
+    :return: FonteEtiquetas restrita ao intervalo escolhido ou lista com as etiquetas específicas.
+    """
+    print("[LOG] Prévia das primeiras etiquetas:")
+    for idx, etiqueta in enumerate(itertools.islice(fonte, previa), start=1):
+        print(f"{idx}. {etiqueta}")
+    print("Selecione as etiquetas:")
+    print("- Use números separados por vírgula (ex: 1,3,5)")
+    print("- Use range (ex: 1-10)")
+    print("- Digite 'todos' para selecionar todas")
+
+    escolha = input("Sua escolha: ").strip().lower()
+    try:
+        if escolha == "todos":
+            return fonte
+        elif "-" in escolha:
+            inicio, fim = map(int, escolha.split("-"))
+            if inicio < 1 or fim < inicio:
+                raise ValueError
+            return fonte.recortar(inicio - 1, fim)
+        else:
+            numeros = [int(i) for i in escolha.split(",")]
+            if any(numero < 1 for numero in numeros):
+                raise ValueError
+            encontradas = {}
+            for idx, etiqueta in enumerate(itertools.islice(fonte, max(numeros)), start=1):
+                encontradas[idx] = etiqueta
+            return [encontradas[numero] for numero in numeros]
+    except (ValueError, KeyError):
+        print("[ERRO] Seleção inválida. Tente novamente.\n")
+        return selecionar_etiquetas_arquivo(fonte, previa)
+
+
 def main():
     print("[LOG] Iniciando o script...\n")
+    # Descobre as impressoras enquanto o usuário escolhe o modelo e as etiquetas
+    registro_impressoras.atualizar_em_segundo_plano()
 
     # Carregar modelos
     modelos = carregar_modelos()
@@ -143,30 +178,26 @@ def main():
 
     elif origem == "2":
         caminho = input("Digite o caminho do arquivo CSV ou Excel: ").strip()
-        df = carregar_dados(caminho)
-        if df is None:
+        # pandas e as bibliotecas de planilha só são carregados quando há arquivo
+        from scripts.core.loader import FonteEtiquetas, escolher_colunas, ler_colunas
+
+        colunas_arquivo = ler_colunas(caminho)
+        if colunas_arquivo is None:
             return
-        print("\nColunas disponíveis no arquivo:")
-        for idx, col in enumerate(df.columns, start=1):
-            print(f"{idx}. {col}")
-        colunas = input("Digite os números das colunas desejadas (separados por vírgula): ").strip()
-        indices = [int(x) - 1 for x in colunas.split(",")]
-        etiquetas = df.iloc[:, indices].apply(lambda row: " | ".join(map(str, row)), axis=1).tolist()
-
-        etiquetas_selecionadas = selecionar_etiquetas(etiquetas)
+        indices = escolher_colunas(caminho, colunas_arquivo)
+        if indices is None:
+            return
+
+        # As etiquetas são lidas do arquivo em lotes, só no momento do envio
+        fonte = FonteEtiquetas(caminho, indices, separador=" | ")
+        etiquetas_selecionadas = selecionar_etiquetas_arquivo(fonte)
         copias = int(input("\nDigite o número de cópias para cada etiqueta: ").strip())
 
     else:
         print("[ERRO] Opção inválida.\n")
         return
 
-    # Gerar e salvar ZPL
-    zpl_code = gerar_zpl(etiquetas_selecionadas, modelo, copias)
-    if not zpl_code:
-        return
-    arquivo_temp = salvar_zpl_temp(zpl_code)
-    if not arquivo_temp:
-        return
+    modo_copias = selecionar_modo_copias(copias)
 
     # Selecionar impressora
     impressora = selecionar_impressora()
@@ -174,13 +205,17 @@ def main():
         print("[ERRO] Impressora não selecionada. Encerrando o programa.\n")
         return
 
-    # Enviar para impressão
-    print(f"[LOG] Enviando ZPL para a impressora: {impressora}\n")
+    # Enviar o ZPL, gravando-o em disco durante o envio (permite retomar de onde parou)
     try:
-        subprocess.run(["lp", "-d", impressora, "-o", "raw", arquivo_temp], check=True)
-        print("[LOG] Impressão enviada com sucesso.\n")
-    except Exception as e:
-        print(f"[ERRO] Erro ao enviar para impressão: {e}\n")
+        trabalho = Trabalho.criar(
+            iter_zpl(etiquetas_selecionadas, modelo, copias, modo_copias), impressora,
+            descricao=list(modelos.keys())[modelo_idx],
+        )
+    except OSError as e:
+        print(f"[ERRO] Erro ao criar o trabalho: {e}\n")
+        return
+    if imprimir_trabalho(trabalho):
+        print(f"[LOG] Trabalho {trabalho.id}: {trabalho.dados['total_etiquetas']} etiquetas.\n")
 
 
 if __name__ == "__main__":
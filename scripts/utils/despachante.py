@@ -0,0 +1,505 @@
+"""
+Despachante assíncrono: alimenta várias impressoras ao mesmo tempo a partir de um único processo.
+
+Cada impressora tem uma fila limitada de blocos ZPL e uma tarefa que a esvazia.
+Quando a impressora (ou a rede) não acompanha, a fila enche e o gerador que
+está submetendo o trabalho fica suspenso até haver espaço. Nas impressoras
+"raw" o status (~HS) é consultado pela própria conexão e o envio espera
+enquanto a impressora estiver pausada ou com o buffer de formatos cheio.
+
+Exemplo:
+    trabalhos = [("Datamax_1", iter_zpl(lote_1, modelo)), ("Datamax_2", iter_zpl(lote_2, modelo))]
+    imprimir_em_paralelo(trabalhos)
+"""
+import asyncio
+import time
+
+from scripts.core.zpl_generator import contar_etiquetas
+from scripts.utils import metricas
+from scripts.utils.status_impressora import ErroStatus, ImpressoraIndisponivel, MonitorStatus
+from scripts.utils.transporte import (
+    BACKEND_CUPS, BACKEND_IPP, BACKEND_RAW, PORTA_PADRAO, TIMEOUT_CONEXAO, TIMEOUT_ENVIO, ErroTransporte, carregar_impressoras,
+)
+
+TAMANHO_FILA = 64
+TENTATIVAS_ENVIO = 3
+
+# Marca o fim de um trabalho dentro da fila de uma impressora
+_FIM_TRABALHO = object()
+# Fim de um gerador de blocos lido numa thread
+_FIM_BLOCOS = object()
+_MONITOR_PADRAO = object()
+
+
+class ErroTrabalhadorEncerrado(ErroTransporte):
+    """A tarefa de envio da impressora terminou; a fila não aceita mais trabalhos."""
+
+
+class ProgressoImpressora:
+    """Contadores de uma impressora, atualizados à medida que os blocos são enviados."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.blocos_enfileirados = 0
+        self.blocos_enviados = 0
+        self.bytes_enviados = 0
+        self.etiquetas_enfileiradas = 0
+        self.etiquetas_enviadas = 0
+        self.etiquetas_descartadas = 0
+        self.trabalhos_concluidos = 0
+        self.trabalhos_com_erro = 0
+        self.erros = 0
+        self.ultimo_erro = None
+        self.inicio = None
+        self.ultimo_envio = None
+
+    @property
+    def etiquetas_pendentes(self):
+        return self.etiquetas_enfileiradas - self.etiquetas_enviadas - self.etiquetas_descartadas
+
+    def resumo(self):
+        duracao = (self.ultimo_envio - self.inicio) if self.inicio and self.ultimo_envio else 0.0
+        return {
+            "impressora": self.nome,
+            "blocos_enviados": self.blocos_enviados,
+            "bytes_enviados": self.bytes_enviados,
+            "etiquetas_enviadas": self.etiquetas_enviadas,
+            "etiquetas_pendentes": self.etiquetas_pendentes,
+            "etiquetas_descartadas": self.etiquetas_descartadas,
+            "trabalhos_concluidos": self.trabalhos_concluidos,
+            "trabalhos_com_erro": self.trabalhos_com_erro,
+            "erros": self.erros,
+            "ultimo_erro": self.ultimo_erro,
+            "etiquetas_por_s": self.etiquetas_enviadas / duracao if duracao else 0.0,
+        }
+
+
+class TrabalhoDespacho:
+    """
+    Um trabalho submetido ao despachante.
+
+    Se um bloco não puder ser enviado, o restante do trabalho é descartado (não há
+    buracos no meio da impressão) e `erro` informa a etiqueta em que o envio parou.
+    """
+
+    def __init__(self, impressora):
+        self.impressora = impressora
+        self.etiquetas_enviadas = 0
+        self.etiqueta_falha = None
+        self.erro = None
+        self.concluido = asyncio.Event()
+
+
+class Despachante:
+    """
+    Mantém uma fila limitada e uma tarefa de envio por impressora.
+
+    :param impressoras: Configuração das impressoras (padrão: impressoras_config.json).
+    :param tamanho_fila: Quantidade máxima de blocos aguardando envio por impressora.
+    :param ao_progredir: Função chamada com o ProgressoImpressora após cada bloco enviado.
+    :param monitor: MonitorStatus usado no controle de fluxo das impressoras "raw"
+        (padrão: um novo monitor; None desativa a consulta de status).
+    """
+
+    def __init__(self, impressoras=None, tamanho_fila=TAMANHO_FILA, ao_progredir=None, monitor=_MONITOR_PADRAO):
+        self.impressoras = impressoras if impressoras is not None else carregar_impressoras()
+        self.tamanho_fila = tamanho_fila
+        self.ao_progredir = ao_progredir
+        self.monitor = MonitorStatus() if monitor is _MONITOR_PADRAO else monitor
+        self._sem_status = set()
+        # Impressoras em que um trabalho que falha não imprime nada (CUPS e IPP)
+        self._tudo_ou_nada = set()
+        self.progresso = {}
+        self._filas = {}
+        self._tarefas = {}
+        self._travas = {}
+        self._conexoes_raw = {}
+
+    def _fila(self, nome):
+        if nome not in self._filas:
+            self._filas[nome] = asyncio.Queue(self.tamanho_fila)
+            self._travas[nome] = asyncio.Lock()
+            self.progresso[nome] = ProgressoImpressora(nome)
+            config = self.impressoras.get(nome, {"backend": BACKEND_CUPS, "fila_cups": nome})
+            backend = config.get("backend", BACKEND_RAW)
+            if backend == BACKEND_RAW:
+                trabalhador = self._trabalhador_raw(nome, config)
+            elif backend == BACKEND_IPP:
+                self._tudo_ou_nada.add(nome)
+                trabalhador = self._trabalhador_ipp(nome, config)
+            else:
+                self._tudo_ou_nada.add(nome)
+                trabalhador = self._trabalhador_cups(nome, config.get("fila_cups", nome))
+            tarefa = self._tarefas[nome] = asyncio.create_task(trabalhador)
+            tarefa.add_done_callback(lambda tarefa, nome=nome: self._trabalhador_encerrado(nome, tarefa))
+        return self._filas[nome]
+
+    async def submeter(self, impressora, blocos):
+        """
+        Enfileira um trabalho para a impressora, bloco a bloco.
+
+        A chamada fica suspensa enquanto a fila da impressora está cheia, então o
+        gerador de blocos só avança no ritmo em que a impressora consome. Trabalhos
+        para a mesma impressora não se misturam: o próximo só começa a ser
+        enfileirado quando o anterior terminar de ser enfileirado. Se o envio do
+        trabalho falhar, o gerador deixa de ser consumido.
+
+        Iteráveis comuns são percorridos numa thread, pois o próximo bloco pode
+        depender de leitura de arquivo (ex.: lotes do pandas) e travaria o envio para
+        todas as impressoras.
+
+        :param impressora: Nome da impressora.
+        :param blocos: Iterável (ou iterável assíncrono) de blocos ZPL em bytes.
+        :return: TrabalhoDespacho (aguarde `concluido` para saber o resultado do envio).
+        :raises ErroTransporte: Se a tarefa de envio da impressora tiver sido encerrada.
+        """
+        fila = self._fila(impressora)
+        progresso = self.progresso[impressora]
+        trabalho = TrabalhoDespacho(impressora)
+        async with self._travas[impressora]:
+            try:
+                if hasattr(blocos, "__aiter__"):
+                    async for bloco in blocos:
+                        if trabalho.erro is not None:
+                            break
+                        await self._enfileirar(impressora, fila, progresso, trabalho, bloco)
+                else:
+                    laco = asyncio.get_running_loop()
+                    blocos = iter(blocos)
+                    while trabalho.erro is None:
+                        bloco = await laco.run_in_executor(None, next, blocos, _FIM_BLOCOS)
+                        if bloco is _FIM_BLOCOS:
+                            break
+                        await self._enfileirar(impressora, fila, progresso, trabalho, bloco)
+            except ErroTrabalhadorEncerrado as e:
+                self._falhar_trabalho(progresso, trabalho, e)
+                trabalho.concluido.set()
+                raise
+            except BaseException as e:
+                # Falha ao gerar os blocos: o trabalhador aborta o que já começou a enviar
+                self._falhar_trabalho(progresso, trabalho, e)
+                await self._enfileirar(impressora, fila, None, trabalho, _FIM_TRABALHO)
+                raise
+            await self._enfileirar(impressora, fila, None, trabalho, _FIM_TRABALHO)
+        return trabalho
+
+    async def _enfileirar(self, nome, fila, progresso, trabalho, bloco):
+        tarefa = self._tarefas[nome]
+        if tarefa.done():
+            raise ErroTrabalhadorEncerrado(f"O envio para '{nome}' foi encerrado; o trabalho não foi aceito.")
+        if progresso is not None:
+            progresso.blocos_enfileirados += 1
+            progresso.etiquetas_enfileiradas += contar_etiquetas(bloco)
+        await fila.put((trabalho, bloco))
+        if tarefa.done():
+            self._esvaziar(nome)
+            raise ErroTrabalhadorEncerrado(f"O envio para '{nome}' foi encerrado; o trabalho não foi aceito.")
+
+    def _trabalhador_encerrado(self, nome, tarefa):
+        """Chamado quando a tarefa de envio termina: libera quem espera pela fila."""
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            self._registrar_erro(self.progresso[nome], tarefa.exception())
+        self._esvaziar(nome)
+
+    def _esvaziar(self, nome):
+        fila = self._filas.get(nome)
+        while fila is not None and not fila.empty():
+            trabalho, bloco = fila.get_nowait()
+            progresso = self.progresso[nome]
+            if trabalho.erro is None:
+                self._falhar_trabalho(progresso, trabalho, ErroTransporte("a tarefa de envio foi encerrada"))
+            if bloco is _FIM_TRABALHO:
+                trabalho.concluido.set()
+            else:
+                self._descartar(progresso, bloco)
+            fila.task_done()
+
+    def status(self, nome):
+        """Último status (~HS) conhecido da impressora ou None."""
+        return self.monitor.ultimo(nome) if self.monitor else None
+
+    async def _aguardar_liberacao(self, nome, config, leitor, escritor):
+        if self.monitor is None or nome in self._sem_status or not config.get("controle_fluxo", True):
+            return
+        try:
+            await self.monitor.aguardar_liberacao_async(nome, leitor, escritor)
+        except ImpressoraIndisponivel:
+            # Prazo esgotado: o trabalho falha (tratado pelo trabalhador)
+            raise
+        except ErroStatus as e:
+            print(f"[LOG] {e} Enviando para '{nome}' sem controle de fluxo.\n")
+            self._sem_status.add(nome)
+
+    async def aguardar(self):
+        """Aguarda até que todas as filas tenham sido enviadas."""
+        await asyncio.gather(*(fila.join() for fila in self._filas.values()))
+
+    async def fechar(self):
+        """Aguarda as filas e encerra as tarefas de envio."""
+        await self.aguardar()
+        for tarefa in self._tarefas.values():
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas.values(), return_exceptions=True)
+        self._tarefas.clear()
+        self._filas.clear()
+
+    def _registrar_envio(self, progresso, trabalho, bloco):
+        agora = time.monotonic()
+        progresso.inicio = progresso.inicio or agora
+        progresso.ultimo_envio = agora
+        progresso.blocos_enviados += 1
+        progresso.bytes_enviados += len(bloco)
+        metricas.incrementar("bytes_enviados", len(bloco), impressora=progresso.nome)
+        etiquetas = contar_etiquetas(bloco)
+        progresso.etiquetas_enviadas += etiquetas
+        trabalho.etiquetas_enviadas += etiquetas
+        if self.ao_progredir:
+            self.ao_progredir(progresso)
+
+    def _registrar_erro(self, progresso, erro):
+        metricas.incrementar("erros_envio", impressora=progresso.nome)
+        progresso.erros += 1
+        progresso.ultimo_erro = str(erro)
+        print(f"[ERRO] Falha ao enviar para '{progresso.nome}': {erro}\n")
+
+    def _falhar_trabalho(self, progresso, trabalho, erro):
+        """
+        Marca o trabalho como interrompido na primeira etiqueta que não foi impressa.
+
+        No CUPS e no IPP o trabalho interrompido é descartado inteiro, então é a primeira.
+        """
+        if trabalho.erro is not None:
+            return
+        trabalho.etiqueta_falha = 1 if progresso.nome in self._tudo_ou_nada else trabalho.etiquetas_enviadas + 1
+        trabalho.erro = ErroTransporte(
+            f"Envio interrompido na etiqueta {trabalho.etiqueta_falha}; o restante do trabalho foi descartado ({erro})"
+        )
+        progresso.trabalhos_com_erro += 1
+        self._registrar_erro(progresso, trabalho.erro)
+
+    @staticmethod
+    def _descartar(progresso, bloco):
+        """Tira da contagem de pendentes um bloco de um trabalho que falhou."""
+        progresso.etiquetas_descartadas += contar_etiquetas(bloco)
+
+    def _concluir_trabalho(self, progresso, trabalho):
+        if trabalho.erro is None:
+            progresso.trabalhos_concluidos += 1
+        trabalho.concluido.set()
+
+    async def _conectar_raw(self, nome, config):
+        conexao = self._conexoes_raw.get(nome)
+        if conexao is not None and (conexao[1].is_closing() or conexao[0].at_eof()):
+            # A impressora fechou a conexão enquanto ela estava ociosa
+            self._fechar_raw(nome)
+            conexao = None
+        if conexao is None:
+            leitor, escritor = await asyncio.wait_for(
+                asyncio.open_connection(config["host"], config.get("porta", PORTA_PADRAO)), TIMEOUT_CONEXAO,
+            )
+            # Sem folga no buffer do transporte, a contrapressão do TCP chega logo ao drain()
+            escritor.transport.set_write_buffer_limits(0)
+            conexao = self._conexoes_raw[nome] = (leitor, escritor)
+        return conexao
+
+    def _fechar_raw(self, nome):
+        conexao = self._conexoes_raw.pop(nome, None)
+        if conexao is not None:
+            conexao[1].close()
+
+    async def _enviar_bloco_raw(self, nome, config, progresso, trabalho, bloco):
+        """
+        Envia um bloco. Só a conexão é tentada de novo: depois que o bloco começa a ser
+        escrito, uma queda falha o trabalho, pois não há como saber o que chegou à
+        impressora (drain() só garante a entrega ao sistema) e reenviar o bloco, inteiro
+        ou em parte, poderia imprimir etiquetas repetidas ou corrompidas.
+        """
+        for tentativa in range(1, TENTATIVAS_ENVIO + 1):
+            try:
+                leitor, escritor = await self._conectar_raw(nome, config)
+                await self._aguardar_liberacao(nome, config, leitor, escritor)
+                break
+            except (OSError, asyncio.TimeoutError) as e:
+                self._fechar_raw(nome)
+                if tentativa == TENTATIVAS_ENVIO:
+                    self._falhar_trabalho(progresso, trabalho, e)
+                    self._descartar(progresso, bloco)
+                    return
+                await asyncio.sleep(0.5 * tentativa)
+        try:
+            inicio = time.perf_counter_ns()
+            escritor.write(bloco)
+            # drain() devolve a contrapressão do TCP para a fila
+            await asyncio.wait_for(escritor.drain(), TIMEOUT_ENVIO)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._fechar_raw(nome)
+            self._falhar_trabalho(progresso, trabalho, e)
+            self._descartar(progresso, bloco)
+            return
+        metricas.registrar_tempo("envio_bloco", time.perf_counter_ns() - inicio, impressora=nome)
+        self._registrar_envio(progresso, trabalho, bloco)
+
+    async def _trabalhador_raw(self, nome, config):
+        """Envia os blocos por uma conexão 9100 mantida aberta entre os trabalhos."""
+        fila = self._filas[nome]
+        progresso = self.progresso[nome]
+        try:
+            while True:
+                trabalho, bloco = await fila.get()
+                try:
+                    if bloco is _FIM_TRABALHO:
+                        self._concluir_trabalho(progresso, trabalho)
+                    elif trabalho.erro is None:
+                        await self._enviar_bloco_raw(nome, config, progresso, trabalho, bloco)
+                    else:
+                        self._descartar(progresso, bloco)
+                except Exception as e:
+                    # Só o trabalho atual é perdido; a tarefa continua atendendo os próximos
+                    self._fechar_raw(nome)
+                    self._falhar_trabalho(progresso, trabalho, e)
+                    self._descartar(progresso, bloco)
+                finally:
+                    fila.task_done()
+        finally:
+            self._fechar_raw(nome)
+
+    @staticmethod
+    async def _abortar_lp(processo):
+        """Mata o lp sem fechar o stdin normalmente, para o CUPS não imprimir o trabalho pela metade."""
+        try:
+            processo.kill()
+        except ProcessLookupError:
+            pass
+        await processo.wait()
+
+    async def _trabalhador_cups(self, nome, fila_cups):
+        """Abre um `lp -o raw` por trabalho e alimenta o stdin com os blocos à medida que chegam."""
+        fila = self._filas[nome]
+        progresso = self.progresso[nome]
+        processo = None
+        try:
+            while True:
+                trabalho, bloco = await fila.get()
+                try:
+                    if bloco is _FIM_TRABALHO:
+                        if processo is not None:
+                            if trabalho.erro is not None:
+                                await self._abortar_lp(processo)
+                            else:
+                                processo.stdin.close()
+                                if await processo.wait() != 0:
+                                    self._falhar_trabalho(progresso, trabalho, ErroTransporte(
+                                        f"lp terminou com código {processo.returncode}"))
+                            processo = None
+                        self._concluir_trabalho(progresso, trabalho)
+                    elif trabalho.erro is None:
+                        if processo is None:
+                            processo = await asyncio.create_subprocess_exec(
+                                "lp", "-d", fila_cups, "-o", "raw",
+                                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+                            )
+                        processo.stdin.write(bloco)
+                        await processo.stdin.drain()
+                        self._registrar_envio(progresso, trabalho, bloco)
+                    else:
+                        self._descartar(progresso, bloco)
+                except Exception as e:
+                    # Um trabalho não vira dois: o lp é abortado e o restante do trabalho descartado
+                    if processo is not None:
+                        await self._abortar_lp(processo)
+                        processo = None
+                    self._falhar_trabalho(progresso, trabalho, e)
+                    if bloco is _FIM_TRABALHO:
+                        trabalho.concluido.set()
+                    else:
+                        self._descartar(progresso, bloco)
+                finally:
+                    fila.task_done()
+        finally:
+            if processo is not None:
+                processo.kill()
+
+    async def _trabalhador_ipp(self, nome, config):
+        """Envia cada trabalho como um Print-Job pela conexão IPP compartilhada com o CUPS."""
+        from scripts.utils import ipp
+
+        fila = self._filas[nome]
+        progresso = self.progresso[nome]
+        cliente = ipp.obter_cliente(config.get("servidor"))
+        fila_cups = config.get("fila_cups", nome)
+        laco = asyncio.get_running_loop()
+
+        while True:
+            trabalho, bloco = await fila.get()
+            if bloco is _FIM_TRABALHO or trabalho.erro is not None:
+                if bloco is _FIM_TRABALHO:
+                    self._concluir_trabalho(progresso, trabalho)
+                else:
+                    self._descartar(progresso, bloco)
+                fila.task_done()
+                continue
+
+            # Bloco retirado da fila e ainda não enviado; fim do trabalho já lido
+            estado = {"pendente": bloco, "terminou": False}
+
+            def corpo(bloco=bloco, trabalho=trabalho, estado=estado):
+                # Roda na thread do envio: lê os blocos seguintes da fila à medida que chegam
+                while True:
+                    if bloco is _FIM_TRABALHO:
+                        estado["pendente"] = None
+                        estado["terminou"] = True
+                        laco.call_soon_threadsafe(fila.task_done)
+                        if trabalho.erro is not None:
+                            # Interrompe o Print-Job antes do fim do corpo: o CUPS não cria o trabalho
+                            raise ErroTransporte("trabalho abortado durante a geração dos blocos")
+                        return
+                    yield bloco
+                    estado["pendente"] = None
+                    laco.call_soon_threadsafe(self._registrar_envio, progresso, trabalho, bloco)
+                    laco.call_soon_threadsafe(fila.task_done)
+                    _, bloco = asyncio.run_coroutine_threadsafe(fila.get(), laco).result()
+                    estado["pendente"] = bloco
+
+            try:
+                await laco.run_in_executor(None, cliente.enviar, fila_cups, corpo())
+            except Exception as e:
+                self._falhar_trabalho(progresso, trabalho, e)
+            if estado["pendente"] is not None:
+                if estado["pendente"] is _FIM_TRABALHO:
+                    estado["terminou"] = True
+                else:
+                    self._descartar(progresso, estado["pendente"])
+                fila.task_done()
+            # Depois de uma falha, descarta o que sobrou do trabalho
+            terminou = estado["terminou"]
+            while not terminou:
+                _, bloco = await fila.get()
+                terminou = bloco is _FIM_TRABALHO
+                if not terminou:
+                    self._descartar(progresso, bloco)
+                fila.task_done()
+            self._concluir_trabalho(progresso, trabalho)
+
+
+def _exibir_progresso(progresso):
+    if progresso.blocos_enviados % 100 == 0:
+        print(f"[LOG] {progresso.nome}: {progresso.etiquetas_enviadas} etiquetas enviadas, "
+              f"{progresso.etiquetas_pendentes} na fila.")
+
+
+async def _imprimir(trabalhos, impressoras, tamanho_fila, ao_progredir):
+    despachante = Despachante(impressoras, tamanho_fila, ao_progredir)
+    # Falhas de um trabalho já ficam no progresso da impressora; não interrompem os demais
+    await asyncio.gather(*(despachante.submeter(nome, blocos) for nome, blocos in trabalhos), return_exceptions=True)
+    await despachante.fechar()
+    return {nome: progresso.resumo() for nome, progresso in despachante.progresso.items()}
+
+
+def imprimir_em_paralelo(trabalhos, impressoras=None, tamanho_fila=TAMANHO_FILA, ao_progredir=_exibir_progresso):
+    """
+    Envia vários trabalhos ao mesmo tempo, cada um para a sua impressora.
+
+    :param trabalhos: Lista de tuplas (impressora, blocos ZPL).
+    :return: Dicionário com o resumo do progresso de cada impressora.
+    """
+    return asyncio.run(_imprimir(trabalhos, impressoras, tamanho_fila, ao_progredir))
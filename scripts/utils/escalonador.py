@@ -0,0 +1,230 @@
+"""
+Divide um trabalho grande entre várias impressoras compatíveis.
+
+O trabalho é cortado em fatias contíguas nos limites dos blocos ^XA...^XZ e cada
+fatia vai para a impressora com menos etiquetas pendentes (atribuídas e ainda
+não enviadas). O resultado registra qual impressora ficou com qual faixa de
+etiquetas, para o operador saber onde está cada parte do lote, e em que
+etiqueta parou cada fatia cujo envio falhou.
+
+Exemplo:
+    fatias = imprimir_distribuido(iter_zpl(etiquetas, modelo), ["Datamax_1", "Datamax_2"])
+"""
+import asyncio
+
+from scripts.core.zpl_generator import contar_etiquetas
+from scripts.utils.despachante import TAMANHO_FILA, Despachante
+from scripts.utils.transporte import ErroTransporte, carregar_impressoras
+
+ETIQUETAS_POR_FATIA = 500
+FATIAS_EM_ESPERA = 2
+
+
+class Fatia:
+    """Parte contígua de um trabalho, com a faixa de etiquetas que ela imprime (a partir de 1)."""
+
+    def __init__(self, numero, etiqueta_inicial):
+        self.numero = numero
+        self.etiqueta_inicial = etiqueta_inicial
+        self.etiquetas = 0
+        self.blocos = []
+        self.impressora = None
+        self.trabalho = None
+        self.erro = None
+        self.etiqueta_falha = None
+
+    @property
+    def etiqueta_final(self):
+        return self.etiqueta_inicial + self.etiquetas - 1
+
+    def falhar(self, erro, etiqueta=None):
+        """Registra que a fatia não foi impressa a partir de `etiqueta` (padrão: a primeira dela)."""
+        if self.erro is None:
+            self.erro = str(erro)
+            self.etiqueta_falha = etiqueta or self.etiqueta_inicial
+
+    def resumo(self):
+        return {
+            "fatia": self.numero,
+            "impressora": self.impressora,
+            "etiqueta_inicial": self.etiqueta_inicial,
+            "etiqueta_final": self.etiqueta_final,
+            "etiquetas": self.etiquetas,
+            "erro": self.erro,
+            "etiqueta_falha": self.etiqueta_falha,
+        }
+
+
+def impressoras_compativeis(impressoras, nome_modelo):
+    """
+    Filtra as impressoras que aceitam o modelo de etiqueta.
+
+    Impressoras sem a chave "modelos" no impressoras_config.json aceitam qualquer modelo.
+
+    :param impressoras: Configuração das impressoras.
+    :param nome_modelo: Nome do modelo (chave do etiquetas_config.json).
+    :return: Lista com os nomes das impressoras compatíveis.
+    """
+    return [
+        nome for nome, config in impressoras.items()
+        if "modelos" not in config or nome_modelo in config["modelos"]
+    ]
+
+
+def fatiar(blocos, etiquetas_por_fatia=ETIQUETAS_POR_FATIA, preambulo=None):
+    """
+    Agrupa os blocos em fatias contíguas de aproximadamente `etiquetas_por_fatia` etiquetas.
+
+    Os cortes acontecem sempre entre blocos. Blocos que não imprimem nada (como a
+    gravação de um formato ^DF) são colocados em `preambulo`, pois precisam ir para
+    todas as impressoras antes da primeira fatia.
+
+    :param blocos: Iterável de blocos ZPL em bytes.
+    :param etiquetas_por_fatia: Quantidade de etiquetas desejada por fatia.
+    :param preambulo: Lista que recebe os blocos de preâmbulo (opcional).
+    :return: Iterador de Fatia.
+    """
+    numero = 1
+    fatia = Fatia(numero, 1)
+    for bloco in blocos:
+        etiquetas = contar_etiquetas(bloco)
+        if not etiquetas and b"^DF" in bloco:
+            if preambulo is not None:
+                preambulo.append(bloco)
+            continue
+        fatia.blocos.append(bloco)
+        fatia.etiquetas += etiquetas
+        if fatia.etiquetas >= etiquetas_por_fatia:
+            yield fatia
+            numero += 1
+            fatia = Fatia(numero, fatia.etiqueta_final + 1)
+    if fatia.blocos:
+        yield fatia
+
+
+async def distribuir(blocos, impressoras, despachante, etiquetas_por_fatia=ETIQUETAS_POR_FATIA):
+    """
+    Distribui as fatias do trabalho entre as impressoras pelo critério de menos etiquetas pendentes.
+
+    :param blocos: Iterável de blocos ZPL em bytes.
+    :param impressoras: Nomes das impressoras compatíveis.
+    :param despachante: Despachante usado para o envio.
+    :param etiquetas_por_fatia: Quantidade de etiquetas desejada por fatia.
+    :return: Lista de Fatia, na ordem do trabalho, com a impressora atribuída e, se o
+        envio falhou, o erro e a etiqueta em que parou. Retorna depois que todas as
+        fatias terminaram de ser enviadas.
+    :raises ErroTransporte: Se o envio para todas as impressoras tiver sido encerrado.
+    """
+    if not impressoras:
+        raise ValueError("Nenhuma impressora compatível para distribuir o trabalho.")
+
+    preambulo = []
+    atribuidas = {nome: 0 for nome in impressoras}
+    filas = {nome: asyncio.Queue(FATIAS_EM_ESPERA) for nome in impressoras}
+    fatias = []
+
+    def pendentes(nome):
+        progresso = despachante.progresso.get(nome)
+        return atribuidas[nome] - (progresso.etiquetas_enviadas + progresso.etiquetas_descartadas if progresso else 0)
+
+    async def alimentar(nome):
+        enviou_preambulo = False
+        while True:
+            fatia = await filas[nome].get()
+            if fatia is None:
+                return
+            try:
+                if not enviou_preambulo and preambulo:
+                    # Sem o formato gravado, as linhas da fatia não imprimem nada
+                    formato = await despachante.submeter(nome, list(preambulo))
+                    await formato.concluido.wait()
+                    if formato.erro is not None:
+                        fatia.falhar(formato.erro)
+                        continue
+                    enviou_preambulo = True
+                fatia.trabalho = await despachante.submeter(nome, fatia.blocos)
+            except ErroTransporte as e:
+                fatia.falhar(e)
+            finally:
+                fatia.blocos = []
+
+    async def entregar(nome, item):
+        """Põe o item na fila do alimentador da impressora; False se ele já terminou."""
+        tarefa = tarefas[nome]
+        if tarefa.done():
+            return False
+        colocar = asyncio.ensure_future(filas[nome].put(item))
+        await asyncio.wait({colocar, tarefa}, return_when=asyncio.FIRST_COMPLETED)
+        if not colocar.done():
+            colocar.cancel()
+            return False
+        return True
+
+    tarefas = {nome: asyncio.create_task(alimentar(nome)) for nome in impressoras}
+    try:
+        for fatia in fatiar(blocos, etiquetas_por_fatia, preambulo):
+            fatias.append(fatia)
+            while True:
+                # Impressoras cujo alimentador terminou com erro ficam de fora
+                ativas = [nome for nome in impressoras if not tarefas[nome].done()]
+                if not ativas:
+                    raise ErroTransporte("O envio foi encerrado para todas as impressoras.")
+                nome = min(ativas, key=pendentes)
+                if await entregar(nome, fatia):
+                    break
+            fatia.impressora = nome
+            atribuidas[nome] += fatia.etiquetas
+        for nome in impressoras:
+            await entregar(nome, None)
+        resultados = await asyncio.gather(*tarefas.values(), return_exceptions=True)
+        for nome, resultado in zip(tarefas, resultados):
+            if isinstance(resultado, BaseException):
+                # Fatias que ficaram na fila de um alimentador encerrado não foram enviadas
+                while not filas[nome].empty():
+                    fatia = filas[nome].get_nowait()
+                    if fatia is not None:
+                        fatia.falhar(resultado)
+        for fatia in fatias:
+            if fatia.trabalho is not None:
+                await fatia.trabalho.concluido.wait()
+                if fatia.trabalho.erro is not None:
+                    fatia.falhar(fatia.trabalho.erro, fatia.etiqueta_inicial + fatia.trabalho.etiqueta_falha - 1)
+            elif fatia.erro is None:
+                fatia.falhar("a fatia não chegou a ser enviada")
+    finally:
+        for tarefa in tarefas.values():
+            tarefa.cancel()
+    return fatias
+
+
+def exibir_fatias(fatias):
+    """Mostra ao operador qual impressora ficou com cada faixa de etiquetas."""
+    print("[LOG] Distribuição do trabalho:")
+    for fatia in fatias:
+        print(f"  Fatia {fatia.numero}: etiquetas {fatia.etiqueta_inicial} a {fatia.etiqueta_final} "
+              f"-> {fatia.impressora}")
+        if fatia.erro is not None:
+            print(f"[ERRO]   Não impressa a partir da etiqueta {fatia.etiqueta_falha}: {fatia.erro}")
+
+
+async def _imprimir_distribuido(blocos, impressoras, config, etiquetas_por_fatia, tamanho_fila):
+    despachante = Despachante(config, tamanho_fila)
+    fatias = await distribuir(blocos, impressoras, despachante, etiquetas_por_fatia)
+    await despachante.fechar()
+    return fatias
+
+
+def imprimir_distribuido(blocos, impressoras, config=None, etiquetas_por_fatia=ETIQUETAS_POR_FATIA,
+                         tamanho_fila=TAMANHO_FILA):
+    """
+    Imprime um trabalho dividindo-o entre várias impressoras.
+
+    :param blocos: Iterável de blocos ZPL em bytes (ex.: iter_zpl).
+    :param impressoras: Nomes das impressoras (ver impressoras_compativeis).
+    :param config: Configuração das impressoras (padrão: impressoras_config.json).
+    :return: Lista de Fatia com a faixa de etiquetas de cada impressora.
+    """
+    config = config if config is not None else carregar_impressoras()
+    fatias = asyncio.run(_imprimir_distribuido(blocos, impressoras, config, etiquetas_por_fatia, tamanho_fila))
+    exibir_fatias(fatias)
+    return fatias
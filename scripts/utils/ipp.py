@@ -0,0 +1,300 @@
+"""
+Envio para o CUPS pelo protocolo IPP, sem executar o `lp` a cada trabalho.
+
+Cada trabalho é um Print-Job com o documento em application/vnd.cups-raw (o CUPS
+repassa o ZPL à impressora sem filtros). O corpo vai em HTTP/1.1 com
+Transfer-Encoding: chunked, lido direto do gerador de blocos, e a conexão com o
+CUPS (socket Unix local ou localhost:631) fica aberta entre um trabalho e outro.
+
+O servidor vem de CUPS_SERVER (caminho de socket ou host[:porta]); sem ele, usa o
+socket local do CUPS, se existir, ou localhost:631.
+
+Para usar pelo transporte, configure a impressora com o backend "ipp":
+    {"Datamax_M4206_MarkII": {"backend": "ipp", "fila_cups": "Datamax_M4206_MarkII",
+                              "servidor": "/run/cups/cups.sock"}}
+
+O emulador em scripts.utils.mock_ipp responde a esse protocolo para testes.
+"""
+import getpass
+import http.client
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from urllib.parse import quote
+
+from scripts.utils import metricas
+from scripts.utils.transporte import ErroConexao, ErroTransporte, _como_blocos
+
+SOCKETS_CUPS = ("/run/cups/cups.sock", "/var/run/cups/cups.sock", "/private/var/run/cupsd")
+PORTA_IPP = 631
+TIMEOUT_IPP = 30.0
+FORMATO_RAW = "application/vnd.cups-raw"
+TAMANHO_PEDACO = 64 * 1024
+
+VERSAO_IPP = (1, 1)
+OPERACAO_PRINT_JOB = 0x0002
+
+# Delimitadores de grupo e tipos de valor (RFC 8010)
+GRUPO_OPERACAO = 0x01
+GRUPO_TRABALHO = 0x02
+FIM_ATRIBUTOS = 0x03
+TIPO_INTEIRO = 0x21
+TIPO_ENUM = 0x23
+TIPO_TEXTO = 0x41
+TIPO_NOME = 0x42
+TIPO_URI = 0x45
+TIPO_CHARSET = 0x47
+TIPO_IDIOMA = 0x48
+TIPO_MIME = 0x49
+
+STATUS_OK = 0x0000
+STATUS_NAO_ENCONTRADO = 0x0406
+
+
+class ErroIPP(ErroTransporte):
+    """O CUPS recusou o trabalho."""
+
+
+def codificar_mensagem(codigo, id_requisicao, grupos, versao=VERSAO_IPP):
+    """
+    Monta uma mensagem IPP (sem o documento).
+
+    :param codigo: Operação (requisição) ou status (resposta).
+    :param grupos: Lista de (delimitador do grupo, [(tipo, nome, valor), ...]).
+    :return: bytes da mensagem.
+    """
+    partes = [struct.pack(">bbHI", versao[0], versao[1], codigo, id_requisicao)]
+    for delimitador, atributos in grupos:
+        partes.append(bytes((delimitador,)))
+        for tipo, nome, valor in atributos:
+            if tipo in (TIPO_INTEIRO, TIPO_ENUM):
+                valor = struct.pack(">i", valor)
+            else:
+                valor = valor.encode("utf-8")
+            nome = nome.encode("ascii")
+            partes.append(struct.pack(">BH", tipo, len(nome)) + nome + struct.pack(">H", len(valor)) + valor)
+    partes.append(bytes((FIM_ATRIBUTOS,)))
+    return b"".join(partes)
+
+
+def decodificar_mensagem(dados):
+    """
+    Lê uma mensagem IPP.
+
+    :return: Tupla (versão, código, id da requisição, {delimitador: {nome: valor}}, posição do documento).
+    :raises ValueError: Se a mensagem estiver truncada.
+    """
+    if len(dados) < 9:
+        raise ValueError("Mensagem IPP truncada.")
+    maior, menor, codigo, id_requisicao = struct.unpack_from(">bbHI", dados)
+    grupos = {}
+    atual = None
+    posicao = 8
+    nome_anterior = None
+    while True:
+        if posicao >= len(dados):
+            raise ValueError("Mensagem IPP sem fim dos atributos.")
+        tipo = dados[posicao]
+        posicao += 1
+        if tipo == FIM_ATRIBUTOS:
+            break
+        if tipo < 0x10:
+            atual = grupos.setdefault(tipo, {})
+            continue
+        tamanho_nome, = struct.unpack_from(">H", dados, posicao)
+        nome = dados[posicao + 2:posicao + 2 + tamanho_nome].decode("ascii")
+        posicao += 2 + tamanho_nome
+        tamanho_valor, = struct.unpack_from(">H", dados, posicao)
+        valor = dados[posicao + 2:posicao + 2 + tamanho_valor]
+        posicao += 2 + tamanho_valor
+        if len(valor) != tamanho_valor:
+            raise ValueError("Mensagem IPP truncada.")
+        if tipo in (TIPO_INTEIRO, TIPO_ENUM) and tamanho_valor == 4:
+            valor, = struct.unpack(">i", valor)
+        else:
+            valor = valor.decode("utf-8", "replace")
+        if atual is None:
+            raise ValueError("Atributo IPP fora de um grupo.")
+        # Nome vazio: valor adicional do atributo anterior (1setOf)
+        if not nome:
+            anterior = atual[nome_anterior]
+            atual[nome_anterior] = (anterior if isinstance(anterior, list) else [anterior]) + [valor]
+        else:
+            atual[nome] = valor
+            nome_anterior = nome
+    return (maior, menor), codigo, id_requisicao, grupos, posicao
+
+
+def servidor_padrao():
+    """Servidor do CUPS: CUPS_SERVER, o socket local ou localhost:631."""
+    servidor = os.environ.get("CUPS_SERVER")
+    if servidor:
+        return servidor
+    for caminho in SOCKETS_CUPS:
+        if os.path.exists(caminho):
+            return caminho
+    return f"localhost:{PORTA_IPP}"
+
+
+class _ConexaoUnix(http.client.HTTPConnection):
+    """HTTPConnection por socket Unix (o CUPS local atende como "localhost")."""
+
+    def __init__(self, caminho, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.caminho = caminho
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.caminho)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def _pedacos(cabecalho, blocos, enviados):
+    """Junta o cabeçalho IPP e os blocos de ZPL em pedaços de até TAMANHO_PEDACO bytes."""
+    buffer = bytearray(cabecalho)
+    for bloco in blocos:
+        buffer += bloco
+        enviados[0] += len(bloco)
+        if len(buffer) >= TAMANHO_PEDACO:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class ClienteIPP:
+    """
+    Conexão HTTP persistente com o CUPS para enviar trabalhos IPP.
+
+    Os trabalhos passam um de cada vez pela conexão; se o CUPS fechar a conexão
+    ociosa, ela é reaberta antes do próximo trabalho.
+
+    :param servidor: Caminho do socket Unix ou host[:porta] (padrão: servidor_padrao()).
+    :param timeout: Tempo máximo de cada operação de rede, em segundos.
+    :param usuario: requesting-user-name dos trabalhos (padrão: o usuário do processo).
+    """
+
+    def __init__(self, servidor=None, timeout=TIMEOUT_IPP, usuario=None):
+        self.servidor = servidor or servidor_padrao()
+        self.timeout = timeout
+        self.usuario = usuario or getpass.getuser()
+        self.ultimo_trabalho = None
+        self._conexao = None
+        self._id_requisicao = 0
+        self._trava = threading.Lock()
+
+    def _nova_conexao(self):
+        if self.servidor.startswith("/"):
+            return _ConexaoUnix(self.servidor, self.timeout)
+        host, _, porta = self.servidor.rpartition(":") if ":" in self.servidor else (self.servidor, "", "")
+        return http.client.HTTPConnection(host, int(porta) if porta else PORTA_IPP, timeout=self.timeout)
+
+    def _obter_conexao(self):
+        """Devolve a conexão, reabrindo-a se o servidor a fechou enquanto estava ociosa."""
+        conexao = self._conexao
+        if conexao is None:
+            conexao = self._conexao = self._nova_conexao()
+        if conexao.sock is not None:
+            try:
+                legivel, _, _ = select.select([conexao.sock], [], [], 0)
+            except (OSError, ValueError):
+                legivel = True
+            if legivel:
+                # Numa conexão ociosa, só há o que ler se o servidor a encerrou
+                conexao.close()
+        if conexao.sock is None:
+            try:
+                with metricas.etapa("conexao", impressora=self.servidor):
+                    conexao.connect()
+            except OSError as e:
+                raise ErroConexao(f"Não foi possível conectar ao CUPS em {self.servidor}: {e}") from e
+            metricas.incrementar("conexoes_abertas", impressora=self.servidor)
+        return conexao
+
+    def enviar(self, fila, dados, nome_trabalho="etiquetas"):
+        """
+        Envia os dados como um trabalho da fila.
+
+        :param fila: Nome da fila do CUPS.
+        :param dados: bytes, str ou iterável de blocos em bytes (ex.: iter_zpl).
+        :return: Número de bytes do documento enviados. O id do trabalho fica em `ultimo_trabalho`.
+        :raises ErroConexao: Se não for possível conectar ao CUPS.
+        :raises ErroIPP: Se o CUPS recusar o trabalho.
+        :raises ErroTransporte: Se a conexão cair durante o envio.
+        Erros do gerador de blocos são repassados depois de abortar a requisição.
+        """
+        caminho = f"/printers/{quote(fila, safe='')}"
+        with self._trava:
+            self._id_requisicao += 1
+            cabecalho = codificar_mensagem(OPERACAO_PRINT_JOB, self._id_requisicao, [(GRUPO_OPERACAO, [
+                (TIPO_CHARSET, "attributes-charset", "utf-8"),
+                (TIPO_IDIOMA, "attributes-natural-language", "en"),
+                (TIPO_URI, "printer-uri", f"ipp://localhost{caminho}"),
+                (TIPO_NOME, "requesting-user-name", self.usuario),
+                (TIPO_NOME, "job-name", nome_trabalho),
+                (TIPO_MIME, "document-format", FORMATO_RAW),
+            ])])
+            enviados = [0]
+            inicio = time.perf_counter_ns()
+            conexao = self._obter_conexao()
+            try:
+                conexao.request("POST", caminho, body=_pedacos(cabecalho, _como_blocos(dados), enviados),
+                                headers={"Content-Type": "application/ipp"})
+                resposta = conexao.getresponse()
+                conteudo = resposta.read()
+            except (OSError, http.client.HTTPException) as e:
+                conexao.close()
+                metricas.incrementar("erros_envio", impressora=fila)
+                raise ErroTransporte(f"Falha ao enviar para a fila '{fila}' por IPP: {e}") from e
+            except BaseException:
+                # Erro ao gerar os blocos: fechar sem o último pedaço do corpo faz o CUPS
+                # descartar a requisição, em vez de criar um trabalho pela metade
+                conexao.close()
+                metricas.incrementar("erros_envio", impressora=fila)
+                raise
+
+        if resposta.status != 200:
+            metricas.incrementar("erros_envio", impressora=fila)
+            raise ErroIPP(f"O CUPS respondeu HTTP {resposta.status} {resposta.reason} para a fila '{fila}'.")
+        try:
+            _, status, _, grupos, _ = decodificar_mensagem(conteudo)
+        except (ValueError, struct.error) as e:
+            metricas.incrementar("erros_envio", impressora=fila)
+            raise ErroIPP(f"Resposta IPP inválida para a fila '{fila}': {e}") from e
+        if status > 0x00FF:
+            metricas.incrementar("erros_envio", impressora=fila)
+            mensagem = grupos.get(GRUPO_OPERACAO, {}).get("status-message", "")
+            raise ErroIPP(f"O CUPS recusou o trabalho na fila '{fila}' (status 0x{status:04x}) {mensagem}".strip())
+
+        self.ultimo_trabalho = grupos.get(GRUPO_TRABALHO, {}).get("job-id")
+        metricas.registrar_tempo("envio_ipp", time.perf_counter_ns() - inicio, impressora=fila)
+        metricas.incrementar("bytes_enviados", enviados[0], impressora=fila)
+        return enviados[0]
+
+    def fechar(self):
+        with self._trava:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+
+_clientes = {}
+_trava_clientes = threading.Lock()
+
+
+def obter_cliente(servidor=None):
+    """Retorna o cliente IPP compartilhado pelo processo para o servidor informado."""
+    servidor = servidor or servidor_padrao()
+    with _trava_clientes:
+        cliente = _clientes.get(servidor)
+        if cliente is None:
+            cliente = _clientes[servidor] = ClienteIPP(servidor)
+        return cliente
@@ -1,11 +1,9 @@
-import json
-
-# Caminho para o arquivo JSON
-caminho_json = "/Applications/MAMP/htdocs/ZPL_estudos/config/etiquetas_config.json"
+from scripts.core.config import carregar_modelos
 
 # Carregar o arquivo de configuração
-with open(caminho_json, "r") as file:
-    modelos = json.load(file)
+modelos = carregar_modelos()
+if not modelos:
+    exit()
 
 # Listar modelos disponíveis com números
 print("Modelos disponíveis:")
@@ -0,0 +1,283 @@
+"""
+Métricas de desempenho: tempo de cada etapa, contadores e latência de envio por impressora.
+
+Ficam desativadas por padrão. Para ativar, use ETIQUETAS_METRICAS=1 ou chame ativar().
+Desativadas, cada ponto de medição custa só a checagem de `ativo`, então podem ficar
+no código de produção.
+
+Os tempos são medidos com time.perf_counter_ns e acumulados em histogramas. A
+exportação é em texto no formato do Prometheus (exportar_prometheus) ou em um resumo
+JSON (resumo). Ao fim do processo, o resumo é gravado em ETIQUETAS_METRICAS_JSON e o
+texto Prometheus em ETIQUETAS_METRICAS_PROM; sem essas variáveis, o resumo vai para stderr.
+
+Exemplo:
+    with metricas.etapa("carregamento", formato="csv"):
+        df = carregar(...)
+    metricas.incrementar("etiquetas_geradas", len(etiquetas))
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+PREFIXO = "etiquetas_"
+
+# Limites (em segundos) dos histogramas de tempo
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+ativo = os.environ.get("ETIQUETAS_METRICAS", "") not in ("", "0")
+
+_trava = threading.Lock()
+_contadores = {}
+_tempos = {}
+_exportacao_registrada = False
+
+
+class _Serie:
+    """Histograma de durações (em nanossegundos) de uma etapa."""
+
+    __slots__ = ("contagem", "soma_ns", "maximo_ns", "baldes")
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma_ns = 0
+        self.maximo_ns = 0
+        self.baldes = [0] * len(LIMITES_SEGUNDOS)
+
+    def registrar(self, duracao_ns):
+        self.contagem += 1
+        self.soma_ns += duracao_ns
+        if duracao_ns > self.maximo_ns:
+            self.maximo_ns = duracao_ns
+        segundos = duracao_ns / 1e9
+        for posicao, limite in enumerate(LIMITES_SEGUNDOS):
+            if segundos <= limite:
+                self.baldes[posicao] += 1
+                break
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def ativar():
+    """Liga a coleta de métricas no processo."""
+    global ativo, _exportacao_registrada
+    ativo = True
+    if not _exportacao_registrada:
+        atexit.register(_exportar_ao_encerrar)
+        _exportacao_registrada = True
+
+
+def desativar():
+    global ativo
+    ativo = False
+
+
+def limpar():
+    """Descarta tudo o que foi coletado."""
+    with _trava:
+        _contadores.clear()
+        _tempos.clear()
+
+
+def incrementar(nome, valor=1, **rotulos):
+    """Soma `valor` ao contador."""
+    if not ativo:
+        return
+    chave = _chave(nome, rotulos)
+    with _trava:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+
+def registrar_tempo(nome, duracao_ns, **rotulos):
+    """Registra uma duração já medida (em nanossegundos)."""
+    if not ativo:
+        return
+    chave = _chave(nome, rotulos)
+    with _trava:
+        serie = _tempos.get(chave)
+        if serie is None:
+            serie = _tempos[chave] = _Serie()
+        serie.registrar(duracao_ns)
+
+
+class _Etapa:
+    __slots__ = ("nome", "rotulos", "inicio")
+
+    def __init__(self, nome, rotulos):
+        self.nome = nome
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        registrar_tempo(self.nome, time.perf_counter_ns() - self.inicio, **self.rotulos)
+
+
+class _EtapaNula:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_ETAPA_NULA = _EtapaNula()
+
+
+def etapa(nome, **rotulos):
+    """Gerenciador de contexto que mede a duração do bloco `with`."""
+    if not ativo:
+        return _ETAPA_NULA
+    return _Etapa(nome, rotulos)
+
+
+def cronometrar(nome):
+    """Decorador que mede cada chamada da função como a etapa `nome`."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            if not ativo:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter_ns()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                registrar_tempo(nome, time.perf_counter_ns() - inicio)
+        return medida
+    return decorador
+
+
+def medir_iteracao(nome, itens, contar_etiquetas=None):
+    """
+    Mede o tempo gasto produzindo os itens de um iterador (sem contar o tempo do consumidor).
+
+    Para blocos em bytes, conta também blocos, bytes e, se `contar_etiquetas` for
+    informado, etiquetas. Desativado, devolve o próprio iterador.
+    """
+    if not ativo:
+        return itens
+    return _medir_iteracao(nome, itens, contar_etiquetas)
+
+
+def _medir_iteracao(nome, itens, contar_etiquetas):
+    iterador = iter(itens)
+    total_ns = quantidade = tamanho = etiquetas = 0
+    try:
+        while True:
+            inicio = time.perf_counter_ns()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                total_ns += time.perf_counter_ns() - inicio
+                return
+            total_ns += time.perf_counter_ns() - inicio
+            quantidade += 1
+            if isinstance(item, (bytes, bytearray, memoryview)):
+                tamanho += len(item)
+                if contar_etiquetas is not None:
+                    etiquetas += contar_etiquetas(item)
+            yield item
+    finally:
+        registrar_tempo(nome, total_ns)
+        incrementar(f"{nome}_itens", quantidade)
+        if tamanho:
+            incrementar(f"{nome}_bytes", tamanho)
+        if etiquetas:
+            incrementar(f"{nome}_etiquetas", etiquetas)
+
+
+def _escapar_rotulo(valor):
+    """Escapa \\, " e quebras de linha do valor de um rótulo, como pede o formato de texto do Prometheus."""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = [f'{chave}="{_escapar_rotulo(valor)}"' for chave, valor in tuple(rotulos) + tuple(extra)]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def exportar_prometheus():
+    """Texto no formato de exposição do Prometheus."""
+    with _trava:
+        contadores = dict(_contadores)
+        tempos = {chave: (serie.contagem, serie.soma_ns, list(serie.baldes)) for chave, serie in _tempos.items()}
+
+    linhas = []
+    tipos = set()
+    for (nome, rotulos), valor in sorted(contadores.items()):
+        metrica = f"{PREFIXO}{nome}_total"
+        if metrica not in tipos:
+            linhas.append(f"# TYPE {metrica} counter")
+            tipos.add(metrica)
+        linhas.append(f"{metrica}{_formatar_rotulos(rotulos)} {valor}")
+    for (nome, rotulos), (contagem, soma_ns, baldes) in sorted(tempos.items()):
+        metrica = f"{PREFIXO}{nome}_segundos"
+        if metrica not in tipos:
+            linhas.append(f"# TYPE {metrica} histogram")
+            tipos.add(metrica)
+        acumulado = 0
+        for limite, quantidade in zip(LIMITES_SEGUNDOS, baldes):
+            acumulado += quantidade
+            linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos, [('le', limite)])} {acumulado}")
+        linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos, [('le', '+Inf')])} {contagem}")
+        linhas.append(f"{metrica}_sum{_formatar_rotulos(rotulos)} {soma_ns / 1e9:.9f}")
+        linhas.append(f"{metrica}_count{_formatar_rotulos(rotulos)} {contagem}")
+    return "\n".join(linhas) + "\n"
+
+
+def _nome_com_rotulos(nome, rotulos):
+    pares = [f"{chave}={valor}" for chave, valor in rotulos]
+    return nome + "{" + ",".join(pares) + "}" if pares else nome
+
+
+def resumo():
+    """Resumo da execução: contadores e, para cada etapa, contagem, tempo total, médio e máximo."""
+    with _trava:
+        return {
+            "contadores": {_nome_com_rotulos(nome, rotulos): valor for (nome, rotulos), valor in sorted(_contadores.items())},
+            "etapas": {
+                _nome_com_rotulos(nome, rotulos): {
+                    "contagem": serie.contagem,
+                    "total_s": round(serie.soma_ns / 1e9, 6),
+                    "media_ms": round(serie.soma_ns / serie.contagem / 1e6, 3) if serie.contagem else 0.0,
+                    "maximo_ms": round(serie.maximo_ns / 1e6, 3),
+                }
+                for (nome, rotulos), serie in sorted(_tempos.items())
+            },
+        }
+
+
+def gravar_resumo(caminho):
+    with open(caminho, "w") as f:
+        json.dump(resumo(), f, indent=4, ensure_ascii=False)
+
+
+def _exportar_ao_encerrar():
+    if not (_contadores or _tempos):
+        return
+    caminho_json = os.environ.get("ETIQUETAS_METRICAS_JSON")
+    caminho_prom = os.environ.get("ETIQUETAS_METRICAS_PROM")
+    try:
+        if caminho_json:
+            gravar_resumo(caminho_json)
+        if caminho_prom:
+            with open(caminho_prom, "w") as f:
+                f.write(exportar_prometheus())
+        if not (caminho_json or caminho_prom):
+            print(json.dumps(resumo(), indent=4, ensure_ascii=False), file=sys.stderr)
+    except OSError as e:
+        print(f"[ERRO] Não foi possível exportar as métricas: {e}", file=sys.stderr)
+
+
+if ativo:
+    ativo = False
+    ativar()
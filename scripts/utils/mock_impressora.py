@@ -0,0 +1,316 @@
+"""
+Emulador de impressora ZPL na porta 9100 para testes e medições sem hardware.
+
+Uso:
+    python -m scripts.utils.mock_impressora --porta 9100 --ips 6 --buffer 262144
+
+Depois, configure no impressoras_config.json uma impressora "raw" apontando para
+127.0.0.1 e a porta escolhida.
+"""
+import argparse
+import re
+import socket
+import threading
+import time
+from collections import deque
+
+DPI_PADRAO = 203
+ALTURA_PADRAO = DPI_PADRAO  # 1 polegada quando o formato não informa ^LL
+
+_RE_PQ = re.compile(rb"\^PQ(\d+)")
+_RE_LL = re.compile(rb"\^LL(\d+)")
+_RE_DF = re.compile(rb"\^DF([^^~]+?)\^FS")
+_RE_XF = re.compile(rb"\^XF([^^~]+?)\^FS")
+
+
+class EstatisticasMock:
+    """Contadores acumulados pelo emulador."""
+
+    def __init__(self):
+        self.conexoes = 0
+        self.bytes_recebidos = 0
+        self.formatos = 0
+        self.formatos_armazenados = 0
+        self.linhas_impressas = 0
+        self.etiquetas = 0
+        self.primeiro_byte = None
+        self.ultimo_byte = None
+        self.ultima_impressao = None
+
+    def resumo(self):
+        """Retorna os contadores e as taxas calculadas em um dicionário."""
+        duracao_recepcao = (self.ultimo_byte - self.primeiro_byte) if self.primeiro_byte else 0.0
+        duracao_total = (self.ultima_impressao - self.primeiro_byte) if self.ultima_impressao else duracao_recepcao
+        return {
+            "conexoes": self.conexoes,
+            "bytes_recebidos": self.bytes_recebidos,
+            "formatos": self.formatos,
+            "formatos_armazenados": self.formatos_armazenados,
+            "linhas_impressas": self.linhas_impressas,
+            "etiquetas": self.etiquetas,
+            "duracao_recepcao_s": duracao_recepcao,
+            "duracao_total_s": duracao_total,
+            "bytes_por_s": self.bytes_recebidos / duracao_recepcao if duracao_recepcao else 0.0,
+            "etiquetas_por_s": self.etiquetas / duracao_total if duracao_total else 0.0,
+        }
+
+
+class ImpressoraMock:
+    """
+    Servidor TCP que se comporta como uma impressora ZPL.
+
+    Os blocos ^XA...^XZ recebidos são contados e "impressos" por um motor que
+    respeita a velocidade configurada (polegadas por segundo). Com um buffer de
+    recepção finito, a leitura do socket para quando o buffer enche, e o
+    cliente sente a contrapressão do TCP como em uma impressora real. O comando
+    ~HS é respondido com o estado simulado (pausa, papel, cabeça, formatos no buffer).
+
+    :param host: Endereço de escuta.
+    :param porta: Porta de escuta (0 escolhe uma porta livre).
+    :param ips: Velocidade de impressão em polegadas por segundo (None imprime instantaneamente).
+    :param dpi: Resolução usada para converter ^LL em polegadas.
+    :param buffer_bytes: Capacidade do buffer de recepção (None para ilimitado).
+    """
+
+    def __init__(self, host="127.0.0.1", porta=0, ips=None, dpi=DPI_PADRAO, buffer_bytes=None):
+        self.host = host
+        self.porta = porta
+        self.ips = ips
+        self.dpi = dpi
+        self.buffer_bytes = buffer_bytes
+        self.estatisticas = EstatisticasMock()
+        # Estados que podem ser alterados durante o teste (refletidos no ~HS)
+        self.pausada = False
+        self.sem_papel = False
+        self.cabeca_aberta = False
+        self._restantes = 0
+        self._alturas_formatos = {}
+        self._fila = deque()
+        self._ocupado = 0
+        self._cond = threading.Condition()
+        self._ativo = False
+        self._servidor = None
+        self._threads = []
+
+    # Ciclo de vida
+
+    def iniciar(self):
+        """Começa a escutar em segundo plano e retorna (host, porta)."""
+        self._servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._servidor.bind((self.host, self.porta))
+        self._servidor.listen()
+        self.porta = self._servidor.getsockname()[1]
+        self._ativo = True
+        for alvo in (self._aceitar, self._motor):
+            thread = threading.Thread(target=alvo, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self.host, self.porta
+
+    def parar(self):
+        self._ativo = False
+        with self._cond:
+            self._cond.notify_all()
+        try:
+            self._servidor.close()
+        except OSError:
+            pass
+
+    def aguardar_ociosa(self, timeout=None):
+        """Bloqueia até que todos os formatos recebidos tenham sido impressos."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._fila or self._ocupado:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    # Recepção
+
+    def _aceitar(self):
+        while self._ativo:
+            try:
+                conexao, _ = self._servidor.accept()
+            except OSError:
+                break
+            self.estatisticas.conexoes += 1
+            threading.Thread(target=self._receber, args=(conexao,), daemon=True).start()
+
+    def _espaco_livre(self):
+        if self.buffer_bytes is None:
+            return 65536
+        return self.buffer_bytes - self._ocupado
+
+    def _receber(self, conexao):
+        pendente = bytearray()
+        with conexao:
+            while self._ativo:
+                with self._cond:
+                    # Buffer cheio: para de ler e deixa o TCP segurar o cliente
+                    while self._ativo and self._espaco_livre() <= 0 and self._fila:
+                        self._cond.wait()
+                    tamanho = max(self._espaco_livre(), 1024)
+                try:
+                    dados = conexao.recv(min(tamanho, 65536))
+                except OSError:
+                    break
+                if not dados:
+                    break
+                agora = time.monotonic()
+                with self._cond:
+                    if self.estatisticas.primeiro_byte is None:
+                        self.estatisticas.primeiro_byte = agora
+                    self.estatisticas.ultimo_byte = agora
+                    self.estatisticas.bytes_recebidos += len(dados)
+                    self._ocupado += len(dados)
+                pendente += dados
+                self._responder_status(pendente, conexao)
+                self._extrair_formatos(pendente)
+
+    def _responder_status(self, pendente, conexao):
+        """Comandos ~HS são atendidos na hora, mesmo com formatos aguardando impressão."""
+        while True:
+            posicao = pendente.find(b"~HS")
+            if posicao < 0:
+                return
+            del pendente[posicao:posicao + 3]
+            self._liberar(3)
+            try:
+                conexao.sendall(self.resposta_status())
+            except OSError:
+                return
+
+    def resposta_status(self):
+        """Monta a resposta do ~HS com o estado atual da impressora simulada."""
+        with self._cond:
+            formatos = len(self._fila)
+            cheio = self.buffer_bytes is not None and self._espaco_livre() <= 0
+            restantes = self._restantes
+        linha1 = f"030,{int(self.sem_papel)},{int(self.pausada)},{ALTURA_PADRAO:04d},{formatos:03d},{int(cheio)},0,0,000,0,0,0"
+        linha2 = f"001,0,{int(self.cabeca_aberta)},0,0,2,4,0,{restantes:08d},1,000"
+        linha3 = "1234,0"
+        return b"".join(b"\x02" + linha.encode("ascii") + b"\x03\r\n" for linha in (linha1, linha2, linha3))
+
+    def _extrair_formatos(self, pendente):
+        while True:
+            inicio = pendente.find(b"^XA")
+            if inicio < 0:
+                # Mantém um "^" ou "^X" final que pode ser o começo do próximo ^XA
+                manter = 2 if pendente.endswith(b"^X") else 1 if pendente.endswith(b"^") else 0
+                descartar = len(pendente) - manter
+                self._liberar(descartar)
+                del pendente[:descartar]
+                return
+            fim = pendente.find(b"^XZ", inicio)
+            if fim < 0:
+                if inicio:
+                    self._liberar(inicio)
+                    del pendente[:inicio]
+                return
+            fim += 3
+            formato = bytes(pendente[inicio:fim])
+            descartado = inicio
+            del pendente[:fim]
+            if descartado:
+                self._liberar(descartado)
+            self._enfileirar(formato)
+
+    def _liberar(self, tamanho):
+        if not tamanho:
+            return
+        with self._cond:
+            self._ocupado -= tamanho
+            self._cond.notify_all()
+
+    def _enfileirar(self, formato):
+        with self._cond:
+            self.estatisticas.formatos += 1
+            self._fila.append(formato)
+            self._cond.notify_all()
+
+    # Impressão
+
+    def _altura(self, formato):
+        encontrado = _RE_LL.search(formato)
+        if encontrado:
+            return int(encontrado.group(1))
+        recuperado = _RE_XF.search(formato)
+        if recuperado:
+            return self._alturas_formatos.get(recuperado.group(1), ALTURA_PADRAO)
+        return ALTURA_PADRAO
+
+    def _imprimir(self, formato, quantidade):
+        """Simula a impressão etiqueta a etiqueta, respeitando pausa, papel e cabeça aberta."""
+        duracao = self._altura(formato) / self.dpi / self.ips if self.ips else 0.0
+        self._restantes = quantidade
+        while self._restantes and self._ativo:
+            if self.pausada or self.sem_papel or self.cabeca_aberta:
+                time.sleep(0.05)
+                continue
+            if duracao:
+                time.sleep(duracao)
+            self._restantes -= 1
+
+    def _motor(self):
+        while True:
+            with self._cond:
+                while self._ativo and not self._fila:
+                    self._cond.wait()
+                if not self._ativo:
+                    return
+                formato = self._fila[0]
+
+            armazenado = _RE_DF.search(formato)
+            if armazenado:
+                self._alturas_formatos[armazenado.group(1)] = self._altura(formato)
+                quantidade = 0
+            else:
+                encontrado = _RE_PQ.search(formato)
+                quantidade = int(encontrado.group(1)) if encontrado else 1
+                self._imprimir(formato, quantidade)
+
+            with self._cond:
+                self._fila.popleft()
+                self._ocupado -= len(formato)
+                if armazenado:
+                    self.estatisticas.formatos_armazenados += 1
+                else:
+                    self.estatisticas.linhas_impressas += quantidade
+                    self.estatisticas.etiquetas += formato.count(b"^FD") * quantidade
+                self.estatisticas.ultima_impressao = time.monotonic()
+                self._cond.notify_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulador de impressora ZPL (porta 9100).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=9100)
+    parser.add_argument("--ips", type=float, default=None, help="Velocidade de impressão em polegadas por segundo.")
+    parser.add_argument("--dpi", type=int, default=DPI_PADRAO)
+    parser.add_argument("--buffer", type=int, default=None, help="Tamanho do buffer de recepção em bytes.")
+    args = parser.parse_args()
+
+    impressora = ImpressoraMock(args.host, args.porta, args.ips, args.dpi, args.buffer)
+    host, porta = impressora.iniciar()
+    print(f"[LOG] Impressora simulada escutando em {host}:{porta}. Ctrl+C para encerrar.\n")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"[LOG] {impressora.estatisticas.resumo()}")
+    except KeyboardInterrupt:
+        impressora.parar()
+        print(f"\n[LOG] Resumo final: {impressora.estatisticas.resumo()}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Emulador de CUPS que aceita trabalhos IPP (Print-Job) para testes sem CUPS instalado.
+
+Uso:
+    python -m scripts.utils.mock_ipp --porta 6310 [--filas Datamax_M4206_MarkII,Zebra]
+    python -m scripts.utils.mock_ipp --socket /tmp/cups.sock
+
+Depois, configure no impressoras_config.json uma impressora "ipp" com
+"servidor": "127.0.0.1:6310" (ou o caminho do socket).
+"""
+import argparse
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import unquote, urlsplit
+
+from scripts.utils import ipp
+
+
+class EstatisticasIPP:
+    """Contadores acumulados pelo emulador."""
+
+    def __init__(self):
+        self.conexoes = 0
+        self.requisicoes = 0
+        self.trabalhos = []
+
+    def resumo(self):
+        return {
+            "conexoes": self.conexoes,
+            "requisicoes": self.requisicoes,
+            "trabalhos": len(self.trabalhos),
+            "bytes_recebidos": sum(trabalho["bytes"] for trabalho in self.trabalhos),
+            "etiquetas": sum(trabalho["etiquetas"] for trabalho in self.trabalhos),
+        }
+
+
+class ServidorIPPMock:
+    """
+    Servidor HTTP/1.1 com keep-alive que responde ao Print-Job como o CUPS.
+
+    Cada trabalho recebido é registrado em `estatisticas.trabalhos` com a fila, o
+    formato do documento, o tamanho e as etiquetas (campos ^FD) contadas.
+
+    :param host: Endereço de escuta TCP.
+    :param porta: Porta de escuta (0 escolhe uma porta livre).
+    :param caminho_socket: Escuta em um socket Unix em vez de TCP.
+    :param filas: Filas aceitas (None aceita qualquer uma).
+    :param guardar_documentos: Guarda o documento recebido em cada trabalho (chave "documento").
+    """
+
+    def __init__(self, host="127.0.0.1", porta=0, caminho_socket=None, filas=None, guardar_documentos=False):
+        self.host = host
+        self.porta = porta
+        self.caminho_socket = caminho_socket
+        self.filas = set(filas) if filas is not None else None
+        self.guardar_documentos = guardar_documentos
+        self.estatisticas = EstatisticasIPP()
+        self._trava = threading.Lock()
+        self._servidor = None
+        self._conexoes = set()
+
+    @property
+    def servidor(self):
+        """Endereço no formato aceito por ipp.ClienteIPP."""
+        return self.caminho_socket or f"{self.host}:{self.porta}"
+
+    def iniciar(self):
+        """Começa a escutar em segundo plano e retorna o endereço do servidor."""
+        mock = self
+
+        class Manipulador(_ManipuladorIPP):
+            servidor_mock = mock
+
+        if self.caminho_socket:
+            if os.path.exists(self.caminho_socket):
+                os.remove(self.caminho_socket)
+            self._servidor = socketserver.ThreadingUnixStreamServer(self.caminho_socket, Manipulador)
+        else:
+            self._servidor = _ServidorTCP((self.host, self.porta), Manipulador)
+            self.porta = self._servidor.server_address[1]
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self.servidor
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+            # Encerra também as conexões mantidas abertas (keep-alive), como o CUPS ao reiniciar
+            with self._trava:
+                conexoes, self._conexoes = self._conexoes, set()
+            for conexao in conexoes:
+                try:
+                    conexao.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if self.caminho_socket and os.path.exists(self.caminho_socket):
+                os.remove(self.caminho_socket)
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def _registrar(self, fila, atributos, documento):
+        with self._trava:
+            trabalho = {
+                "id": len(self.estatisticas.trabalhos) + 1,
+                "fila": fila,
+                "formato": atributos.get("document-format"),
+                "usuario": atributos.get("requesting-user-name"),
+                "nome": atributos.get("job-name"),
+                "bytes": len(documento),
+                "etiquetas": documento.count(b"^FD"),
+                "recebido_em": time.time(),
+            }
+            if self.guardar_documentos:
+                trabalho["documento"] = bytes(documento)
+            self.estatisticas.trabalhos.append(trabalho)
+            return trabalho["id"]
+
+
+class _ServidorTCP(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+class _ManipuladorIPP(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    servidor_mock = None
+
+    def setup(self):
+        super().setup()
+        with self.servidor_mock._trava:
+            self.servidor_mock.estatisticas.conexoes += 1
+            self.servidor_mock._conexoes.add(self.connection)
+
+    def finish(self):
+        with self.servidor_mock._trava:
+            self.servidor_mock._conexoes.discard(self.connection)
+        super().finish()
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _ler_corpo(self):
+        """Corpo da requisição ou None se o cliente desconectou antes do fim."""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            corpo = bytearray()
+            while True:
+                linha = self.rfile.readline()
+                if not linha:
+                    return None
+                tamanho = int(linha.split(b";")[0].strip(), 16)
+                if tamanho == 0:
+                    # Cabeçalhos finais (trailers) até a linha vazia
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return corpo
+                pedaco = self.rfile.read(tamanho)
+                if len(pedaco) < tamanho:
+                    return None
+                corpo += pedaco
+                self.rfile.readline()
+        tamanho = int(self.headers.get("Content-Length", 0))
+        corpo = self.rfile.read(tamanho)
+        return corpo if len(corpo) == tamanho else None
+
+    def _responder(self, id_requisicao, status, atributos_trabalho=None, mensagem=None):
+        operacao = [
+            (ipp.TIPO_CHARSET, "attributes-charset", "utf-8"),
+            (ipp.TIPO_IDIOMA, "attributes-natural-language", "en"),
+        ]
+        if mensagem:
+            operacao.append((ipp.TIPO_TEXTO, "status-message", mensagem))
+        grupos = [(ipp.GRUPO_OPERACAO, operacao)]
+        if atributos_trabalho:
+            grupos.append((ipp.GRUPO_TRABALHO, atributos_trabalho))
+        corpo = ipp.codificar_mensagem(status, id_requisicao, grupos)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/ipp")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        corpo = self._ler_corpo()
+        if corpo is None:
+            # Como o CUPS: requisição interrompida não vira trabalho
+            self.close_connection = True
+            return
+        with self.servidor_mock._trava:
+            self.servidor_mock.estatisticas.requisicoes += 1
+        try:
+            _, operacao, id_requisicao, grupos, posicao = ipp.decodificar_mensagem(corpo)
+        except (ValueError, IndexError) as e:
+            self.send_error(400, str(e))
+            return
+        atributos = grupos.get(ipp.GRUPO_OPERACAO, {})
+        if operacao != ipp.OPERACAO_PRINT_JOB:
+            self._responder(id_requisicao, 0x0501, mensagem="Operação não suportada pelo emulador.")
+            return
+
+        uri = atributos.get("printer-uri") or self.path
+        fila = unquote(urlsplit(uri).path.rsplit("/", 1)[-1])
+        if self.servidor_mock.filas is not None and fila not in self.servidor_mock.filas:
+            self._responder(id_requisicao, ipp.STATUS_NAO_ENCONTRADO, mensagem=f"Fila desconhecida: {fila}")
+            return
+
+        id_trabalho = self.servidor_mock._registrar(fila, atributos, memoryview(corpo)[posicao:].tobytes())
+        self._responder(id_requisicao, ipp.STATUS_OK, [
+            (ipp.TIPO_URI, "job-uri", f"ipp://localhost/jobs/{id_trabalho}"),
+            (ipp.TIPO_INTEIRO, "job-id", id_trabalho),
+            (ipp.TIPO_ENUM, "job-state", 3),
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulador de CUPS para trabalhos IPP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=6310)
+    parser.add_argument("--socket", help="Escuta em um socket Unix em vez de TCP.")
+    parser.add_argument("--filas", help="Filas aceitas, separadas por vírgula (padrão: qualquer uma).")
+    args = parser.parse_args()
+
+    filas = args.filas.split(",") if args.filas else None
+    servidor = ServidorIPPMock(args.host, args.porta, args.socket, filas)
+    endereco = servidor.iniciar()
+    print(f"[LOG] CUPS simulado escutando em {endereco}. Ctrl+C para encerrar.\n")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"[LOG] {servidor.estatisticas.resumo()}")
+    except KeyboardInterrupt:
+        servidor.parar()
+        print(f"\n[LOG] Resumo final: {servidor.estatisticas.resumo()}\n")
+
+
+if __name__ == "__main__":
+    main()
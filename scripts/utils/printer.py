@@ -1,30 +1,148 @@
-import subprocess
+"""
+Registro das impressoras disponíveis: filas do CUPS e impressoras configuradas em
+config/impressoras_config.json (ver scripts.utils.transporte).
+
+As filas do CUPS são descobertas com `lpstat -e`, que só imprime os nomes e não
+depende do idioma do sistema (o comando roda com LC_ALL=C). O resultado fica em
+cache por TTL_SEGUNDOS; depois disso, a lista antiga continua sendo devolvida
+enquanto uma thread busca a nova, então consultar a lista não espera o lpstat.
+"""
+import os
+import threading
+import time
+
+from scripts.utils import metricas
+
+TTL_SEGUNDOS = float(os.environ.get("ETIQUETAS_IMPRESSORAS_TTL", 300))
+TIMEOUT_LPSTAT = 5.0
+
+ORIGEM_CUPS = "cups"
+
+
+def _executar_lpstat(argumentos):
+    import subprocess
+
+    ambiente = dict(os.environ, LC_ALL="C", LANG="C")
+    return subprocess.run(
+        ["lpstat", *argumentos], capture_output=True, text=True, env=ambiente, timeout=TIMEOUT_LPSTAT, check=True,
+    ).stdout
+
+
+def descobrir_filas_cups():
+    """
+    Lista as filas do CUPS.
+
+    :return: Lista com os nomes das filas (vazia se não houver nenhuma).
+    :raises OSError: Se o lpstat não estiver instalado.
+    :raises subprocess.SubprocessError: Se o lpstat falhar ou demorar demais.
+    """
+    import subprocess
+
+    try:
+        return [linha.split()[0] for linha in _executar_lpstat(["-e"]).splitlines() if linha.strip()]
+    except subprocess.CalledProcessError:
+        # CUPS antigo, sem -e: com LC_ALL=C as linhas são "printer NOME is idle..."
+        filas = []
+        for linha in _executar_lpstat(["-p"]).splitlines():
+            palavras = linha.split()
+            if len(palavras) > 1 and palavras[0] == "printer":
+                filas.append(palavras[1])
+        return filas
+
+
+class RegistroImpressoras:
+    """
+    Impressoras disponíveis, com cache por TTL e atualização em segundo plano.
+
+    :param ttl: Segundos até a lista ser considerada antiga.
+    :param caminho_configuracao: Arquivo de impressoras (padrão: o do transporte).
+    """
+
+    def __init__(self, ttl=TTL_SEGUNDOS, caminho_configuracao=None):
+        self.ttl = ttl
+        self.caminho_configuracao = caminho_configuracao
+        self.erro = None
+        self._impressoras = None
+        self._atualizado_em = 0.0
+        self._trava = threading.Lock()
+        self._atualizando = None
+
+    def _descobrir(self):
+        from scripts.utils.transporte import carregar_impressoras
+
+        impressoras = {}
+        erro = None
+        with metricas.etapa("descoberta_impressoras"):
+            try:
+                for nome in descobrir_filas_cups():
+                    impressoras[nome] = {"origem": ORIGEM_CUPS}
+            except Exception as e:
+                erro = f"Erro ao executar lpstat: {e}"
+            for nome, configuracao in carregar_impressoras(self.caminho_configuracao).items():
+                impressoras.setdefault(nome, {"origem": configuracao.get("backend", ORIGEM_CUPS)})
+        with self._trava:
+            self._impressoras = impressoras
+            self._atualizado_em = time.monotonic()
+            self.erro = erro
+            self._atualizando = None
+        return impressoras
+
+    def atualizar(self):
+        """Descobre as impressoras agora, esperando o resultado."""
+        return self._descobrir()
+
+    def atualizar_em_segundo_plano(self):
+        """Inicia a descoberta em uma thread, se nenhuma estiver em andamento."""
+        with self._trava:
+            if self._atualizando is not None:
+                return self._atualizando
+            self._atualizando = threading.Thread(target=self._descobrir, name="descoberta-impressoras", daemon=True)
+            self._atualizando.start()
+            return self._atualizando
+
+    def impressoras(self):
+        """
+        Dicionário {nome: {"origem": ...}} das impressoras conhecidas.
+
+        Na primeira consulta, espera a descoberta (ou a que já estiver em andamento);
+        depois, devolve o cache e, se ele passou do TTL, atualiza em segundo plano.
+        """
+        impressoras = self._impressoras
+        if impressoras is None:
+            thread = self._atualizando
+            if thread is not None:
+                thread.join()
+                impressoras = self._impressoras
+            if impressoras is None:
+                impressoras = self._descobrir()
+        elif time.monotonic() - self._atualizado_em > self.ttl:
+            self.atualizar_em_segundo_plano()
+        return impressoras
+
+    def nomes(self):
+        return list(self.impressoras())
+
+    def informacoes(self, nome):
+        """Origem da impressora ("cups", "raw"...) ou None se ela não for conhecida."""
+        return self.impressoras().get(nome)
+
+
+registro_impressoras = RegistroImpressoras()
+
 
 def listar_impressoras():
     """
     Lista impressoras disponíveis no sistema.
     Retorna uma lista de nomes de impressoras ou None se nenhuma for encontrada.
     """
-    print("[LOG] Listando impressoras disponíveis...\n")
-    try:
-        # Executa o comando lpstat para listar impressoras
-        resultado = subprocess.check_output("lpstat -p", shell=True, text=True)
-        impressoras = []
-        for linha in resultado.splitlines():
-            # Verifica se a linha começa com "impressora" (em português)
-            palavras = linha.split()
-            if len(palavras) > 1 and palavras[0].lower() == "impressora":
-                nome = palavras[1]  # O nome da impressora é a segunda palavra
-                impressoras.append(nome)
-        if impressoras:
-            print(f"[LOG] Impressoras detectadas: {impressoras}\n")
-            return impressoras
-        else:
-            print("[ERRO] Nenhuma impressora encontrada pelo comando lpstat.\n")
-            return None
-    except Exception as e:
-        print(f"[ERRO] Erro ao executar lpstat: {e}\n")
-        return None
+    impressoras = registro_impressoras.nomes()
+    if impressoras:
+        return impressoras
+    if registro_impressoras.erro:
+        print(f"[ERRO] {registro_impressoras.erro}\n")
+    print("[ERRO] Nenhuma impressora encontrada.\n")
+    return None
+
 
 def selecionar_impressora():
     """
@@ -49,4 +167,4 @@ def selecionar_impressora():
             return selecionar_impressora()
     except (ValueError, IndexError):
         print("[ERRO] Entrada inválida. Tente novamente.\n")
-        return selecionar_impressora()
\ No newline at end of file
+        return selecionar_impressora()
@@ -0,0 +1,238 @@
+"""
+Consulta de status da impressora (~HS) e controle de fluxo do envio.
+
+A resposta do ~HS tem três linhas, cada uma entre STX (0x02) e ETX (0x03):
+    1: aaa,b,c,dddd,eee,f,g,h,iii,j,k,l
+       b = sem papel, c = pausada, dddd = tamanho da etiqueta,
+       eee = formatos no buffer de recepção, f = buffer cheio
+    2: mmm,n,o,p,q,r,s,t,uuuuuuuu,v,www
+       o = cabeça aberta, p = sem ribbon, uuuuuuuu = etiquetas restantes no lote
+    3: xxxx,y
+
+O status fica em cache por um tempo curto (TTL) para não consultar a impressora
+a cada bloco enviado. A espera tem prazo (TIMEOUT_LIBERACAO, ajustável por
+ETIQUETAS_TIMEOUT_LIBERACAO): uma impressora que continua pausada ou sem papel
+depois dele faz o trabalho falhar em vez de segurar o envio indefinidamente.
+"""
+import asyncio
+import os
+import threading
+import time
+
+COMANDO_STATUS = b"~HS"
+STX = b"\x02"
+ETX = b"\x03"
+
+TTL_STATUS = 0.5
+TIMEOUT_STATUS = 2.0
+LIMITE_FORMATOS = 50
+INTERVALO_ESPERA = 0.25
+TIMEOUT_LIBERACAO = float(os.environ.get("ETIQUETAS_TIMEOUT_LIBERACAO", 300))
+
+
+class ErroStatus(Exception):
+    """Resposta de status ausente ou inválida."""
+
+
+class ImpressoraIndisponivel(ErroStatus):
+    """A impressora não ficou em condições de receber dentro do prazo de espera."""
+
+
+class StatusImpressora:
+    """Status da impressora interpretado a partir da resposta do ~HS."""
+
+    def __init__(self, sem_papel=False, pausada=False, tamanho_etiqueta=0, formatos_no_buffer=0,
+                 buffer_cheio=False, cabeca_aberta=False, sem_ribbon=False, etiquetas_restantes=0):
+        self.sem_papel = sem_papel
+        self.pausada = pausada
+        self.tamanho_etiqueta = tamanho_etiqueta
+        self.formatos_no_buffer = formatos_no_buffer
+        self.buffer_cheio = buffer_cheio
+        self.cabeca_aberta = cabeca_aberta
+        self.sem_ribbon = sem_ribbon
+        self.etiquetas_restantes = etiquetas_restantes
+        self.instante = time.monotonic()
+
+    @property
+    def pronta(self):
+        """A impressora está em condições de imprimir."""
+        return not (self.sem_papel or self.pausada or self.cabeca_aberta or self.sem_ribbon)
+
+    @property
+    def problemas(self):
+        nomes = (
+            ("sem_papel", "sem papel"), ("pausada", "pausada"),
+            ("cabeca_aberta", "cabeça aberta"), ("sem_ribbon", "sem ribbon"),
+        )
+        return [descricao for atributo, descricao in nomes if getattr(self, atributo)]
+
+    def resumo(self):
+        return {
+            "pronta": self.pronta,
+            "problemas": self.problemas,
+            "formatos_no_buffer": self.formatos_no_buffer,
+            "buffer_cheio": self.buffer_cheio,
+            "etiquetas_restantes": self.etiquetas_restantes,
+        }
+
+
+def resposta_completa(dados):
+    """Indica se os bytes já contêm as três linhas da resposta do ~HS."""
+    return dados.count(ETX) >= 3
+
+
+def interpretar_hs(resposta):
+    """
+    Interpreta a resposta do ~HS.
+
+    :param resposta: Bytes recebidos da impressora (as três linhas STX...ETX).
+    :return: StatusImpressora.
+    :raises ErroStatus: Se a resposta estiver incompleta ou malformada.
+    """
+    linhas = []
+    for trecho in resposta.split(STX)[1:]:
+        linhas.append(trecho.split(ETX)[0].decode("ascii", "replace").split(","))
+    if len(linhas) < 2 or len(linhas[0]) < 6 or len(linhas[1]) < 9:
+        raise ErroStatus(f"Resposta de status inválida: {resposta!r}")
+    try:
+        return StatusImpressora(
+            sem_papel=linhas[0][1] == "1",
+            pausada=linhas[0][2] == "1",
+            tamanho_etiqueta=int(linhas[0][3]),
+            formatos_no_buffer=int(linhas[0][4]),
+            buffer_cheio=linhas[0][5] == "1",
+            cabeca_aberta=linhas[1][2] == "1",
+            sem_ribbon=linhas[1][3] == "1",
+            etiquetas_restantes=int(linhas[1][8]),
+        )
+    except ValueError as e:
+        raise ErroStatus(f"Resposta de status inválida: {resposta!r}") from e
+
+
+def consultar(sock, timeout=TIMEOUT_STATUS):
+    """
+    Envia ~HS por um socket já conectado e lê a resposta.
+
+    :return: StatusImpressora.
+    :raises ErroStatus: Se a impressora não responder a tempo.
+    """
+    timeout_anterior = sock.gettimeout()
+    sock.settimeout(timeout)
+    try:
+        sock.sendall(COMANDO_STATUS)
+        dados = b""
+        while not resposta_completa(dados):
+            parte = sock.recv(1024)
+            if not parte:
+                raise ErroStatus("Conexão fechada durante a consulta de status.")
+            dados += parte
+    except OSError as e:
+        raise ErroStatus(f"Impressora não respondeu ao ~HS: {e}") from e
+    finally:
+        sock.settimeout(timeout_anterior)
+    return interpretar_hs(dados)
+
+
+async def consultar_async(leitor, escritor, timeout=TIMEOUT_STATUS):
+    """Versão assíncrona de `consultar`, para conexões abertas com asyncio.open_connection."""
+    try:
+        escritor.write(COMANDO_STATUS)
+        await escritor.drain()
+        dados = b""
+        while not resposta_completa(dados):
+            parte = await asyncio.wait_for(leitor.read(1024), timeout)
+            if not parte:
+                raise ErroStatus("Conexão fechada durante a consulta de status.")
+            dados += parte
+    except (OSError, asyncio.TimeoutError) as e:
+        raise ErroStatus(f"Impressora não respondeu ao ~HS: {e}") from e
+    return interpretar_hs(dados)
+
+
+class MonitorStatus:
+    """
+    Cache do último status de cada impressora e regras de controle de fluxo.
+
+    O envio segura o próximo bloco enquanto a impressora estiver com problema
+    (pausada, sem papel...) ou com `limite_formatos` ou mais formatos no buffer.
+    Abaixo do limite os blocos seguem normalmente, mantendo a impressora abastecida.
+
+    :param ttl: Tempo, em segundos, durante o qual um status consultado é reaproveitado.
+    :param limite_formatos: Quantidade de formatos no buffer a partir da qual o envio espera.
+    :param timeout_liberacao: Tempo máximo, em segundos, de espera pela liberação da impressora.
+    """
+
+    def __init__(self, ttl=TTL_STATUS, limite_formatos=LIMITE_FORMATOS, timeout_liberacao=TIMEOUT_LIBERACAO):
+        self.ttl = ttl
+        self.limite_formatos = limite_formatos
+        self.timeout_liberacao = timeout_liberacao
+        self._status = {}
+        self._trava = threading.Lock()
+
+    def ultimo(self, nome):
+        """Último status conhecido da impressora (pode estar vencido) ou None."""
+        with self._trava:
+            return self._status.get(nome)
+
+    def atual(self, nome):
+        """Status da impressora ainda dentro do TTL ou None."""
+        status = self.ultimo(nome)
+        if status is not None and time.monotonic() - status.instante < self.ttl:
+            return status
+        return None
+
+    def registrar(self, nome, status):
+        with self._trava:
+            self._status[nome] = status
+
+    def precisa_esperar(self, status):
+        return not status.pronta or status.buffer_cheio or status.formatos_no_buffer >= self.limite_formatos
+
+    def resumo(self):
+        with self._trava:
+            return {nome: status.resumo() for nome, status in self._status.items()}
+
+    def _pausa(self, nome, status, prazo, avisado):
+        """Segundos até a próxima consulta; levanta ImpressoraIndisponivel se o prazo acabou."""
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            motivo = ", ".join(status.problemas) or "buffer de recepção cheio"
+            raise ImpressoraIndisponivel(
+                f"Impressora '{nome}' continua indisponível após {self.timeout_liberacao:.0f} s ({motivo})."
+            )
+        if not status.pronta and not avisado:
+            print(f"[LOG] Impressora '{nome}' aguardando: {', '.join(status.problemas)}.\n")
+        return min(max(INTERVALO_ESPERA, self.ttl), restante)
+
+    def aguardar_liberacao(self, nome, sock):
+        """
+        Consulta o status (respeitando o TTL) e bloqueia enquanto o envio precisar esperar.
+
+        :raises ImpressoraIndisponivel: Se a espera passar de `timeout_liberacao`.
+        :raises ErroStatus: Se a impressora não responder ao ~HS.
+        """
+        prazo = time.monotonic() + self.timeout_liberacao
+        avisado = False
+        while True:
+            status = self.atual(nome)
+            if status is None:
+                status = consultar(sock)
+                self.registrar(nome, status)
+            if not self.precisa_esperar(status):
+                return status
+            time.sleep(self._pausa(nome, status, prazo, avisado))
+            avisado = avisado or not status.pronta
+
+    async def aguardar_liberacao_async(self, nome, leitor, escritor):
+        """Versão assíncrona de `aguardar_liberacao`."""
+        prazo = time.monotonic() + self.timeout_liberacao
+        avisado = False
+        while True:
+            status = self.atual(nome)
+            if status is None:
+                status = await consultar_async(leitor, escritor)
+                self.registrar(nome, status)
+            if not self.precisa_esperar(status):
+                return status
+            await asyncio.sleep(self._pausa(nome, status, prazo, avisado))
+            avisado = avisado or not status.pronta
@@ -0,0 +1,389 @@
+import json
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from scripts.utils import metricas
+from scripts.utils.status_impressora import ErroStatus, ImpressoraIndisponivel, MonitorStatus
+
+# Caminho para o arquivo de configuração das impressoras
+caminho_impressoras = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "config", "impressoras_config.json"
+)
+
+PORTA_PADRAO = 9100
+TIMEOUT_CONEXAO = 5.0
+TIMEOUT_ENVIO = 30.0
+TEMPO_OCIOSO_MAX = 60.0
+MAX_CONEXOES_POR_IMPRESSORA = 2
+
+BACKEND_RAW = "raw"
+BACKEND_CUPS = "cups"
+BACKEND_IPP = "ipp"
+
+
+class ErroTransporte(Exception):
+    """Falha ao enviar dados para a impressora."""
+
+
+class ErroConexao(ErroTransporte):
+    """Falha ao abrir a conexão; nenhum dado foi enviado."""
+
+
+def carregar_impressoras(caminho=None):
+    """
+    Carrega a configuração das impressoras.
+
+    Formato do arquivo (uma entrada por impressora):
+        {"Nome": {"backend": "raw", "host": "192.168.0.50", "porta": 9100, "fila_cups": "Nome"}}
+
+    Impressoras com backend "raw" são acessadas por socket (JetDirect/9100); se a
+    conexão falhar antes de qualquer byte ser enviado, a "fila_cups" (se houver) é usada.
+    Impressoras ausentes do arquivo são enviadas pelo CUPS usando o próprio nome como fila.
+    Impressoras com backend "ipp" são enviadas à "fila_cups" por IPP, numa conexão
+    persistente com o CUPS ("servidor": socket Unix ou host[:porta], opcional; ver
+    scripts.utils.ipp), sem executar o `lp` a cada trabalho.
+    A chave opcional "modelos" lista os modelos de etiqueta carregados na impressora
+    (usada pelo escalonador para escolher impressoras compatíveis).
+
+    :return: Dicionário com as impressoras configuradas (vazio se o arquivo não existir).
+    """
+    caminho = caminho or caminho_impressoras
+    if not os.path.exists(caminho):
+        return {}
+    try:
+        with open(caminho, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERRO] Erro ao carregar configuração de impressoras: {e}\n")
+        return {}
+
+
+def _como_blocos(dados):
+    """Aceita bytes, str ou um iterável de blocos (ver iter_zpl) e devolve um iterável de bytes."""
+    if isinstance(dados, (bytes, bytearray, memoryview)):
+        return (dados,)
+    if isinstance(dados, str):
+        return (dados.encode("utf-8"),)
+    return dados
+
+
+class ConexaoRaw:
+    """Conexão TCP crua (JetDirect/9100) com uma impressora."""
+
+    def __init__(self, host, porta=PORTA_PADRAO, timeout_conexao=TIMEOUT_CONEXAO, timeout_envio=TIMEOUT_ENVIO, nome=None):
+        self.host = host
+        self.nome = nome or host
+        self.porta = porta
+        self.timeout_conexao = timeout_conexao
+        self.timeout_envio = timeout_envio
+        self.sock = None
+        self.ultimo_uso = 0.0
+        self.reutilizada = False
+
+    def conectar(self):
+        with metricas.etapa("conexao", impressora=self.nome):
+            sock = socket.create_connection((self.host, self.porta), timeout=self.timeout_conexao)
+        metricas.incrementar("conexoes_abertas", impressora=self.nome)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Ajustes finos de keepalive disponíveis apenas em alguns sistemas (Linux/macOS)
+        for opcao, valor in (("TCP_KEEPIDLE", 30), ("TCP_KEEPALIVE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, opcao):
+                try:
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, opcao), valor)
+                except OSError:
+                    pass
+        sock.settimeout(self.timeout_envio)
+        self.sock = sock
+        self.ultimo_uso = time.monotonic()
+        self.reutilizada = False
+
+    def ativa(self):
+        """Verifica, sem bloquear, se a conexão continua aberta do lado da impressora."""
+        if self.sock is None:
+            return False
+        if time.monotonic() - self.ultimo_uso > TEMPO_OCIOSO_MAX:
+            return False
+        try:
+            while True:
+                legivel, _, _ = select.select([self.sock], [], [], 0)
+                if not legivel:
+                    return True
+                # Dados não solicitados (ex.: respostas de status) são descartados
+                if not self.sock.recv(4096, socket.MSG_DONTWAIT):
+                    return False
+        except (OSError, ValueError):
+            return False
+
+    def enviar(self, dados, antes_do_bloco=None):
+        """
+        Envia os dados pela conexão.
+
+        :param dados: bytes, str ou iterável de blocos em bytes.
+        :param antes_do_bloco: Função chamada antes de cada bloco (ex.: controle de fluxo).
+        :return: Número de bytes enviados.
+        """
+        total = 0
+        for bloco in _como_blocos(dados):
+            if antes_do_bloco is not None:
+                antes_do_bloco()
+            if metricas.ativo:
+                inicio = time.perf_counter_ns()
+                self.sock.sendall(bloco)
+                metricas.registrar_tempo("envio_bloco", time.perf_counter_ns() - inicio, impressora=self.nome)
+            else:
+                self.sock.sendall(bloco)
+            total += len(bloco)
+        self.ultimo_uso = time.monotonic()
+        metricas.incrementar("bytes_enviados", total, impressora=self.nome)
+        return total
+
+    def fechar(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class PoolConexoes:
+    """
+    Mantém conexões cruas de longa duração com cada impressora configurada.
+
+    As conexões ociosas são reaproveitadas entre trabalhos; conexões fechadas
+    pela impressora são detectadas antes do uso e reabertas automaticamente.
+
+    Com um MonitorStatus, o envio consulta o ~HS pela própria conexão e segura os
+    blocos enquanto a impressora estiver pausada, com problema ou com o buffer cheio.
+    Impressoras que não respondem ao ~HS (ou com "controle_fluxo": false na
+    configuração) são enviadas sem controle de fluxo.
+    """
+
+    def __init__(self, impressoras=None, max_conexoes=MAX_CONEXOES_POR_IMPRESSORA,
+                 timeout_conexao=TIMEOUT_CONEXAO, timeout_envio=TIMEOUT_ENVIO, monitor=None):
+        self.impressoras = impressoras if impressoras is not None else carregar_impressoras()
+        self.max_conexoes = max_conexoes
+        self.timeout_conexao = timeout_conexao
+        self.timeout_envio = timeout_envio
+        self.monitor = monitor
+        self._sem_status = set()
+        self._ociosas = {}
+        self._limites = {}
+        self._trava = threading.Lock()
+
+    def _limite(self, nome):
+        with self._trava:
+            if nome not in self._limites:
+                self._limites[nome] = threading.BoundedSemaphore(self.max_conexoes)
+            return self._limites[nome]
+
+    def _obter(self, nome):
+        config = self.impressoras[nome]
+        while True:
+            with self._trava:
+                ociosas = self._ociosas.setdefault(nome, [])
+                conexao = ociosas.pop() if ociosas else None
+            if conexao is None:
+                break
+            if conexao.ativa():
+                conexao.reutilizada = True
+                return conexao
+            conexao.fechar()
+
+        conexao = ConexaoRaw(
+            config["host"], config.get("porta", PORTA_PADRAO), self.timeout_conexao, self.timeout_envio, nome
+        )
+        conexao.conectar()
+        return conexao
+
+    def _devolver(self, nome, conexao):
+        with self._trava:
+            self._ociosas.setdefault(nome, []).append(conexao)
+
+    @contextmanager
+    def conexao(self, nome):
+        """Empresta uma conexão ativa com a impressora; ela volta ao pool ao final se não houver erro."""
+        limite = self._limite(nome)
+        if not limite.acquire(timeout=self.timeout_envio):
+            raise ErroConexao(f"Tempo esgotado aguardando conexão livre com '{nome}'.")
+        try:
+            try:
+                conexao = self._obter(nome)
+            except OSError as e:
+                raise ErroConexao(f"Não foi possível conectar a '{nome}': {e}") from e
+            try:
+                yield conexao
+            except BaseException:
+                conexao.fechar()
+                raise
+            self._devolver(nome, conexao)
+        finally:
+            limite.release()
+
+    def enviar(self, nome, dados):
+        """
+        Envia os dados para a impressora por uma conexão do pool.
+
+        :return: Número de bytes enviados.
+        :raises ErroTransporte: Se a conexão não puder ser aberta ou cair durante o envio.
+        """
+        blocos = iter(_como_blocos(dados))
+        with self.conexao(nome) as conexao:
+            # O primeiro bloco só é lido com a conexão aberta: se ela falhar, o gerador
+            # continua intacto para o envio pelo CUPS
+            primeiro = next(blocos, b"")
+            controle = self._controle_fluxo(nome, conexao)
+            try:
+                try:
+                    conexao.enviar(primeiro, controle)
+                except (BrokenPipeError, ConnectionResetError):
+                    if not conexao.reutilizada:
+                        raise
+                    # A impressora fechou a conexão ociosa: reconecta e reenvia o primeiro bloco
+                    conexao.fechar()
+                    conexao.conectar()
+                    conexao.enviar(primeiro, controle)
+                return len(primeiro) + conexao.enviar(blocos, controle)
+            except (OSError, ImpressoraIndisponivel) as e:
+                metricas.incrementar("erros_envio", impressora=nome)
+                raise ErroTransporte(f"Falha ao enviar para '{nome}': {e}") from e
+
+    def _controle_fluxo(self, nome, conexao):
+        """Retorna a função que segura cada bloco conforme o status da impressora, ou None."""
+        if self.monitor is None or nome in self._sem_status:
+            return None
+        if not self.impressoras[nome].get("controle_fluxo", True):
+            return None
+
+        def aguardar():
+            if nome in self._sem_status:
+                return
+            try:
+                self.monitor.aguardar_liberacao(nome, conexao.sock)
+            except ImpressoraIndisponivel:
+                raise
+            except ErroStatus as e:
+                print(f"[LOG] {e} Enviando para '{nome}' sem controle de fluxo.\n")
+                self._sem_status.add(nome)
+
+        return aguardar
+
+    def fechar(self):
+        with self._trava:
+            for ociosas in self._ociosas.values():
+                for conexao in ociosas:
+                    conexao.fechar()
+            self._ociosas.clear()
+
+
+def _fechar_entrada(processo):
+    try:
+        processo.stdin.close()
+    except BrokenPipeError:
+        pass
+
+
+def enviar_cups(fila, dados):
+    """
+    Envia os dados para uma fila do CUPS com `lp -o raw`, sem arquivo temporário.
+
+    :return: Número de bytes enviados.
+    :raises ErroTransporte: Se o lp falhar.
+    """
+    total = 0
+    inicio = time.perf_counter_ns()
+    try:
+        processo = subprocess.Popen(["lp", "-d", fila, "-o", "raw"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    except OSError as e:
+        raise ErroTransporte(f"Não foi possível executar o lp: {e}") from e
+    try:
+        for bloco in _como_blocos(dados):
+            processo.stdin.write(bloco)
+            total += len(bloco)
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        # Fechar o stdin normalmente faria o lp imprimir o trabalho pela metade
+        processo.kill()
+        _fechar_entrada(processo)
+        processo.wait()
+        metricas.incrementar("erros_envio", impressora=fila)
+        raise
+    _fechar_entrada(processo)
+    if processo.wait() != 0:
+        metricas.incrementar("erros_envio", impressora=fila)
+        raise ErroTransporte(f"O lp terminou com código {processo.returncode} para a fila '{fila}'.")
+    metricas.registrar_tempo("envio_cups", time.perf_counter_ns() - inicio, impressora=fila)
+    metricas.incrementar("bytes_enviados", total, impressora=fila)
+    return total
+
+
+_pool = None
+_trava_pool = threading.Lock()
+
+
+def obter_pool():
+    """Retorna o pool de conexões compartilhado pelo processo."""
+    global _pool
+    with _trava_pool:
+        if _pool is None:
+            _pool = PoolConexoes(monitor=MonitorStatus())
+        return _pool
+
+
+def entrega_por_bloco(impressora, pool=None):
+    """
+    Indica se o backend da impressora entrega cada bloco assim que o seguinte é pedido.
+
+    Só a conexão crua faz isso. No CUPS e no IPP o trabalho só passa a existir quando
+    o envio termina (e o IPP ainda junta os blocos em pedaços antes de enviá-los), então
+    um envio interrompido não imprime nada.
+    """
+    pool = pool or obter_pool()
+    config = pool.impressoras.get(impressora)
+    return config is not None and config.get("backend", BACKEND_RAW) == BACKEND_RAW
+
+
+def enviar(impressora, dados, pool=None, antes_do_cups=None):
+    """
+    Envia o ZPL para a impressora pelo backend configurado.
+
+    Impressoras "raw" usam o pool de conexões persistentes. Se a conexão não puder
+    ser aberta e houver "fila_cups" configurada, o envio é feito pelo CUPS.
+    Impressoras "ipp" são enviadas ao CUPS por IPP (ver scripts.utils.ipp).
+
+    :param impressora: Nome da impressora (chave do impressoras_config.json ou fila do CUPS).
+    :param dados: bytes, str ou iterável de blocos em bytes (ex.: iter_zpl).
+    :param antes_do_cups: Função chamada quando uma impressora crua passa a ser enviada
+        pelo CUPS, antes de qualquer bloco ser lido.
+    :return: Número de bytes enviados.
+    :raises ErroTransporte: Se o envio falhar.
+    """
+    pool = pool or obter_pool()
+    config = pool.impressoras.get(impressora)
+    if config is None:
+        return enviar_cups(impressora, dados)
+    backend = config.get("backend", BACKEND_RAW)
+    if backend == BACKEND_CUPS:
+        return enviar_cups(config.get("fila_cups", impressora), dados)
+    if backend == BACKEND_IPP:
+        from scripts.utils import ipp
+
+        return ipp.obter_cliente(config.get("servidor")).enviar(config.get("fila_cups", impressora), dados)
+
+    try:
+        return pool.enviar(impressora, dados)
+    except ErroConexao as e:
+        # Só é seguro usar o CUPS quando nada foi enviado pela conexão crua
+        if not config.get("fila_cups"):
+            raise
+        print(f"[LOG] {e} Usando a fila do CUPS '{config['fila_cups']}'.\n")
+        if antes_do_cups:
+            antes_do_cups()
+        return enviar_cups(config["fila_cups"], dados)
@@ -0,0 +1,59 @@
+import os
+import stat
+
+import pytest
+
+
+@pytest.fixture
+def lp_falso(tmp_path, monkeypatch):
+    """
+    Coloca no PATH um `lp` que guarda cada trabalho recebido em `trabalhos/`.
+
+    O código de saída vem do arquivo `codigo` (0 se não existir), lido depois de
+    consumir toda a entrada, como o lp quando o CUPS recusa o trabalho.
+
+    :return: Diretório do lp falso.
+    """
+    diretorio = tmp_path / "lp"
+    (diretorio / "trabalhos").mkdir(parents=True)
+    lp = diretorio / "lp"
+    lp.write_text(
+        "#!/bin/sh\n"
+        f'cd "{diretorio}"\n'
+        'echo "$@" > argumentos\n'
+        "cat > trabalhos/$$\n"
+        "exit $(cat codigo 2>/dev/null || echo 0)\n"
+    )
+    lp.chmod(lp.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{diretorio}{os.pathsep}{os.environ['PATH']}")
+    return diretorio
+
+
+@pytest.fixture
+def lpstat_falso(tmp_path, monkeypatch):
+    """
+    Coloca no PATH um `lpstat` que lista as filas do arquivo `filas`, uma por linha.
+
+    Cada chamada acrescenta os argumentos a `chamadas`. Se o arquivo `sem_e` existir,
+    `lpstat -e` falha como em um CUPS antigo e só `lpstat -p` funciona.
+
+    :return: Diretório do lpstat falso.
+    """
+    diretorio = tmp_path / "lpstat"
+    diretorio.mkdir()
+    (diretorio / "filas").write_text("")
+    lpstat = diretorio / "lpstat"
+    lpstat.write_text(
+        "#!/bin/sh\n"
+        f'cd "{diretorio}"\n'
+        'echo "$@" >> chamadas\n'
+        'if [ "$1" = "-e" ]; then\n'
+        "    [ -e sem_e ] && exit 1\n"
+        "    cat filas\n"
+        "else\n"
+        '    while read -r fila; do echo "printer $fila is idle.  enabled since Jan 1 00:00"; done < filas\n'
+        "fi\n"
+    )
+    lpstat.chmod(lpstat.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{diretorio}{os.pathsep}{os.environ['PATH']}")
+    return diretorio
@@ -0,0 +1,65 @@
+import pytest
+
+from scripts.core import cache_planilhas
+
+
+def test_normalizar_cabecalho_como_o_pandas():
+    assert cache_planilhas.normalizar_cabecalho(["nome", None, "nome", "", "nome", 3]) == [
+        "nome", "Unnamed: 1", "nome.1", "Unnamed: 3", "nome.2", "3",
+    ]
+
+
+@pytest.fixture
+def planilha(tmp_path, monkeypatch):
+    pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    openpyxl = pytest.importorskip("openpyxl")
+    monkeypatch.setattr(cache_planilhas, "diretorio_cache", str(tmp_path / "cache"))
+
+    livro = openpyxl.Workbook()
+    aba = livro.active
+    aba.append(["codigo", "nome", "preco"])
+    aba.append(["1", "caneta", "2,50"])
+    aba.append([None, None, None])
+    aba.append(["2", "lapis", None])
+    aba.append([None, None, "9,99"])
+    aba.append(["3", "borracha", "1,00"])
+    caminho = tmp_path / "produtos.xlsx"
+    livro.save(caminho)
+    return str(caminho)
+
+
+def test_cache_igual_a_leitura_direta(planilha, monkeypatch):
+    import pandas as pd
+
+    from scripts.core import loader
+
+    primeira = loader.carregar_arquivo(planilha, ["nome", "codigo"])
+    assert cache_planilhas.indices_em_cache(planilha) == [0, 1]
+
+    def sem_excel(*args, **kwargs):
+        raise AssertionError("a planilha não deveria ser lida de novo")
+
+    monkeypatch.setattr(pd, "read_excel", sem_excel)
+    segunda = loader.carregar_arquivo(planilha, ["nome", "codigo"])
+    assert list(segunda.columns) == list(primeira.columns) == ["nome", "codigo"]
+    assert segunda.values.tolist() == primeira.values.tolist() == [["caneta", "1"], ["lapis", "2"], ["borracha", "3"]]
+    # O caminho em lotes (também pelo cache) numera as etiquetas do mesmo jeito
+    assert list(loader.iter_etiquetas(planilha, [1, 0], " | ")) == ["caneta | 1", "lapis | 2", "borracha | 3"]
+
+
+def test_coluna_nova_amplia_o_cache(planilha):
+    from scripts.core import loader
+
+    loader.carregar_arquivo(planilha, ["codigo"])
+    df = loader.carregar_arquivo(planilha, ["preco"])
+    assert df.iloc[:, 0].tolist() == ["2,50", "9,99", "1,00"]
+    assert cache_planilhas.indices_em_cache(planilha) == [0, 2]
+    assert cache_planilhas.colunas(planilha) == ["codigo", "nome", "preco"]
+
+
+def test_sem_cache_le_em_lotes_pelo_openpyxl(planilha):
+    from scripts.core import loader
+
+    assert cache_planilhas.indices_em_cache(planilha) == []
+    assert list(loader.iter_etiquetas(planilha, [0, 2], " | ")) == ["1 | 2,50", "2 | ", " | 9,99", "3 | 1,00"]
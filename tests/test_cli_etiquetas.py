@@ -0,0 +1,71 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from scripts.features import cli_etiquetas
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _executar(monkeypatch, tmp_path, argumentos, entrada=None):
+    if entrada is not None:
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(entrada.encode("utf-8"))))
+    saida = tmp_path / "saida.zpl"
+    codigo = cli_etiquetas.main(["--modelo", "Etiqueta_33x22mm", "--saida", str(saida), *argumentos])
+    return codigo, saida.read_bytes() if saida.exists() else b""
+
+
+def _campos(zpl):
+    return [campo.split(b"^FS")[0].decode() for campo in zpl.split(b"^FD")[1:]]
+
+
+def test_stdin_jsonl_com_colunas(monkeypatch, tmp_path):
+    registros = [{"sku": "A1", "nome": "caneta"}, "texto livre", {"sku": "B2", "nome": "lapis"}]
+    entrada = "".join(json.dumps(registro) + "\n" for registro in registros)
+    codigo, zpl = _executar(monkeypatch, tmp_path, ["--stdin", "jsonl", "--colunas", "nome,sku"], entrada)
+    assert codigo == 0
+    assert _campos(zpl) == ["caneta | A1", "texto livre", "lapis | B2"]
+
+
+def test_intervalo_na_entrada_padrao(monkeypatch, tmp_path):
+    entrada = "codigo,nome\n" + "".join(f"{i},item {i}\n" for i in range(1, 11))
+    codigo, zpl = _executar(monkeypatch, tmp_path, ["--stdin", "csv", "--colunas", "1", "--intervalo", "3-5"], entrada)
+    assert codigo == 0
+    assert _campos(zpl) == ["item 3", "item 4", "item 5"]
+
+
+def test_intervalo_nas_etiquetas(monkeypatch, tmp_path):
+    argumentos = [arg for i in range(1, 6) for arg in ("--etiqueta", f"E{i}")]
+    codigo, zpl = _executar(monkeypatch, tmp_path, [*argumentos, "--intervalo", "2-3"])
+    assert codigo == 0
+    assert _campos(zpl) == ["E2", "E3"]
+
+
+def test_intervalo_invalido(monkeypatch, tmp_path):
+    with pytest.raises(SystemExit):
+        _executar(monkeypatch, tmp_path, ["--etiqueta", "A", "--intervalo", "5-2"])
+
+
+def test_modelo_desconhecido(monkeypatch, tmp_path):
+    codigo = cli_etiquetas.main(["--modelo", "NaoExiste", "--etiqueta", "A", "--saida", str(tmp_path / "x")])
+    assert codigo == 2
+
+
+def test_pipe_fechado_pelo_consumidor(tmp_path):
+    entrada = tmp_path / "entrada.jsonl"
+    entrada.write_text("".join(json.dumps(f"etiqueta {i}") + "\n" for i in range(50000)))
+    with open(entrada, "rb") as arquivo:
+        processo = subprocess.Popen(
+            [sys.executable, os.path.join(RAIZ, "run.py"), "--modelo", "Etiqueta_33x22mm", "--stdin", "jsonl"],
+            cwd=str(tmp_path), stdin=arquivo, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    # Como `| head`: lê o começo e fecha a saída
+    assert processo.stdout.read(100).startswith(b"^XA")
+    processo.stdout.close()
+    erros = processo.stderr.read()
+    assert processo.wait(timeout=30) == 0
+    assert b"Traceback" not in erros and b"Exception ignored" not in erros
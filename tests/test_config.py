@@ -0,0 +1,157 @@
+import json
+import os
+
+import pytest
+
+from scripts.core.config import ConfiguracaoModelos, ErroConfiguracao, ObservadorModelos, RegistroModelos
+
+MODELOS = {
+    "Etiqueta_33x22mm": {
+        "largura": 224,
+        "altura": 176,
+        "espaco": 23,
+        "colunas": 3,
+        "largura_total": 850,
+        "posicoes_horizontais": [33, 320, 610],
+    },
+    "Etiqueta_4x6_in": {
+        "largura": 576,
+        "altura": 864,
+        "espaco": 10,
+        "colunas": 1,
+        "largura_total": 576,
+        "posicoes_horizontais": [0],
+    },
+    "Grande": {
+        "largura": 504,
+        "altura": 360,
+        "colunas": 1,
+        "largura_total": 504,
+        "posicoes_horizontais": [33],
+        "largura_mm": 70,
+        "altura_mm": 50,
+    },
+}
+
+
+def _gravar(caminho, conteudo, mtime_ns):
+    caminho.write_text(conteudo if isinstance(conteudo, str) else json.dumps(conteudo))
+    os.utime(caminho, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def arquivo(tmp_path):
+    caminho = tmp_path / "etiquetas_config.json"
+    _gravar(caminho, MODELOS, 1_000_000_000)
+    return caminho
+
+
+def test_busca_pelo_nome_e_pelo_tamanho(arquivo):
+    configuracao = ConfiguracaoModelos(arquivo, instantaneos=None)
+
+    assert configuracao.modelo("Etiqueta_33x22mm")["colunas"] == 3
+    assert configuracao.modelo("inexistente") is None
+    assert configuracao.por_tamanho(33.2, 22)[0] == "Etiqueta_33x22mm"
+    assert configuracao.por_tamanho(4, 6, unidade="in")[0] == "Etiqueta_4x6_in"
+    assert configuracao.buscar("70x50mm")[0] == "Grande"
+    assert configuracao.por_tamanho(40, 40) is None
+
+
+def test_arquivo_lido_uma_vez_enquanto_nao_muda(arquivo, monkeypatch):
+    configuracao = ConfiguracaoModelos(arquivo, instantaneos=None)
+    leituras = []
+    ler_json = configuracao._ler_json
+    monkeypatch.setattr(configuracao, "_ler_json", lambda assinatura: leituras.append(assinatura) or ler_json(assinatura))
+
+    primeiro = configuracao.registro()
+    assert configuracao.registro() is primeiro
+    assert len(leituras) == 1
+
+
+def test_instantaneo_evita_ler_o_json(arquivo, tmp_path, monkeypatch):
+    instantaneos = tmp_path / "cache"
+    ConfiguracaoModelos(arquivo, instantaneos=str(instantaneos)).registro()
+    assert len(list(instantaneos.iterdir())) == 1
+
+    segunda = ConfiguracaoModelos(arquivo, instantaneos=str(instantaneos))
+    monkeypatch.setattr(segunda, "_ler_json", lambda assinatura: pytest.fail("o JSON não deveria ser lido"))
+    assert segunda.nomes() == list(MODELOS)
+    assert segunda.buscar("4x6in")[0] == "Etiqueta_4x6_in"
+
+
+def test_instantaneo_ignorado_quando_o_arquivo_muda(arquivo, tmp_path):
+    instantaneos = str(tmp_path / "cache")
+    ConfiguracaoModelos(arquivo, instantaneos=instantaneos).registro()
+
+    _gravar(arquivo, {"Etiqueta_33x22mm": MODELOS["Etiqueta_33x22mm"]}, 2_000_000_000)
+
+    assert ConfiguracaoModelos(arquivo, instantaneos=instantaneos).nomes() == ["Etiqueta_33x22mm"]
+
+
+def test_arquivo_ausente(tmp_path):
+    with pytest.raises(ErroConfiguracao, match="não encontrado"):
+        ConfiguracaoModelos(tmp_path / "nao_existe.json", instantaneos=None).registro()
+
+
+def test_registro_imutavel(arquivo):
+    registro = ConfiguracaoModelos(arquivo, instantaneos=None).registro()
+
+    assert isinstance(registro, RegistroModelos)
+    with pytest.raises(AttributeError):
+        registro.versao = 2
+    with pytest.raises(TypeError):
+        registro.modelos["Novo"] = {}
+
+
+def test_recarga_troca_o_registro_quando_o_arquivo_muda(arquivo):
+    configuracao = ConfiguracaoModelos(arquivo, instantaneos=None)
+    observador = ObservadorModelos(configuracao)
+    anterior = observador.registro
+    assert not observador.verificar()
+
+    modelos = dict(MODELOS, Nova_50x30mm=dict(MODELOS["Etiqueta_33x22mm"], colunas=2))
+    _gravar(arquivo, modelos, 2_000_000_000)
+
+    assert observador.verificar()
+    assert observador.registro.versao == anterior.versao + 1
+    assert observador.registro.buscar("50x30mm")[0] == "Nova_50x30mm"
+    # Quem guardou a referência antiga continua com a versão que pegou
+    assert anterior.modelo("Nova_50x30mm") is None
+
+
+@pytest.mark.parametrize("conteudo", [
+    "{ inválido",
+    {"Etiqueta_33x22mm": dict(MODELOS["Etiqueta_33x22mm"], largura=True)},
+    {"Etiqueta_33x22mm": dict(MODELOS["Etiqueta_33x22mm"], posicoes_horizontais=[33])},
+])
+def test_versao_invalida_mantem_a_anterior(arquivo, conteudo, capsys):
+    configuracao = ConfiguracaoModelos(arquivo, instantaneos=None)
+    anterior = configuracao.registro()
+
+    _gravar(arquivo, conteudo, 2_000_000_000)
+
+    assert not configuracao.revalidar()
+    assert configuracao.registro() is anterior
+    assert capsys.readouterr().err.count("[ERRO]") == 1
+
+
+def test_inicializacao_com_arquivo_invalido_usa_o_ultimo_instantaneo(arquivo, tmp_path, capsys):
+    instantaneos = str(tmp_path / "cache")
+    ConfiguracaoModelos(arquivo, instantaneos=instantaneos).registro()
+
+    _gravar(arquivo, "{ inválido", 2_000_000_000)
+
+    configuracao = ConfiguracaoModelos(arquivo, instantaneos=instantaneos)
+    assert configuracao.nomes() == list(MODELOS)
+    assert "última versão válida" in capsys.readouterr().err
+
+    # A correção do arquivo é carregada na próxima consulta
+    _gravar(arquivo, {"Grande": MODELOS["Grande"]}, 3_000_000_000)
+    assert configuracao.nomes() == ["Grande"]
+
+
+def test_inicializacao_com_arquivo_invalido_sem_instantaneo(arquivo):
+    _gravar(arquivo, "{ inválido", 2_000_000_000)
+
+    with pytest.raises(ErroConfiguracao, match="JSON inválido"):
+        ConfiguracaoModelos(arquivo, instantaneos=None).registro()
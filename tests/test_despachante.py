@@ -0,0 +1,112 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+from scripts.utils.despachante import Despachante, imprimir_em_paralelo
+from scripts.utils.mock_impressora import ImpressoraMock
+
+
+def _etiquetas(quantidade, texto="teste"):
+    return [b"^XA^FO10,10^FD%s %d^FS^XZ\n" % (texto.encode(), i) for i in range(quantidade)]
+
+
+def _aguardar_etiquetas(impressora, quantidade, timeout=5):
+    limite = time.monotonic() + timeout
+    while impressora.estatisticas.etiquetas < quantidade and time.monotonic() < limite:
+        time.sleep(0.01)
+    return impressora.estatisticas.etiquetas
+
+
+def test_impressoras_em_paralelo():
+    with ImpressoraMock() as primeira, ImpressoraMock() as segunda:
+        impressoras = {
+            "p1": {"backend": "raw", "host": primeira.host, "porta": primeira.porta},
+            "p2": {"backend": "raw", "host": segunda.host, "porta": segunda.porta},
+        }
+        resumo = imprimir_em_paralelo([("p1", _etiquetas(300)), ("p2", _etiquetas(200))], impressoras,
+                                      ao_progredir=None)
+        assert _aguardar_etiquetas(primeira, 300) == 300
+        assert _aguardar_etiquetas(segunda, 200) == 200
+    assert resumo["p1"]["etiquetas_enviadas"] == 300
+    assert resumo["p2"]["etiquetas_enviadas"] == 200
+    assert resumo["p1"]["trabalhos_concluidos"] == 1
+
+
+def test_gerador_lido_fora_do_laco():
+    threads = set()
+
+    def blocos():
+        for bloco in _etiquetas(10):
+            threads.add(threading.current_thread())
+            yield bloco
+
+    async def executar(impressoras):
+        despachante = Despachante(impressoras, monitor=None)
+        trabalho = await despachante.submeter("p", blocos())
+        await trabalho.concluido.wait()
+        await despachante.fechar()
+        return trabalho
+
+    with ImpressoraMock() as impressora:
+        trabalho = asyncio.run(executar({"p": {"backend": "raw", "host": impressora.host, "porta": impressora.porta}}))
+    assert trabalho.erro is None
+    assert trabalho.etiquetas_enviadas == 10
+    assert threading.main_thread() not in threads
+
+
+def test_queda_no_meio_do_bloco_falha_o_trabalho():
+    servidor = socket.socket()
+    servidor.bind(("127.0.0.1", 0))
+    servidor.listen()
+    conexoes = []
+
+    def derrubar():
+        # Lê um pouco do primeiro bloco e derruba a conexão (RST)
+        while True:
+            try:
+                conexao, _ = servidor.accept()
+            except OSError:
+                return
+            conexoes.append(conexao)
+            conexao.recv(1024)
+            conexao.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            conexao.close()
+
+    threading.Thread(target=derrubar, daemon=True).start()
+
+    async def executar():
+        despachante = Despachante({"p": {"backend": "raw", "host": "127.0.0.1", "porta": servidor.getsockname()[1]}},
+                                  monitor=None)
+        bloco = b"^XA^FO10,10^FD" + b"x" * (32 * 1024 * 1024) + b"^FS^XZ\n"
+        trabalho = await despachante.submeter("p", [bloco, _etiquetas(1)[0]])
+        await trabalho.concluido.wait()
+        await despachante.fechar()
+        return trabalho, despachante.progresso["p"]
+
+    try:
+        trabalho, progresso = asyncio.run(executar())
+    finally:
+        servidor.close()
+    assert trabalho.erro is not None
+    assert trabalho.etiqueta_falha == 1
+    # O bloco não é reenviado por outra conexão
+    assert len(conexoes) == 1
+    assert progresso.etiquetas_pendentes == 0
+
+
+def test_lp_com_erro_descarta_o_trabalho_inteiro(lp_falso):
+    (lp_falso / "codigo").write_text("1")
+
+    async def executar():
+        despachante = Despachante({"p": {"backend": "cups", "fila_cups": "Zebra"}}, monitor=None)
+        trabalho = await despachante.submeter("p", _etiquetas(20))
+        await trabalho.concluido.wait()
+        await despachante.fechar()
+        return trabalho
+
+    trabalho = asyncio.run(executar())
+    assert trabalho.erro is not None
+    # O lp recebeu tudo, mas o CUPS não criou o trabalho: nada foi impresso
+    assert trabalho.etiqueta_falha == 1
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from scripts.core.zpl_generator import SessaoFormatos, iter_zpl_formato
+from scripts.utils.despachante import Despachante
+from scripts.utils.escalonador import distribuir, fatiar, impressoras_compativeis
+from scripts.utils.mock_impressora import ImpressoraMock
+
+MODELO = {
+    "largura": 224,
+    "altura": 176,
+    "espaco": 23,
+    "colunas": 3,
+    "largura_total": 850,
+    "posicoes_horizontais": [33, 320, 610],
+}
+
+
+def _etiquetas(quantidade):
+    return [b"^XA^FO10,10^FD%d^FS^XZ\n" % i for i in range(quantidade)]
+
+
+def _distribuir(blocos, config, impressoras=None, despachante=None, etiquetas_por_fatia=10):
+    async def executar():
+        nonlocal despachante
+        despachante = despachante or Despachante(config, monitor=None)
+        fatias = await distribuir(blocos, impressoras or list(config), despachante, etiquetas_por_fatia)
+        await despachante.fechar()
+        return fatias
+
+    return asyncio.run(executar())
+
+
+def _aguardar_etiquetas(impressora, quantidade, timeout=5):
+    limite = time.monotonic() + timeout
+    while impressora.estatisticas.etiquetas < quantidade and time.monotonic() < limite:
+        time.sleep(0.01)
+    return impressora.estatisticas.etiquetas
+
+
+def test_compativeis():
+    impressoras = {"a": {"modelos": ["X"]}, "b": {}, "c": {"modelos": ["Y"]}}
+    assert impressoras_compativeis(impressoras, "X") == ["a", "b"]
+
+
+def test_fatias_contiguas_e_preambulo():
+    preambulo = []
+    blocos = iter_zpl_formato([str(i) for i in range(30)], MODELO, sessao=SessaoFormatos())
+    fatias = list(fatiar(blocos, etiquetas_por_fatia=12, preambulo=preambulo))
+    assert len(preambulo) == 1 and b"^DF" in preambulo[0]
+    assert [(fatia.etiqueta_inicial, fatia.etiqueta_final) for fatia in fatias] == [(1, 12), (13, 24), (25, 30)]
+
+
+def test_distribui_entre_impressoras():
+    with ImpressoraMock() as primeira, ImpressoraMock() as segunda:
+        config = {
+            "p1": {"backend": "raw", "host": primeira.host, "porta": primeira.porta},
+            "p2": {"backend": "raw", "host": segunda.host, "porta": segunda.porta},
+        }
+        fatias = _distribuir(_etiquetas(100), config)
+        esperadas = {nome: sum(f.etiquetas for f in fatias if f.impressora == nome) for nome in config}
+        assert _aguardar_etiquetas(primeira, esperadas["p1"]) == esperadas["p1"]
+        assert _aguardar_etiquetas(segunda, esperadas["p2"]) == esperadas["p2"]
+    assert sum(esperadas.values()) == 100
+    assert all(esperadas.values())
+    assert [fatia.resumo()["erro"] for fatia in fatias] == [None] * len(fatias)
+
+
+def test_falha_fica_na_fatia(lp_falso):
+    (lp_falso / "codigo").write_text("1")
+    fatias = _distribuir(_etiquetas(30), {"p": {"backend": "cups", "fila_cups": "Zebra"}})
+    assert [(fatia.impressora, fatia.etiqueta_falha) for fatia in fatias] == [("p", 1), ("p", 11), ("p", 21)]
+    assert all(fatia.resumo()["erro"] for fatia in fatias)
+
+
+def test_alimentador_encerrado_nao_trava_a_distribuicao(lp_falso):
+    class DespachanteComDefeito(Despachante):
+        async def submeter(self, impressora, blocos):
+            if impressora == "quebrada":
+                raise RuntimeError("defeito")
+            return await super().submeter(impressora, blocos)
+
+    config = {"quebrada": {"backend": "cups"}, "boa": {"backend": "cups"}}
+
+    async def executar():
+        despachante = DespachanteComDefeito(config, monitor=None)
+        fatias = await asyncio.wait_for(distribuir(_etiquetas(100), list(config), despachante, 5), 10)
+        await despachante.fechar()
+        return fatias
+
+    fatias = asyncio.run(executar())
+    quebradas = [fatia for fatia in fatias if fatia.erro is not None]
+    assert len(quebradas) == 1 and quebradas[0].impressora == "quebrada"
+    assert all(fatia.impressora == "boa" for fatia in fatias if fatia.erro is None)
+    assert sum(fatia.etiquetas for fatia in fatias if fatia.erro is None) == 95
+
+
+def test_sem_impressoras():
+    with pytest.raises(ValueError):
+        _distribuir(_etiquetas(1), {})
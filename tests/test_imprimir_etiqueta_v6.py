@@ -0,0 +1,47 @@
+import pytest
+
+from scripts.features import imprimir_etiqueta_v6
+
+
+class FonteLista:
+    """Fonte com a mesma interface de loader.FonteEtiquetas, sobre uma lista."""
+
+    def __init__(self, etiquetas, inicio=0, fim=None):
+        self.etiquetas = etiquetas
+        self.inicio = inicio
+        self.fim = fim
+
+    def __iter__(self):
+        return iter(self.etiquetas[self.inicio:self.fim])
+
+    def recortar(self, inicio, fim=None):
+        return FonteLista(self.etiquetas, self.inicio + inicio, None if fim is None else self.inicio + fim)
+
+
+def _responder(monkeypatch, *respostas):
+    respostas = iter(respostas)
+    monkeypatch.setattr("builtins.input", lambda *_: next(respostas))
+
+
+def test_selecao_por_intervalo(monkeypatch):
+    _responder(monkeypatch, "2-3")
+    selecao = imprimir_etiqueta_v6.selecionar_etiquetas_arquivo(FonteLista(["A", "B", "C", "D"]))
+    assert list(selecao) == ["B", "C"]
+
+
+def test_selecao_por_numeros_e_nova_tentativa(monkeypatch):
+    _responder(monkeypatch, "3-1", "4,1")
+    selecao = imprimir_etiqueta_v6.selecionar_etiquetas_arquivo(FonteLista(["A", "B", "C", "D"]))
+    assert selecao == ["D", "A"]
+
+
+def test_intervalo_em_arquivo(monkeypatch, tmp_path):
+    pytest.importorskip("pandas")
+    from scripts.core.loader import FonteEtiquetas
+
+    caminho = tmp_path / "dados.csv"
+    caminho.write_text("nome,codigo\n" + "".join(f"item {i},{i}\n" for i in range(1, 6)))
+    _responder(monkeypatch, "2-4")
+    selecao = imprimir_etiqueta_v6.selecionar_etiquetas_arquivo(FonteEtiquetas(str(caminho), [0, 1], " | "))
+    assert list(selecao) == ["item 2 | 2", "item 3 | 3", "item 4 | 4"]
+    assert list(selecao.recortar(1)) == ["item 3 | 3", "item 4 | 4"]
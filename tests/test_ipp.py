@@ -0,0 +1,73 @@
+import pytest
+
+from scripts.utils.ipp import ClienteIPP, ErroIPP
+from scripts.utils.mock_ipp import ServidorIPPMock
+
+ETIQUETA = b"^XA^FO10,10^FDteste^FS^XZ"
+
+
+@pytest.fixture
+def servidor():
+    with ServidorIPPMock(guardar_documentos=True) as mock:
+        yield mock
+
+
+def test_gerador_com_erro_nao_cria_trabalho(servidor):
+    cliente = ClienteIPP(servidor.servidor, timeout=5)
+
+    def blocos():
+        # Passa de um pedaço do corpo antes de falhar, para o erro chegar no meio do envio
+        for _ in range(5000):
+            yield ETIQUETA
+        raise RuntimeError("falha ao gerar")
+
+    with pytest.raises(RuntimeError):
+        cliente.enviar("Zebra", blocos())
+
+    cliente.enviar("Zebra", [ETIQUETA])
+    cliente.fechar()
+    assert [trabalho["etiquetas"] for trabalho in servidor.estatisticas.trabalhos] == [1]
+
+
+def test_trabalhos_na_mesma_conexao(servidor):
+    cliente = ClienteIPP(servidor.servidor, timeout=5)
+    blocos = [b"^XA^FO10,10^FD%d^FS^XZ\n" % i for i in range(1000)]
+
+    assert cliente.enviar("Zebra", iter(blocos), nome_trabalho="lote 1") == len(b"".join(blocos))
+    cliente.enviar("Zebra", [ETIQUETA], nome_trabalho="lote 2")
+    cliente.fechar()
+
+    primeiro, segundo = servidor.estatisticas.trabalhos
+    assert primeiro["documento"] == b"".join(blocos)
+    assert (primeiro["fila"], primeiro["nome"], primeiro["etiquetas"]) == ("Zebra", "lote 1", 1000)
+    assert segundo["documento"] == ETIQUETA
+    assert cliente.ultimo_trabalho == 2
+    assert servidor.estatisticas.conexoes == 1
+
+
+def test_reconecta_depois_de_reinicio_do_servidor(servidor):
+    cliente = ClienteIPP(servidor.servidor, timeout=5)
+    cliente.enviar("Zebra", [ETIQUETA])
+    servidor.parar()
+    servidor.iniciar()
+    cliente.enviar("Zebra", [ETIQUETA])
+    cliente.fechar()
+    assert servidor.estatisticas.conexoes == 2
+    assert len(servidor.estatisticas.trabalhos) == 2
+
+
+def test_socket_unix(tmp_path):
+    with ServidorIPPMock(caminho_socket=str(tmp_path / "cups.sock"), guardar_documentos=True) as mock:
+        cliente = ClienteIPP(mock.servidor, timeout=5)
+        cliente.enviar("Zebra", ETIQUETA)
+        cliente.fechar()
+    assert [trabalho["documento"] for trabalho in mock.estatisticas.trabalhos] == [ETIQUETA]
+
+
+def test_fila_desconhecida():
+    with ServidorIPPMock(filas=["Zebra"]) as mock:
+        cliente = ClienteIPP(mock.servidor, timeout=5)
+        with pytest.raises(ErroIPP):
+            cliente.enviar("Outra", [ETIQUETA])
+        cliente.fechar()
+    assert mock.estatisticas.trabalhos == []
@@ -0,0 +1,41 @@
+import pytest
+
+from scripts.utils import metricas
+
+
+@pytest.fixture
+def coleta():
+    ativo = metricas.ativo
+    metricas.limpar()
+    metricas.ativo = True
+    yield metricas
+    metricas.limpar()
+    metricas.ativo = ativo
+
+
+def test_prometheus_escapa_valores_de_rotulos(coleta):
+    nome = 'Zebra "A"\\sala\n2'
+    coleta.incrementar("envios", 3, impressora=nome)
+    coleta.registrar_tempo("envio", 2_000_000, impressora=nome)
+
+    texto = coleta.exportar_prometheus()
+
+    rotulo = 'impressora="Zebra \\"A\\"\\\\sala\\n2"'
+    assert f"etiquetas_envios_total{{{rotulo}}} 3" in texto.splitlines()
+    assert f'etiquetas_envio_segundos_bucket{{{rotulo},le="+Inf"}} 1' in texto.splitlines()
+    assert f"etiquetas_envio_segundos_count{{{rotulo}}} 1" in texto.splitlines()
+    # Cada amostra continua em uma única linha
+    assert all(linha.startswith(("#", "etiquetas_")) for linha in texto.splitlines())
+
+
+def test_resumo_mantem_valores_sem_escape(coleta):
+    coleta.incrementar("envios", impressora='Zebra "A"')
+
+    assert coleta.resumo()["contadores"] == {'envios{impressora=Zebra "A"}': 1}
+
+
+def test_desativado_nao_coleta(coleta):
+    coleta.desativar()
+    coleta.incrementar("envios")
+
+    assert coleta.exportar_prometheus() == "\n"
@@ -0,0 +1,66 @@
+import json
+
+from scripts.utils.printer import RegistroImpressoras, descobrir_filas_cups
+
+
+def _chamadas(lpstat_falso):
+    caminho = lpstat_falso / "chamadas"
+    return caminho.read_text().splitlines() if caminho.exists() else []
+
+
+def test_descobrir_filas_cups(lpstat_falso):
+    (lpstat_falso / "filas").write_text("Zebra_1\nDatamax\n")
+
+    assert descobrir_filas_cups() == ["Zebra_1", "Datamax"]
+
+
+def test_descobrir_filas_cups_sem_opcao_e(lpstat_falso):
+    (lpstat_falso / "filas").write_text("Zebra_1\nDatamax\n")
+    (lpstat_falso / "sem_e").touch()
+
+    assert descobrir_filas_cups() == ["Zebra_1", "Datamax"]
+    assert _chamadas(lpstat_falso) == ["-e", "-p"]
+
+
+def test_registro_junta_cups_e_configuracao(lpstat_falso, tmp_path):
+    (lpstat_falso / "filas").write_text("Zebra_1\n")
+    configuracao = tmp_path / "impressoras_config.json"
+    configuracao.write_text(json.dumps({"Rede": {"backend": "raw", "host": "127.0.0.1", "porta": 9100}}))
+
+    registro = RegistroImpressoras(caminho_configuracao=str(configuracao))
+
+    assert registro.impressoras() == {"Zebra_1": {"origem": "cups"}, "Rede": {"origem": "raw"}}
+    assert registro.informacoes("Rede") == {"origem": "raw"}
+    assert registro.informacoes("Outra") is None
+
+
+def test_registro_usa_o_cache_dentro_do_ttl(lpstat_falso, tmp_path):
+    (lpstat_falso / "filas").write_text("Zebra_1\n")
+    registro = RegistroImpressoras(ttl=60, caminho_configuracao=str(tmp_path / "nao_existe.json"))
+
+    assert registro.nomes() == ["Zebra_1"]
+    (lpstat_falso / "filas").write_text("Zebra_1\nZebra_2\n")
+    assert registro.nomes() == ["Zebra_1"]
+    assert _chamadas(lpstat_falso) == ["-e"]
+
+
+def test_registro_vencido_atualiza_em_segundo_plano(lpstat_falso, tmp_path):
+    (lpstat_falso / "filas").write_text("Zebra_1\n")
+    registro = RegistroImpressoras(ttl=0, caminho_configuracao=str(tmp_path / "nao_existe.json"))
+    assert registro.nomes() == ["Zebra_1"]
+
+    (lpstat_falso / "filas").write_text("Zebra_1\nZebra_2\n")
+    # A lista antiga é devolvida na hora; a nova chega pela thread de atualização
+    assert registro.nomes() == ["Zebra_1"]
+    thread = registro._atualizando
+    if thread is not None:
+        thread.join(5)
+    assert "Zebra_2" in registro.nomes()
+
+
+def test_registro_sem_lpstat_informa_o_erro(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    registro = RegistroImpressoras(caminho_configuracao=str(tmp_path / "nao_existe.json"))
+
+    assert registro.nomes() == []
+    assert registro.erro.startswith("Erro ao executar lpstat")
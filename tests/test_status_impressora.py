@@ -0,0 +1,77 @@
+import socket
+
+import pytest
+
+from scripts.utils.mock_impressora import ImpressoraMock
+from scripts.utils.status_impressora import (
+    ErroStatus,
+    ImpressoraIndisponivel,
+    MonitorStatus,
+    consultar,
+    interpretar_hs,
+    resposta_completa,
+)
+
+
+def _resposta(linha1, linha2, linha3="1234,0"):
+    return b"".join(b"\x02" + linha.encode("ascii") + b"\x03\r\n" for linha in (linha1, linha2, linha3))
+
+
+def test_interpretar_hs_le_os_campos():
+    status = interpretar_hs(_resposta("030,1,0,0176,012,1,0,0,000,0,0,0", "001,0,1,1,0,2,4,0,00000037,1,000"))
+
+    assert status.sem_papel and not status.pausada
+    assert status.tamanho_etiqueta == 176
+    assert status.formatos_no_buffer == 12
+    assert status.buffer_cheio
+    assert status.cabeca_aberta and status.sem_ribbon
+    assert status.etiquetas_restantes == 37
+    assert not status.pronta
+    assert status.problemas == ["sem papel", "cabeça aberta", "sem ribbon"]
+
+
+def test_interpretar_hs_impressora_pronta():
+    status = interpretar_hs(_resposta("030,0,0,0176,000,0,0,0,000,0,0,0", "001,0,0,0,0,2,4,0,00000000,1,000"))
+
+    assert status.pronta
+    assert status.problemas == []
+    assert not MonitorStatus().precisa_esperar(status)
+
+
+@pytest.mark.parametrize("resposta", [
+    b"",
+    b"\x02030,0,0,0176,000,0,0,0,000,0,0,0\x03\r\n",
+    _resposta("030,0,0", "001,0,0,0,0,2,4,0,00000000,1,000"),
+    _resposta("030,0,0,abcd,000,0,0,0,000,0,0,0", "001,0,0,0,0,2,4,0,00000000,1,000"),
+])
+def test_interpretar_hs_resposta_invalida(resposta):
+    with pytest.raises(ErroStatus):
+        interpretar_hs(resposta)
+
+
+def test_resposta_completa_espera_as_tres_linhas():
+    resposta = _resposta("030,0,0,0176,000,0,0,0,000,0,0,0", "001,0,0,0,0,2,4,0,00000000,1,000")
+
+    assert resposta_completa(resposta)
+    assert not resposta_completa(resposta[:-5])
+
+
+def test_consultar_mock():
+    with ImpressoraMock() as mock:
+        mock.pausada = True
+        with socket.create_connection((mock.host, mock.porta)) as sock:
+            status = consultar(sock)
+
+    assert status.pausada
+    assert status.problemas == ["pausada"]
+
+
+def test_aguardar_liberacao_tem_prazo():
+    monitor = MonitorStatus(ttl=0.05, timeout_liberacao=0.2)
+    with ImpressoraMock() as mock:
+        mock.sem_papel = True
+        with socket.create_connection((mock.host, mock.porta)) as sock:
+            with pytest.raises(ImpressoraIndisponivel, match="sem papel"):
+                monitor.aguardar_liberacao("zebra", sock)
+
+    assert monitor.ultimo("zebra").sem_papel
@@ -0,0 +1,108 @@
+import socket
+
+from scripts.core.trabalhos import ESTADO_CONCLUIDO, ESTADO_INTERROMPIDO, Trabalho, imprimir_trabalho
+from scripts.core.zpl_generator import contar_etiquetas, iter_zpl
+from scripts.utils import transporte
+from scripts.utils.mock_ipp import ServidorIPPMock
+from scripts.utils.transporte import PoolConexoes
+
+MODELO = {
+    "largura": 224,
+    "altura": 176,
+    "espaco": 23,
+    "colunas": 3,
+    "largura_total": 850,
+    "posicoes_horizontais": [33, 320, 610],
+}
+
+ETIQUETAS = [f"Etiqueta {i}" for i in range(1, 31)]
+
+
+class EnvioComFalha:
+    """Recebe os blocos como a impressora e falha ao chegar no bloco número `falhar_no_bloco`."""
+
+    def __init__(self, falhar_no_bloco=None):
+        self.falhar_no_bloco = falhar_no_bloco
+        self.recebidos = []
+
+    def __call__(self, impressora, blocos):
+        for numero, bloco in enumerate(blocos, start=1):
+            if numero == self.falhar_no_bloco:
+                raise ConnectionResetError("conexão perdida")
+            self.recebidos.append(bloco)
+        return sum(len(bloco) for bloco in self.recebidos)
+
+
+def _etiquetas_recebidas(blocos):
+    return [campo.split(b"^FS")[0].decode() for bloco in blocos for campo in bloco.split(b"^FD")[1:]]
+
+
+def test_retomada_envia_cada_etiqueta_uma_vez(tmp_path):
+    trabalho = Trabalho.criar(iter_zpl(ETIQUETAS, MODELO), "Zebra", diretorio_base=str(tmp_path))
+
+    primeiro = EnvioComFalha(falhar_no_bloco=4)
+    assert not imprimir_trabalho(trabalho, enviar=primeiro)
+    assert trabalho.dados["estado"] == ESTADO_INTERROMPIDO
+    # O restante foi gravado mesmo sem ser enviado
+    assert trabalho.gravacao_completa
+    assert trabalho.dados["total_etiquetas"] == len(ETIQUETAS)
+    assert trabalho.ultima_enviada == 9
+
+    reaberto = Trabalho.abrir(trabalho.id, diretorio_base=str(tmp_path))
+    segundo = EnvioComFalha()
+    assert imprimir_trabalho(reaberto, enviar=segundo)
+    assert reaberto.dados["estado"] == ESTADO_CONCLUIDO
+    assert reaberto.ultima_enviada == len(ETIQUETAS)
+
+    assert _etiquetas_recebidas(primeiro.recebidos + segundo.recebidos) == ETIQUETAS
+
+
+def test_retomada_dentro_de_bloco_com_pq(tmp_path):
+    # 3 cópias agrupadas de cada etiqueta: um bloco ^PQ3 por etiqueta
+    trabalho = Trabalho.criar(iter_zpl(["A", "B"], MODELO, 9, "agrupado"), "Zebra", diretorio_base=str(tmp_path))
+    trabalho.gravar()
+
+    enviados = EnvioComFalha()
+    assert imprimir_trabalho(trabalho, a_partir_de=14, enviar=enviados)
+    # A etiqueta 14 está na segunda das três linhas do bloco de "B" (etiquetas 10 a 18)
+    assert b"^PQ2" in enviados.recebidos[0]
+    assert sum(contar_etiquetas(bloco) for bloco in enviados.recebidos) == 6
+
+
+def test_cups_so_confirma_o_trabalho_inteiro(tmp_path, lp_falso, monkeypatch):
+    # A impressora é enviada pelo CUPS porque a conexão crua não abre
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        porta = sock.getsockname()[1]
+    monkeypatch.setattr(transporte, "_pool", PoolConexoes(
+        {"Zebra": {"backend": "raw", "host": "127.0.0.1", "porta": porta, "fila_cups": "Zebra"}}, timeout_conexao=1,
+    ))
+    trabalho = Trabalho.criar(iter_zpl(ETIQUETAS, MODELO), "Zebra", diretorio_base=str(tmp_path))
+
+    # O lp lê o trabalho inteiro e termina com erro: nada foi impresso
+    (lp_falso / "codigo").write_text("1")
+    assert not imprimir_trabalho(trabalho)
+    assert trabalho.ultima_enviada == 0
+
+    (lp_falso / "codigo").write_text("0")
+    assert imprimir_trabalho(Trabalho.abrir(trabalho.id, diretorio_base=str(tmp_path)))
+    assert trabalho.ultima_enviada == len(ETIQUETAS)
+    trabalhos = sorted((lp_falso / "trabalhos").iterdir(), key=lambda arquivo: arquivo.stat().st_mtime_ns)
+    assert _etiquetas_recebidas([trabalhos[-1].read_bytes()]) == ETIQUETAS
+
+
+def test_ipp_so_confirma_o_trabalho_inteiro(tmp_path, monkeypatch):
+    with ServidorIPPMock(filas=["Outra"], guardar_documentos=True) as servidor:
+        monkeypatch.setattr(transporte, "_pool", PoolConexoes(
+            {"Zebra_IPP": {"backend": "ipp", "servidor": servidor.servidor, "fila_cups": "Zebra"}},
+        ))
+        trabalho = Trabalho.criar(iter_zpl(ETIQUETAS, MODELO), "Zebra_IPP", diretorio_base=str(tmp_path))
+
+        # O CUPS recusa o trabalho depois de receber o documento inteiro
+        assert not imprimir_trabalho(trabalho)
+        assert trabalho.ultima_enviada == 0
+
+        servidor.filas = None
+        assert imprimir_trabalho(Trabalho.abrir(trabalho.id, diretorio_base=str(tmp_path)))
+    assert trabalho.ultima_enviada == len(ETIQUETAS)
+    assert [_etiquetas_recebidas([t["documento"]]) for t in servidor.estatisticas.trabalhos] == [ETIQUETAS]
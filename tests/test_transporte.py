@@ -0,0 +1,72 @@
+import socket
+import time
+
+import pytest
+
+from scripts.utils import transporte
+from scripts.utils.mock_impressora import ImpressoraMock
+from scripts.utils.transporte import PoolConexoes
+
+ETIQUETA = b"^XA^FO10,10^FDteste^FS^XZ\n"
+
+
+@pytest.fixture
+def impressora():
+    with ImpressoraMock() as mock:
+        yield mock
+
+
+def _porta_fechada():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _aguardar_etiquetas(impressora, quantidade, timeout=5):
+    """O emulador lê e imprime em segundo plano: espera as etiquetas chegarem."""
+    limite = time.monotonic() + timeout
+    while impressora.estatisticas.etiquetas < quantidade and time.monotonic() < limite:
+        time.sleep(0.01)
+    return impressora.aguardar_ociosa(timeout=timeout)
+
+
+def test_pool_reaproveita_conexao(impressora):
+    pool = PoolConexoes({"p": {"backend": "raw", "host": impressora.host, "porta": impressora.porta}})
+    try:
+        pool.enviar("p", [ETIQUETA] * 10)
+        pool.enviar("p", [ETIQUETA] * 5)
+    finally:
+        pool.fechar()
+    assert _aguardar_etiquetas(impressora, 15)
+    assert impressora.estatisticas.conexoes == 1
+    assert impressora.estatisticas.etiquetas == 15
+
+
+def test_pool_reabre_conexao_ociosa_vencida(impressora, monkeypatch):
+    pool = PoolConexoes({"p": {"backend": "raw", "host": impressora.host, "porta": impressora.porta}})
+    try:
+        pool.enviar("p", [ETIQUETA] * 10)
+        # A conexão ociosa passou do tempo em que a impressora a mantém aberta
+        monkeypatch.setattr(transporte, "TEMPO_OCIOSO_MAX", -1)
+        pool.enviar("p", [ETIQUETA] * 5)
+    finally:
+        pool.fechar()
+    assert _aguardar_etiquetas(impressora, 15)
+    assert impressora.estatisticas.conexoes == 2
+    assert impressora.estatisticas.etiquetas == 15
+
+
+def test_cups_quando_conexao_crua_falha(lp_falso):
+    pool = PoolConexoes({"p": {"backend": "raw", "host": "127.0.0.1", "porta": _porta_fechada(),
+                               "fila_cups": "Zebra_CUPS"}}, timeout_conexao=1)
+    blocos = (ETIQUETA for _ in range(100))
+    assert transporte.enviar("p", blocos, pool=pool) == len(ETIQUETA) * 100
+    assert [trabalho.read_bytes() for trabalho in (lp_falso / "trabalhos").iterdir()] == [ETIQUETA * 100]
+    assert (lp_falso / "argumentos").read_text().split() == ["-d", "Zebra_CUPS", "-o", "raw"]
+
+
+def test_sem_fila_cups_erro_de_conexao_e_repassado():
+    pool = PoolConexoes({"p": {"backend": "raw", "host": "127.0.0.1", "porta": _porta_fechada()}},
+                        timeout_conexao=1)
+    with pytest.raises(transporte.ErroConexao):
+        transporte.enviar("p", [ETIQUETA], pool=pool)
@@ -0,0 +1,55 @@
+from scripts.core.zpl_generator import (
+    COPIAS_AGRUPADAS, SessaoFormatos, contar_etiquetas, gerar_zpl, iter_zpl, iter_zpl_formato, nome_formato,
+)
+
+MODELO = {
+    "largura": 224,
+    "altura": 176,
+    "espaco": 23,
+    "colunas": 3,
+    "largura_total": 850,
+    "posicoes_horizontais": [33, 320, 610],
+}
+
+ETIQUETAS = [f"Produto {i}\nLote {i:04d}" for i in range(1, 11)] + ["Preço único ÁÉ"]
+
+
+def test_iter_zpl_igual_a_gerar_zpl():
+    for copias in (1, 3):
+        for modo in ("intercalado", COPIAS_AGRUPADAS):
+            blocos = list(iter_zpl(ETIQUETAS, MODELO, copias, modo))
+            assert b"".join(blocos).decode("utf-8") == gerar_zpl(ETIQUETAS, MODELO, copias, modo)
+            assert all(bloco.startswith(b"^XA") and bloco.rstrip().endswith(b"^XZ") for bloco in blocos)
+
+
+def test_copias_agrupadas_viram_pq():
+    blocos = list(iter_zpl(["A", "B"], MODELO, copias=6, modo_copias=COPIAS_AGRUPADAS))
+    # 6 cópias em 3 colunas: duas linhas iguais de cada etiqueta, um bloco com ^PQ2 por etiqueta
+    assert len(blocos) == 2
+    assert all(b"^PQ2\n" in bloco for bloco in blocos)
+    assert sum(contar_etiquetas(bloco) for bloco in blocos) == 12
+
+
+def test_linhas_diferentes_nao_sao_juntadas():
+    blocos = list(iter_zpl(["A", "B", "C", "D", "E", "F"], MODELO, copias=1))
+    assert len(blocos) == 2
+    assert all(b"^PQ" not in bloco for bloco in blocos)
+    assert [contar_etiquetas(bloco) for bloco in blocos] == [3, 3]
+
+
+def test_nome_formato_cabe_no_limite_do_zpl():
+    nome, extensao = nome_formato(MODELO).split(".")
+    assert 1 <= len(nome) <= 8
+    assert extensao == "ZPL"
+    assert nome_formato(dict(MODELO, altura=200)) != nome_formato(MODELO)
+
+
+def test_formato_armazenado_usa_o_nome_curto():
+    sessao = SessaoFormatos()
+    blocos = list(iter_zpl_formato(["A", "B", "C"], MODELO, sessao=sessao))
+    nome = nome_formato(MODELO)
+    assert b"^DFR:%s^FS" % nome.encode() in blocos[0]
+    assert b"^XFR:%s^FS" % nome.encode() in blocos[1]
+    assert sessao.contem(nome)
+    # Com o formato já na impressora, só os dados são enviados
+    assert len(list(iter_zpl_formato(["A", "B", "C"], MODELO, sessao=sessao))) == 1